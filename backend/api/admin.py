@@ -1,39 +1,202 @@
+import os
+
 from django.contrib import admin
-from .models import ContactSubmission, Workshop, WorkshopRegistration
+from . import cache, jobs, stats, thumbnails
+from .search import IndexedSearchMixin
+from .models import ContactSubmission, ExportJob, Workshop, WorkshopRegistration
 from django.utils.html import format_html
 from django.conf import settings
+from django.http import FileResponse, Http404
+from django.shortcuts import get_object_or_404
 from django.contrib import messages
-from django.urls import path
+from django.urls import path, reverse
 from django.template.response import TemplateResponse
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.core.exceptions import ValidationError
+from django.core.paginator import Paginator
+from django.forms.models import BaseInlineFormSet
+
+
+def _enqueue_export(model_admin, request, kind, **selection):
+	if kind.startswith('xlsx'):
+		try:
+			import openpyxl  # noqa: F401
+		except Exception:
+			model_admin.message_user(request, "openpyxl not installed. Run: backend/.venv/Scripts/pip install openpyxl", level=messages.ERROR)
+			return
+	if kind == 'sheets':
+		try:
+			import gspread  # type: ignore  # noqa: F401
+		except Exception:
+			model_admin.message_user(request, "gspread/google-auth not installed. Run: backend/.venv/Scripts/pip install gspread google-auth", level=messages.ERROR)
+			return
+		if not getattr(settings, 'GOOGLE_SHEETS_CREDENTIALS_FILE', None) or not getattr(settings, 'GOOGLE_SHEETS_SPREADSHEET_ID', None):
+			model_admin.message_user(request, "Google Sheets credentials or Spreadsheet ID not configured in settings.", level=messages.ERROR)
+			return
+	job = jobs.enqueue(kind, requested_by=request.user, **selection)
+	url = reverse('admin:api_exportjob_change', args=[job.pk])
+	model_admin.message_user(request, format_html('Queued <a href="{}">{}</a>. It will be ready for download on the job page.', url, job))
+
+
+def _proof_preview(obj, max_height):
+	if obj.payment_proof:
+		return format_html(
+			'<a href="{}" target="_blank"><img src="{}" loading="lazy" style="max-height:{}px;" /></a>',
+			obj.payment_proof.url, thumbnails.thumbnail_url(obj.payment_proof, 'small'), max_height,
+		)
+	return ""
+
+
+def dashboard_view(request, admin_site=admin.site):
+	context = dict(
+		admin_site.each_context(request),
+		title="Workshops Dashboard",
+		**stats.dashboard_stats(),
+	)
+	return TemplateResponse(request, 'admin/dashboard.html', context)
 
 
 @admin.register(ContactSubmission)
-class ContactSubmissionAdmin(admin.ModelAdmin):
+class ContactSubmissionAdmin(IndexedSearchMixin, admin.ModelAdmin):
+	search_index = 'contact'
 	list_display = ("name", "email", "service", "created_at")
 	search_fields = ("name", "email", "service")
 	list_filter = ("service", "created_at")
 
 
+class PaginatedInlineFormSet(BaseInlineFormSet):
+	"""Inline formset that only builds forms for one page of related rows.
+
+	The page and an optional status filter come from the query string, which
+	the change form posts back to, so a save only carries the rows that were
+	on screen (matched by their posted ids, not by re-running the page query).
+	"""
+	request = None
+	per_page = 25
+	page_param = 'registrations_page'
+	status_param = 'registrations_status'
+
+	def _filtered_queryset(self):
+		qs = self.queryset
+		status = self.request.GET.get(self.status_param) if self.request else None
+		if status in dict(self.model._meta.get_field('status').choices):
+			qs = qs.filter(status=status)
+		return qs.order_by('-created_at', '-pk')
+
+	def _posted_ids(self):
+		pk_name = self.model._meta.pk.name
+		to_python = self._get_to_python(self.model._meta.pk)
+		ids = []
+		for i in range(self.initial_form_count()):
+			try:
+				ids.append(to_python(self.data[f'{self.add_prefix(i)}-{pk_name}']))
+			except (KeyError, ValidationError):
+				continue
+		return ids
+
+	def get_queryset(self):
+		if not hasattr(self, '_page_rows'):
+			if self.is_bound:
+				ids = self._posted_ids()
+				rows = {obj.pk: obj for obj in self.queryset.filter(pk__in=ids)}
+				self._page_rows = [rows[pk] for pk in ids if pk in rows]
+				self.page = None
+			else:
+				paginator = Paginator(self._filtered_queryset(), self.per_page)
+				self.page = paginator.get_page(self.request.GET.get(self.page_param) if self.request else None)
+				self._page_rows = list(self.page.object_list)
+			for obj in self._page_rows:
+				# Rows render their __str__, which would otherwise fetch the workshop each.
+				setattr(obj, self.fk.name, self.instance)
+		return self._page_rows
+
+	def _url(self, **params):
+		query = self.request.GET.copy()
+		for key, value in params.items():
+			query.pop(key, None)
+			if value:
+				query[key] = value
+		return f'?{query.urlencode()}' if query else '?'
+
+	def status_links(self):
+		current = self.request.GET.get(self.status_param, '')
+		choices = [('', "All")] + list(self.model._meta.get_field('status').choices)
+		return [
+			(label, self._url(**{self.status_param: value, self.page_param: None}), value == current)
+			for value, label in choices
+		]
+
+	def page_links(self):
+		self.get_queryset()
+		if self.page is None or self.page.paginator.num_pages < 2:
+			return []
+		return [
+			(number, self._url(**{self.page_param: str(number)}), number == self.page.number)
+			for number in self.page.paginator.get_elided_page_range(self.page.number)
+		]
+
+
 class WorkshopRegistrationInline(admin.TabularInline):
 	model = WorkshopRegistration
+	formset = PaginatedInlineFormSet
+	template = 'admin/api/workshopregistration/paginated_inline.html'
 	extra = 0
-	readonly_fields = ("created_at", "proof_preview")
-	fields = ("name", "email", "whatsapp", "organization", "payment_proof", "proof_preview", "status", "admin_notes", "created_at")
+	show_change_link = True
+	# Only triage fields are editable here, so each row posts a handful of
+	# inputs; full edits and new registrations go through the registration admin.
+	readonly_fields = ("name", "email", "whatsapp", "organization", "proof_preview", "created_at")
+	fields = ("name", "email", "whatsapp", "organization", "proof_preview", "status", "admin_notes", "created_at")
+
+	def has_add_permission(self, request, obj=None):
+		return False
+
+	def get_formset(self, request, obj=None, **kwargs):
+		formset = super().get_formset(request, obj, **kwargs)
+		formset.request = request
+		return formset
 
 	def proof_preview(self, obj):
-		if obj.payment_proof:
-			return format_html('<img src="{}" style="max-height:100px;" />', obj.payment_proof.url)
-		return ""
+		return _proof_preview(obj, 100)
+
+
+def _status_count(status):
+	counts = (
+		WorkshopRegistration.objects
+		.filter(workshop=OuterRef('pk'), status=status)
+		.order_by().values('workshop').annotate(n=Count('pk')).values('n')
+	)
+	return Coalesce(Subquery(counts), 0)
 
 
 @admin.register(Workshop)
 class WorkshopAdmin(admin.ModelAdmin):
-	list_display = ("title", "status", "date", "venue", "capacity", "registrations_count")
+	list_display = ("title", "status", "date", "venue", "capacity", "registrations_total", "verified_count", "pending_count")
 	search_fields = ("title", "venue")
 	list_filter = ("status", "date", "venue")
 	fields = ("title", "status", "description", "date", "start_time", "end_time", "venue", "perks", "capacity", "image", "payment_qr", "upi_id", "bank_name", "account_no", "amount")
 	inlines = [WorkshopRegistrationInline]
-	actions = ("export_workshop_registrations_csv", "export_workshop_registrations_xlsx", "export_workshop_registrations_to_google_sheets")
+	actions = ("export_workshop_registrations_csv", "export_workshop_registrations_xlsx", "export_workshop_registrations_xlsx_by_workshop", "export_workshop_registrations_to_google_sheets")
+
+	def get_queryset(self, request):
+		# Correlated counts served by reg_workshop_status_idx: one query per
+		# changelist page, and the changelist COUNT(*) can drop them.
+		return super().get_queryset(request).annotate(
+			verified_count=_status_count('verified'),
+			pending_count=_status_count('pending'),
+		)
+
+	@admin.display(description="Registrations", ordering="seats_taken")
+	def registrations_total(self, obj):
+		return obj.seats_taken
+
+	@admin.display(description="Verified", ordering="verified_count")
+	def verified_count(self, obj):
+		return obj.verified_count
+
+	@admin.display(description="Pending", ordering="pending_count")
+	def pending_count(self, obj):
+		return obj.pending_count
 
 	def get_urls(self):
 		urls = super().get_urls()
@@ -43,237 +206,105 @@ class WorkshopAdmin(admin.ModelAdmin):
 		return custom + urls
 
 	def dashboard_view(self, request):
-		from django.db.models import Count
-		stats = {
-			"workshops_total": Workshop.objects.count(),
-			"registrations_total": WorkshopRegistration.objects.count(),
-			"registrations_verified": WorkshopRegistration.objects.filter(status='verified').count(),
-			"registrations_pending": WorkshopRegistration.objects.filter(status='pending').count(),
-		}
-		by_workshop = (
-			Workshop.objects
-			.annotate(reg_count=Count('registrations'))
-			.values('id','title','status','date','reg_count')
-			.order_by('-date')[:20]
-		)
-		context = dict(
-			self.admin_site.each_context(request),
-			title="Workshops Dashboard",
-			stats=stats,
-			by_workshop=list(by_workshop),
-		)
-		return TemplateResponse(request, 'admin/dashboard.html', context)
-
-	def _serialize_workshop_regs(self, queryset):
-		regs = WorkshopRegistration.objects.select_related('workshop').filter(workshop__in=queryset)
-		rows = []
-		for r in regs:
-			rows.append({
-				"Workshop": r.workshop.title,
-				"Name": r.name,
-				"Email": r.email,
-				"WhatsApp": r.whatsapp,
-				"Organization": r.organization,
-				"Status": r.status,
-				"Admin Notes": r.admin_notes or '',
-				"Created At": r.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-			})
-		return rows
+		return dashboard_view(request, self.admin_site)
+
+	def _enqueue(self, request, queryset, kind):
+		_enqueue_export(self, request, kind, workshop_ids=queryset.values_list('id', flat=True))
 
 	@admin.action(description="Download registrations (CSV)")
 	def export_workshop_registrations_csv(self, request, queryset):
-		import csv
-		from django.http import HttpResponse
-		rows = self._serialize_workshop_regs(queryset)
-		header = list(rows[0].keys()) if rows else ["Workshop","Name","Email","WhatsApp","Organization","Status","Admin Notes","Created At"]
-		response = HttpResponse(content_type='text/csv')
-		response['Content-Disposition'] = 'attachment; filename="workshop_registrations.csv"'
-		writer = csv.DictWriter(response, fieldnames=header)
-		writer.writeheader()
-		for row in rows:
-			writer.writerow(row)
-		return response
+		self._enqueue(request, queryset, 'csv')
 
 	@admin.action(description="Download registrations (XLSX)")
 	def export_workshop_registrations_xlsx(self, request, queryset):
-		try:
-			from openpyxl import Workbook
-		except Exception:
-			self.message_user(request, "openpyxl not installed. Run: backend/.venv/Scripts/pip install openpyxl", level=messages.ERROR)
-			return
-		from django.http import HttpResponse
-		rows = self._serialize_workshop_regs(queryset)
-		header = list(rows[0].keys()) if rows else ["Workshop","Name","Email","WhatsApp","Organization","Status","Admin Notes","Created At"]
-		wb = Workbook()
-		ws = wb.active
-		ws.title = 'Registrations'
-		ws.append(header)
-		for row in rows:
-			ws.append([row[h] for h in header])
-		response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-		response['Content-Disposition'] = 'attachment; filename="workshop_registrations.xlsx"'
-		wb.save(response)
-		return response
+		self._enqueue(request, queryset, 'xlsx')
+
+	@admin.action(description="Download registrations (XLSX, one sheet per workshop)")
+	def export_workshop_registrations_xlsx_by_workshop(self, request, queryset):
+		self._enqueue(request, queryset, 'xlsx_by_workshop')
 
 	@admin.action(description="Export registrations to Google Sheets")
 	def export_workshop_registrations_to_google_sheets(self, request, queryset):
-		try:
-			import gspread  # type: ignore
-			from google.oauth2.service_account import Credentials  # type: ignore
-		except Exception:
-			self.message_user(request, "gspread/google-auth not installed. Run: backend/.venv/Scripts/pip install gspread google-auth", level=messages.ERROR)
-			return
-		creds_path = getattr(settings, 'GOOGLE_SHEETS_CREDENTIALS_FILE', None)
-		spreadsheet_id = getattr(settings, 'GOOGLE_SHEETS_SPREADSHEET_ID', None)
-		if not creds_path or not spreadsheet_id:
-			self.message_user(request, "Google Sheets credentials or Spreadsheet ID not configured in settings.", level=messages.ERROR)
-			return
-		scope = [
-			'https://www.googleapis.com/auth/spreadsheets',
-			'https://www.googleapis.com/auth/drive',
-		]
-		credentials = Credentials.from_service_account_file(str(creds_path), scopes=scope)
-		client = gspread.authorize(credentials)
-		sh = client.open_by_key(spreadsheet_id)
-		try:
-			worksheet = sh.worksheet('Registrations')
-		except gspread.WorksheetNotFound:
-			worksheet = sh.add_worksheet(title='Registrations', rows=1000, cols=20)
-		header = ["Workshop","Name","Email","WhatsApp","Organization","Status","Admin Notes","Created At"]
-		existing = worksheet.get_all_values()
-		if not existing:
-			worksheet.append_row(header)
-		rows = self._serialize_workshop_regs(queryset)
-		if rows:
-			worksheet.append_rows([[r[h] for h in header] for r in rows], value_input_option='USER_ENTERED')
-		self.message_user(request, f"Exported {len(rows)} registrations to Google Sheets.")
+		self._enqueue(request, queryset, 'sheets')
 
 
 @admin.register(WorkshopRegistration)
-class WorkshopRegistrationAdmin(admin.ModelAdmin):
+class WorkshopRegistrationAdmin(IndexedSearchMixin, admin.ModelAdmin):
+	search_index = 'registration'
 	list_display = ("name", "email", "workshop", "status", "created_at")
-	list_filter = ("status", "workshop", "created_at")
+	# Only workshops that have registrations, looked up through the workshop_id index.
+	list_filter = ("status", ("workshop", admin.RelatedOnlyFieldListFilter), "created_at")
 	search_fields = ("name", "email", "workshop__title")
 	readonly_fields = ("created_at", "proof_preview")
 	fields = ("workshop", "name", "email", "whatsapp", "organization", "payment_proof", "proof_preview", "status", "admin_notes", "created_at")
 
 	actions = ("mark_verified", "mark_rejected", "export_to_google_sheets", "download_csv", "download_xlsx")
 
-	def _serialize_queryset(self, queryset):
-		rows = []
-		for r in queryset.select_related('workshop'):
-			rows.append({
-				"Workshop": r.workshop.title,
-				"Name": r.name,
-				"Email": r.email,
-				"WhatsApp": r.whatsapp,
-				"Organization": r.organization,
-				"Status": r.status,
-				"Admin Notes": r.admin_notes or '',
-				"Created At": r.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-			})
-		return rows
-
 	def proof_preview(self, obj):
-		if obj.payment_proof:
-			return format_html('<img src="{}" style="max-height:150px;" />', obj.payment_proof.url)
-		return ""
+		return _proof_preview(obj, 150)
 
 	@admin.action(description="Mark as Payment Verified")
 	def mark_verified(self, request, queryset):
 		updated = queryset.update(status="verified")
+		cache.bump(cache.STATS_VERSION_KEY)
 		self.message_user(request, f"Marked {updated} registrations as verified.")
 
 	@admin.action(description="Mark as Rejected")
 	def mark_rejected(self, request, queryset):
 		updated = queryset.update(status="rejected")
+		cache.bump(cache.STATS_VERSION_KEY)
 		self.message_user(request, f"Marked {updated} registrations as rejected.")
 
+	def _enqueue(self, request, queryset, kind):
+		_enqueue_export(self, request, kind, registrations=queryset)
+
 	@admin.action(description="Export selected to Google Sheets")
 	def export_to_google_sheets(self, request, queryset):
-		try:
-			import gspread  # type: ignore
-			from google.oauth2.service_account import Credentials  # type: ignore
-		except Exception:
-			self.message_user(request, "gspread/google-auth not installed. Run: backend/.venv/Scripts/pip install gspread google-auth", level=messages.ERROR)
-			return
-		creds_path = getattr(settings, 'GOOGLE_SHEETS_CREDENTIALS_FILE', None)
-		spreadsheet_id = getattr(settings, 'GOOGLE_SHEETS_SPREADSHEET_ID', None)
-		if not creds_path or not spreadsheet_id:
-			self.message_user(request, "Google Sheets credentials or Spreadsheet ID not configured in settings.", level=messages.ERROR)
-			return
-		scope = [
-			'https://www.googleapis.com/auth/spreadsheets',
-			'https://www.googleapis.com/auth/drive',
-		]
-		credentials = Credentials.from_service_account_file(str(creds_path), scopes=scope)
-		client = gspread.authorize(credentials)
-		sh = client.open_by_key(spreadsheet_id)
-		try:
-			worksheet = sh.worksheet('Registrations')
-		except gspread.WorksheetNotFound:
-			worksheet = sh.add_worksheet(title='Registrations', rows=1000, cols=20)
-		# Header
-		header = [
-			"Workshop",
-			"Name",
-			"Email",
-			"WhatsApp",
-			"Organization",
-			"Status",
-			"Admin Notes",
-			"Created At",
-		]
-		existing = worksheet.get_all_values()
-		if not existing:
-			worksheet.append_row(header)
-		rows = []
-		for r in queryset.select_related('workshop'):
-			rows.append([
-				r.workshop.title,
-				r.name,
-				r.email,
-				r.whatsapp,
-				r.organization,
-				r.status,
-				r.admin_notes or '',
-				r.created_at.strftime('%Y-%m-%d %H:%M:%S'),
-			])
-		if rows:
-			worksheet.append_rows(rows, value_input_option='USER_ENTERED')
-		self.message_user(request, f"Exported {len(rows)} registrations to Google Sheets.")
+		self._enqueue(request, queryset, 'sheets')
 
 	@admin.action(description="Download selected as CSV")
 	def download_csv(self, request, queryset):
-		import csv
-		from django.http import HttpResponse
-		rows = self._serialize_queryset(queryset)
-		header = list(rows[0].keys()) if rows else ["Workshop","Name","Email","WhatsApp","Organization","Status","Admin Notes","Created At"]
-		response = HttpResponse(content_type='text/csv')
-		response['Content-Disposition'] = 'attachment; filename="registrations.csv"'
-		writer = csv.DictWriter(response, fieldnames=header)
-		writer.writeheader()
-		for row in rows:
-			writer.writerow(row)
-		return response
+		self._enqueue(request, queryset, 'csv')
 
 	@admin.action(description="Download selected as XLSX")
 	def download_xlsx(self, request, queryset):
-		try:
-			from openpyxl import Workbook
-		except Exception:
-			self.message_user(request, "openpyxl not installed. Run: backend/.venv/Scripts/pip install openpyxl", level=messages.ERROR)
-			return
-		from django.http import HttpResponse
-		rows = self._serialize_queryset(queryset)
-		header = list(rows[0].keys()) if rows else ["Workshop","Name","Email","WhatsApp","Organization","Status","Admin Notes","Created At"]
-		wb = Workbook()
-		ws = wb.active
-		ws.title = 'Registrations'
-		ws.append(header)
-		for row in rows:
-			ws.append([row[h] for h in header])
-		response = HttpResponse(content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-		response['Content-Disposition'] = 'attachment; filename="registrations.xlsx"'
-		wb.save(response)
-		return response
+		self._enqueue(request, queryset, 'xlsx')
+
+
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+	list_display = ("__str__", "kind", "status", "progress_display", "requested_by", "created_at", "finished_at", "download_link")
+	list_filter = ("status", "kind")
+	readonly_fields = ("kind", "params", "status", "progress_display", "result", "error", "requested_by", "created_at", "started_at", "finished_at", "download_link")
+	fields = readonly_fields
+
+	def has_add_permission(self, request):
+		return False
+
+	def has_change_permission(self, request, obj=None):
+		return False
+
+	def get_urls(self):
+		urls = super().get_urls()
+		custom = [
+			path('<int:job_id>/download/', self.admin_site.admin_view(self.download_view), name='api_exportjob_download'),
+		]
+		return custom + urls
+
+	def download_view(self, request, job_id):
+		job = get_object_or_404(ExportJob, pk=job_id, status='done')
+		if not self.has_view_permission(request, job) or not job.file:
+			raise Http404
+		return FileResponse(job.file.open('rb'), as_attachment=True, filename=os.path.basename(job.file.name))
+
+	@admin.display(description="Progress")
+	def progress_display(self, obj):
+		if obj.total:
+			return f"{obj.progress} / {obj.total} ({obj.progress * 100 // obj.total}%)"
+		return "-" if obj.status == 'queued' else f"{obj.progress}"
+
+	@admin.display(description="File")
+	def download_link(self, obj):
+		if obj.status == 'done' and obj.file:
+			return format_html('<a href="{}">Download</a>', reverse('admin:api_exportjob_download', args=[obj.pk]))
+		return ""
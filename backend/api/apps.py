@@ -4,3 +4,18 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from django.db.models.signals import post_migrate
+
+        from . import signals  # noqa: F401
+        post_migrate.connect(_install_search_indexes, sender=self)
+
+
+def _install_search_indexes(using, **kwargs):
+    # Re-checked after every migrate: SQLite drops triggers when a migration
+    # rebuilds a table, and install() repairs the index if that happened.
+    from django.db import connections
+
+    from .search import install
+    install(connections[using])
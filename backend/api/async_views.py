@@ -0,0 +1,171 @@
+"""Async versions of the public API views, for ASGI deployments.
+
+``api/urls.py`` routes to these instead of ``api.views`` when ``ASYNC_VIEWS``
+is on. Under an ASGI server the request body is read by the event loop
+before the view runs, so a client trickling up a ``payment_proof`` holds a
+coroutine rather than a whole worker. Queries use the async ORM API; the
+seat reservation and file save need a transaction / storage write and run
+through ``sync_to_async``. Responses match ``api.views`` exactly: both share
+the parsing, serialization and validator helpers.
+"""
+import asyncio
+import json
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.decorators import method_decorator
+from django.utils.http import http_date, quote_etag
+from django.views import View
+from django.views.decorators.csrf import csrf_exempt
+
+from . import cache, idempotency, ingest, live
+from .models import ContactSubmission, Workshop
+from .views import (
+	LIST_STATE, _contact_fields, _detail_validators_from, _list_etag, _list_validators_from, _payment_proof,
+	_payment_proof_handler, _queued, _registered, _registration_fields, _reserve_registration, _serialize_workshop,
+	_upload_error, _workshop_page, _workshop_page_query,
+)
+
+
+async def health(request):
+	return JsonResponse({"status": "ok"})
+
+
+async def _conditional(request, validators, respond):
+	"""What ``django.views.decorators.http.condition`` does, with async validators."""
+	etag, last_modified = await validators()
+	etag = quote_etag(etag) if etag else None
+	timestamp = int(last_modified.timestamp()) if last_modified else None
+	response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+	if response is None:
+		response = await respond()
+	if request.method in ('GET', 'HEAD'):
+		if timestamp and not response.has_header('Last-Modified'):
+			response.headers['Last-Modified'] = http_date(timestamp)
+		if etag:
+			response.headers.setdefault('ETag', etag)
+	return response
+
+
+async def _list_validators():
+	async def compute():
+		return _list_validators_from(await Workshop.objects.aaggregate(**LIST_STATE))
+	return await cache.acached_value(cache.LIST_VERSION_KEY, 'validators', compute)
+
+
+async def _detail_validators(workshop_id):
+	async def compute():
+		updated_at = await Workshop.objects.filter(id=workshop_id).values_list('updated_at', flat=True).afirst()
+		return _detail_validators_from(workshop_id, updated_at)
+	return await cache.acached_value(cache.detail_version_key(workshop_id), 'validators', compute)
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+@method_decorator(idempotency.idempotent, name="post")
+class ContactView(View):
+	async def post(self, request):
+		try:
+			fields = _contact_fields(request)
+		except json.JSONDecodeError:
+			return JsonResponse({"error": "Invalid JSON"}, status=400)
+		if fields is None:
+			return JsonResponse({"error": "Missing required fields"}, status=400)
+		if settings.CONTACT_INGEST_MODE == 'buffered':
+			return _queued(await sync_to_async(ingest.submit)(fields))
+		sub = await ContactSubmission.objects.acreate(**fields)
+		return JsonResponse({"id": sub.id, "created_at": sub.created_at.isoformat()})
+
+
+class WorkshopsView(View):
+	async def get(self, request):
+		try:
+			qs, fields, limit = _workshop_page_query(request.GET)
+		except ValueError as exc:
+			return JsonResponse({"error": str(exc)}, status=400)
+
+		async def build():
+			return _workshop_page(request, [ws async for ws in qs[:limit + 1]], fields, limit)
+
+		async def respond():
+			return await cache.acached_json(request, cache.LIST_VERSION_KEY, build)
+
+		async def validators():
+			etag, last_modified = await _list_validators()
+			return _list_etag(request, etag), last_modified
+		return await _conditional(request, validators, respond)
+
+
+class WorkshopDetailView(View):
+	async def get(self, request, workshop_id: int):
+		async def build():
+			return _serialize_workshop(request, await Workshop.objects.aget(id=workshop_id))
+
+		async def respond():
+			try:
+				return await cache.acached_json(request, cache.detail_version_key(workshop_id), build)
+			except Workshop.DoesNotExist:
+				return JsonResponse({"error": "Not found"}, status=404)
+		return await _conditional(request, lambda: _detail_validators(workshop_id), respond)
+
+
+@method_decorator(csrf_exempt, name="dispatch")
+@method_decorator(idempotency.idempotent, name="post")
+class WorkshopRegisterView(View):
+	async def post(self, request, workshop_id: int):
+		try:
+			ws = await Workshop.objects.aget(id=workshop_id)
+		except Workshop.DoesNotExist:
+			return JsonResponse({"error": "Not found"}, status=404)
+		handler = _payment_proof_handler(request)
+		try:
+			email, defaults = _registration_fields(request)
+		except json.JSONDecodeError:
+			return JsonResponse({"error": "Invalid JSON"}, status=400)
+		error = _upload_error(handler)
+		if error:
+			return error
+		if email is None:
+			return JsonResponse({"error": "Missing required fields"}, status=400)
+		# Transactions aren't available to the async ORM.
+		reg, created = await sync_to_async(_reserve_registration)(ws, email, defaults, _payment_proof(request))
+		if reg is None:
+			return JsonResponse({"error": "Sold out"}, status=400)
+		seats_taken = await Workshop.objects.filter(pk=ws.pk).values_list('seats_taken', flat=True).afirst()
+		return _registered(reg, created, seats_taken)
+
+
+def _event_stream(events):
+	response = StreamingHttpResponse(events, content_type='text/event-stream')
+	response['Cache-Control'] = 'no-cache'
+	# Stop nginx from buffering the stream.
+	response['X-Accel-Buffering'] = 'no'
+	return response
+
+
+class WorkshopSeatsView(View):
+	async def get(self, request, workshop_id=None):
+		if workshop_id is not None and not await Workshop.objects.filter(pk=workshop_id).aexists():
+			return JsonResponse({"error": "Not found"}, status=404)
+
+		async def stream():
+			loop = asyncio.get_running_loop()
+			events = asyncio.Queue()
+			token = live.watch(workshop_id, lambda data: loop.call_soon_threadsafe(events.put_nowait, data))
+			try:
+				yield live.RETRY
+				async for row in live.snapshot(workshop_id):
+					yield live.format_event(live.event(row))
+				deadline = time.monotonic() + settings.LIVE_STREAM_SECONDS
+				while (remaining := deadline - time.monotonic()) > 0:
+					try:
+						data = await asyncio.wait_for(events.get(), min(remaining, settings.LIVE_KEEPALIVE))
+					except asyncio.TimeoutError:
+						yield live.KEEPALIVE
+						continue
+					yield live.format_event(data)
+			finally:
+				live.unwatch(token)
+		return _event_stream(stream())
@@ -0,0 +1,104 @@
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+
+from . import timing
+
+LIST_VERSION_KEY = 'workshops:v:list'
+STATS_VERSION_KEY = 'workshops:v:stats'
+
+
+def detail_version_key(workshop_id) -> str:
+	return f'workshops:v:detail:{workshop_id}'
+
+
+def _cache():
+	return caches[settings.WORKSHOP_CACHE_ALIAS]
+
+
+def _get_version(key: str):
+	cache = _cache()
+	version = cache.get(key)
+	if version is None:
+		# Seed with a timestamp rather than 1 so that a version key evicted by
+		# MAX_ENTRIES culling can never resurrect responses stored under it.
+		cache.add(key, time.time_ns(), None)
+		version = cache.get(key, time.time_ns())
+	return version
+
+
+def bump(*keys: str) -> None:
+	cache = _cache()
+	for key in keys:
+		try:
+			cache.incr(key)
+		except ValueError:
+			cache.set(key, time.time_ns(), None)
+
+
+def cached_value(version_key: str, name: str, compute):
+	"""Memoize ``compute()`` for as long as ``version_key`` is unchanged."""
+	key = f'workshops:m:{_get_version(version_key)}:{name}'
+	cache = _cache()
+	value = cache.get(key)
+	if value is None:
+		value = compute()
+		cache.set(key, value, settings.WORKSHOP_CACHE_TIMEOUT)
+	return value
+
+
+def _response_key(request, version) -> str:
+	url = hashlib.md5(request.build_absolute_uri().encode('utf-8')).hexdigest()
+	return f'workshops:r:{version}:{url}'
+
+
+def _serialize(payload) -> bytes:
+	with timing.measure('serialize'):
+		return json.dumps(payload, cls=DjangoJSONEncoder).encode('utf-8')
+
+
+def cached_json(request, version_key: str, build) -> HttpResponse:
+	"""Return ``build()`` as JSON, reusing the serialized bytes while ``version_key`` is unchanged."""
+	key = _response_key(request, _get_version(version_key))
+	cache = _cache()
+	body = cache.get(key)
+	if body is None:
+		body = _serialize(build())
+		cache.set(key, body, settings.WORKSHOP_CACHE_TIMEOUT)
+	return HttpResponse(body, content_type='application/json')
+
+
+# Async counterparts for api.async_views; ``compute``/``build`` are coroutine functions.
+
+async def _aget_version(key: str):
+	cache = _cache()
+	version = await cache.aget(key)
+	if version is None:
+		await cache.aadd(key, time.time_ns(), None)
+		version = await cache.aget(key, time.time_ns())
+	return version
+
+
+async def acached_value(version_key: str, name: str, compute):
+	key = f'workshops:m:{await _aget_version(version_key)}:{name}'
+	cache = _cache()
+	value = await cache.aget(key)
+	if value is None:
+		value = await compute()
+		await cache.aset(key, value, settings.WORKSHOP_CACHE_TIMEOUT)
+	return value
+
+
+async def acached_json(request, version_key: str, build) -> HttpResponse:
+	key = _response_key(request, await _aget_version(version_key))
+	cache = _cache()
+	body = await cache.aget(key)
+	if body is None:
+		body = _serialize(await build())
+		await cache.aset(key, body, settings.WORKSHOP_CACHE_TIMEOUT)
+	return HttpResponse(body, content_type='application/json')
@@ -0,0 +1,86 @@
+import csv
+import re
+
+EXPORT_HEADER = ["Workshop", "Name", "Email", "WhatsApp", "Organization", "Status", "Admin Notes", "Created At"]
+EXPORT_COLUMNS = ('workshop__title', 'name', 'email', 'whatsapp', 'organization', 'status', 'admin_notes', 'created_at')
+EXPORT_CHUNK_SIZE = 2000
+PROGRESS_EVERY = 1000
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+def iter_keyed_rows(queryset, chunk_size: int = EXPORT_CHUNK_SIZE, order_by=('id',), progress=None):
+	"""Yield ``(registration_id, workshop_id, row)`` for each registration.
+
+	``progress``, if given, is called with the running row count every
+	``PROGRESS_EVERY`` rows and once at the end.
+	"""
+	rows = queryset.order_by(*order_by).values_list('id', 'workshop_id', *EXPORT_COLUMNS).iterator(chunk_size=chunk_size)
+	done = 0
+	for pk, workshop_id, workshop, name, email, whatsapp, organization, status, admin_notes, created_at in rows:
+		yield pk, workshop_id, [
+			workshop,
+			name,
+			email,
+			whatsapp,
+			organization,
+			status,
+			admin_notes or '',
+			created_at.strftime('%Y-%m-%d %H:%M:%S'),
+		]
+		done += 1
+		if progress and done % PROGRESS_EVERY == 0:
+			progress(done)
+	if progress:
+		progress(done)
+
+
+def iter_registration_rows(queryset, chunk_size: int = EXPORT_CHUNK_SIZE, progress=None):
+	"""Yield export rows for a WorkshopRegistration queryset without materializing it."""
+	for _pk, _workshop_id, row in iter_keyed_rows(queryset, chunk_size, progress=progress):
+		yield row
+
+
+def write_csv(queryset, fileobj, progress=None) -> None:
+	"""Write registrations as CSV to the text file ``fileobj``."""
+	writer = csv.writer(fileobj)
+	writer.writerow(EXPORT_HEADER)
+	writer.writerows(iter_registration_rows(queryset, progress=progress))
+
+
+def _sheet_title(title: str, used: set) -> str:
+	# Excel sheet names: max 31 chars, no []:*?/\ and unique case-insensitively.
+	base = re.sub(r'[\[\]:*?/\\]', ' ', title).strip()[:31] or 'Sheet'
+	name, n = base, 2
+	while name.lower() in used:
+		suffix = f' ({n})'
+		name, n = base[:31 - len(suffix)] + suffix, n + 1
+	used.add(name.lower())
+	return name
+
+
+def write_xlsx(queryset, fileobj, per_workshop: bool = False, progress=None) -> None:
+	"""Write registrations to ``fileobj`` with a write-only workbook.
+
+	Rows go straight from the chunked queryset iterator to the sheet XML, so
+	memory stays flat regardless of row count. With ``per_workshop`` each
+	workshop gets its own sheet.
+	"""
+	from openpyxl import Workbook
+
+	wb = Workbook(write_only=True)
+	if not per_workshop:
+		ws = wb.create_sheet('Registrations')
+		ws.append(EXPORT_HEADER)
+		for row in iter_registration_rows(queryset, progress=progress):
+			ws.append(row)
+	else:
+		used, current, ws = set(), None, None
+		for _pk, workshop_id, row in iter_keyed_rows(queryset, order_by=('workshop_id', 'id'), progress=progress):
+			if ws is None or workshop_id != current:
+				current = workshop_id
+				ws = wb.create_sheet(_sheet_title(row[0], used))
+				ws.append(EXPORT_HEADER)
+			ws.append(row)
+		if ws is None:
+			wb.create_sheet('Registrations').append(EXPORT_HEADER)
+	wb.save(fileobj)
@@ -0,0 +1,209 @@
+"""``Idempotency-Key`` support for the registration and contact POSTs.
+
+A client that sends ``Idempotency-Key: <key>`` can safely retry the request.
+The first request with a key claims it in ``IdempotencyKey`` before the view
+runs, and its response is stored there if it succeeds (2xx). A retry with the
+same key on the same path, for the same request, gets that response back,
+marked ``Idempotent-Replayed: true``. The view never runs, so the upload
+handlers aren't either, and no registration or contact rows are written.
+
+* "The same request" is compared by ``fingerprint()``: a hash of the JSON
+  body, or of the form fields and each upload's contents. A retry's uploads
+  are only hashed, never stored. A key reused for a different request gets a
+  422 instead of someone else's response.
+* A retry that arrives while the first request is still running gets a 409
+  with ``Retry-After``.
+* Other responses aren't stored. A failed request wrote nothing, so its key
+  is released and a retry runs again.
+* A claim lapses after ``IDEMPOTENCY_LOCK_SECONDS``, so a crashed worker
+  doesn't hold its key forever. A stored response lapses after
+  ``IDEMPOTENCY_KEY_TTL``. Each process deletes expired rows when it claims a
+  new key, at most once per ``IDEMPOTENCY_PURGE_INTERVAL``.
+
+(Under ASGI, Django has already received the body before the view runs, as
+noted in ``api.uploads``; a replay still skips storing uploads and every write.)
+"""
+import datetime
+import functools
+import hashlib
+import json
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse, JsonResponse
+from django.utils import timezone
+
+from .models import IdempotencyKey
+
+HEADER = 'HTTP_IDEMPOTENCY_KEY'
+MAX_KEY_LENGTH = 255
+
+_lock = threading.Lock()
+_next_purge = 0.0
+
+
+def _purge(now) -> None:
+	global _next_purge
+	with _lock:
+		if time.monotonic() < _next_purge:
+			return
+		_next_purge = time.monotonic() + settings.IDEMPOTENCY_PURGE_INTERVAL
+	IdempotencyKey.objects.filter(expires_at__lte=now).delete()
+
+
+class _DigestUploadHandler(FileUploadHandler):
+	"""Keeps only a SHA-256 of each upload: all a replay needs to compare it."""
+
+	def new_file(self, *args, **kwargs):
+		super().new_file(*args, **kwargs)
+		self.digest = hashlib.sha256()
+
+	def receive_data_chunk(self, raw_data, start):
+		self.digest.update(raw_data)
+
+	def file_complete(self, file_size):
+		uploaded = SimpleUploadedFile(self.file_name, b'', self.content_type)
+		uploaded.sha256 = self.digest.hexdigest()
+		return uploaded
+
+
+def _file_digest(uploaded) -> str:
+	if hasattr(uploaded, 'sha256'):
+		return uploaded.sha256
+	digest = hashlib.sha256()
+	uploaded.seek(0)
+	for chunk in uploaded.chunks():
+		digest.update(chunk)
+	return digest.hexdigest()
+
+
+def fingerprint(request) -> str:
+	"""Hash of what ``request`` asks for; JSON key order and multipart boundaries don't count."""
+	if request.content_type == 'application/json':
+		try:
+			payload = json.loads(request.body)
+		except ValueError:
+			payload = request.body.decode('utf-8', 'replace')
+	else:
+		payload = {
+			'fields': sorted(request.POST.lists()),
+			'files': sorted(
+				(field, _file_digest(uploaded))
+				for field, files in request.FILES.lists() for uploaded in files
+			),
+		}
+	return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+
+def claim(path: str, key: str):
+	"""Claim ``key`` for a new request; returns None, or the existing row to answer from."""
+	now = timezone.now()
+	lapses = now + datetime.timedelta(seconds=settings.IDEMPOTENCY_LOCK_SECONDS)
+	for _attempt in range(2):
+		try:
+			with transaction.atomic():
+				IdempotencyKey.objects.create(path=path, key=key, expires_at=lapses)
+		except IntegrityError:
+			row = IdempotencyKey.objects.filter(path=path, key=key).first()
+			if row is None or row.expires_at > now:
+				return row
+			# Expired but not purged yet: take it over, unless another retry just did.
+			IdempotencyKey.objects.filter(pk=row.pk, expires_at__lte=now).delete()
+			continue
+		_purge(now)
+		return None
+	return IdempotencyKey.objects.filter(path=path, key=key).first()
+
+
+def finish(request, key: str, response) -> None:
+	"""Store a successful response for replay; release the claim otherwise."""
+	claimed = IdempotencyKey.objects.filter(path=request.path, key=key, status_code__isnull=True)
+	if 200 <= response.status_code < 300 and not response.streaming:
+		claimed.update(
+			fingerprint=fingerprint(request),
+			status_code=response.status_code,
+			content_type=response.get('Content-Type', ''),
+			body=response.content,
+			expires_at=timezone.now() + datetime.timedelta(seconds=settings.IDEMPOTENCY_KEY_TTL),
+		)
+	else:
+		claimed.delete()
+
+
+def release(path: str, key: str) -> None:
+	IdempotencyKey.objects.filter(path=path, key=key, status_code__isnull=True).delete()
+
+
+def replay(request, row):
+	if row is None or row.status_code is None:
+		response = JsonResponse({"error": "A request with this Idempotency-Key is in progress"}, status=409)
+		response['Retry-After'] = '1'
+		return response
+	if row.fingerprint:
+		if not hasattr(request, '_files'):
+			request.upload_handlers = [_DigestUploadHandler(request)]
+		if fingerprint(request) != row.fingerprint:
+			return JsonResponse({"error": "Idempotency-Key was already used for a different request"}, status=422)
+	response = HttpResponse(bytes(row.body), status=row.status_code, content_type=row.content_type)
+	response['Idempotent-Replayed'] = 'true'
+	return response
+
+
+def _key(request):
+	"""The request's key; None without one, '' if it's unusable."""
+	key = request.META.get(HEADER)
+	if key is None:
+		return None
+	key = key.strip()
+	return key if len(key) <= MAX_KEY_LENGTH else ''
+
+
+def _invalid():
+	return JsonResponse({"error": f"Idempotency-Key must be 1-{MAX_KEY_LENGTH} characters"}, status=400)
+
+
+def idempotent(view):
+	"""Honour ``Idempotency-Key`` on ``view`` (a sync or async view function)."""
+	if iscoroutinefunction(view):
+		@functools.wraps(view)
+		async def wrapper(request, *args, **kwargs):
+			key = _key(request)
+			if key is None:
+				return await view(request, *args, **kwargs)
+			if not key:
+				return _invalid()
+			existing = await sync_to_async(claim)(request.path, key)
+			if existing is not None:
+				return replay(request, existing)
+			try:
+				response = await view(request, *args, **kwargs)
+			except BaseException:
+				await sync_to_async(release)(request.path, key)
+				raise
+			await sync_to_async(finish)(request, key, response)
+			return response
+		return wrapper
+
+	@functools.wraps(view)
+	def wrapper(request, *args, **kwargs):
+		key = _key(request)
+		if key is None:
+			return view(request, *args, **kwargs)
+		if not key:
+			return _invalid()
+		existing = claim(request.path, key)
+		if existing is not None:
+			return replay(request, existing)
+		try:
+			response = view(request, *args, **kwargs)
+		except BaseException:
+			release(request.path, key)
+			raise
+		finish(request, key, response)
+		return response
+	return wrapper
@@ -0,0 +1,208 @@
+"""Buffered ingest for contact-form submissions.
+
+With ``CONTACT_INGEST_MODE = "buffered"`` the contact view doesn't INSERT.
+``submit()`` appends the validated submission to a per-process spool file
+under ``CONTACT_SPOOL_DIR`` (fsynced before the request is acknowledged), and
+returns a ULID the client can quote. A flusher thread moves spooled rows into
+``ContactSubmission`` with ``bulk_create`` whenever ``CONTACT_BATCH_SIZE``
+submissions are waiting or ``CONTACT_FLUSH_INTERVAL`` seconds have passed, so
+bursts cost one write transaction per batch instead of one per request.
+
+Spool layout:
+
+* ``current-<pid>.jsonl`` -- being appended to by a live process.
+* ``batch-<ulid>.jsonl`` -- sealed, waiting to be written.
+* ``batch-<ulid>.jsonl.<pid>`` -- claimed by a flusher.
+
+A file is only deleted after its rows are committed, and rows carry their
+ULID in the unique ``ContactSubmission.ingest_id``, so replaying a file after
+a crash never duplicates submissions. A row's ``created_at`` is the time in
+its ULID, i.e. when it was submitted. ``flush()`` also adopts files left
+behind by dead processes; ``manage.py flush_contact_spool`` runs it on demand.
+
+A process flushes its buffer when it exits. What a killed process leaves
+behind is only written by a later process that sees the same spool, so
+``CONTACT_SPOOL_DIR`` must be on a persistent disk shared by every instance.
+"""
+import atexit
+import datetime
+import json
+import logging
+import os
+import secrets
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from .models import ContactSubmission
+
+logger = logging.getLogger(__name__)
+
+CROCKFORD = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+FIELDS = ('name', 'email', 'service', 'message')
+
+_lock = threading.Lock()
+_wakeup = threading.Event()
+_worker = None
+_buffered = 0
+
+
+def new_ulid() -> str:
+	"""26-character ULID: 48-bit millisecond timestamp + 80 random bits, Crockford base32."""
+	value = (int(time.time() * 1000) << 80) | secrets.randbits(80)
+	return ''.join(CROCKFORD[(value >> shift) & 31] for shift in range(125, -1, -5))
+
+
+def ulid_time(ulid: str) -> datetime.datetime:
+	"""When ``ulid`` was made, to the millisecond."""
+	value = 0
+	for char in ulid[:10]:
+		value = value * 32 + CROCKFORD.index(char)
+	return datetime.datetime.fromtimestamp(value / 1000, tz=datetime.timezone.utc)
+
+
+def _spool_dir() -> str:
+	path = str(settings.CONTACT_SPOOL_DIR)
+	os.makedirs(path, exist_ok=True)
+	return path
+
+
+def _current_path() -> str:
+	return os.path.join(_spool_dir(), f'current-{os.getpid()}.jsonl')
+
+
+def _pid_alive(pid: int) -> bool:
+	try:
+		os.kill(pid, 0)
+	except ProcessLookupError:
+		return False
+	except PermissionError:
+		pass
+	return True
+
+
+def submit(data: dict) -> str:
+	"""Durably spool one validated submission and return its ULID."""
+	global _buffered
+	ingest_id = new_ulid()
+	line = json.dumps({'id': ingest_id, **{f: data.get(f, '') for f in FIELDS}}) + '\n'
+	with _lock:
+		with open(_current_path(), 'a', encoding='utf-8') as fh:
+			fh.write(line)
+			fh.flush()
+			os.fsync(fh.fileno())
+		_buffered += 1
+		full = _buffered >= settings.CONTACT_BATCH_SIZE
+	if settings.CONTACT_INGEST_ASYNC:
+		_ensure_worker()
+		if full:
+			_wakeup.set()
+	elif full:
+		flush()
+	return ingest_id
+
+
+def _seal_current() -> None:
+	"""Rename this process's spool file out of the way of new appends."""
+	global _buffered
+	with _lock:
+		current = _current_path()
+		if os.path.exists(current):
+			os.replace(current, os.path.join(_spool_dir(), f'batch-{new_ulid()}.jsonl'))
+		_buffered = 0
+
+
+def _adopt_orphans(directory: str) -> None:
+	for name in os.listdir(directory):
+		path = os.path.join(directory, name)
+		try:
+			if name.startswith('current-') and name.endswith('.jsonl'):
+				pid = int(name[len('current-'):-len('.jsonl')])
+				if pid != os.getpid() and not _pid_alive(pid):
+					os.replace(path, os.path.join(directory, f'batch-{new_ulid()}.jsonl'))
+			elif name.startswith('batch-') and not name.endswith('.jsonl'):
+				base, pid = name.rsplit('.', 1)
+				if int(pid) != os.getpid() and not _pid_alive(int(pid)):
+					os.replace(path, os.path.join(directory, base))
+		except (ValueError, FileNotFoundError):
+			# Not a spool file, or another process adopted it first.
+			continue
+
+
+def _read(path: str) -> list:
+	rows = []
+	with open(path, encoding='utf-8') as fh:
+		for line in fh:
+			try:
+				record = json.loads(line)
+			except ValueError:
+				# A torn final line from a crash mid-append was never acknowledged.
+				continue
+			rows.append(ContactSubmission(
+				ingest_id=record['id'], created_at=ulid_time(record['id']), **{f: record.get(f, '') for f in FIELDS}
+			))
+	return rows
+
+
+def flush() -> int:
+	"""Write every sealed batch (including this process's buffer) to the database.
+
+	Returns the number of spooled submissions replayed.
+	"""
+	_seal_current()
+	directory = _spool_dir()
+	_adopt_orphans(directory)
+	written = 0
+	for name in sorted(os.listdir(directory)):
+		if not (name.startswith('batch-') and name.endswith('.jsonl')):
+			continue
+		claimed = os.path.join(directory, f'{name}.{os.getpid()}')
+		try:
+			os.replace(os.path.join(directory, name), claimed)
+		except FileNotFoundError:
+			continue  # another process claimed it
+		rows = _read(claimed)
+		try:
+			with transaction.atomic():
+				ContactSubmission.objects.bulk_create(rows, batch_size=settings.CONTACT_BATCH_SIZE, ignore_conflicts=True)
+		except Exception:
+			os.replace(claimed, os.path.join(directory, name))
+			raise
+		os.remove(claimed)
+		written += len(rows)
+	return written
+
+
+def _run() -> None:
+	while True:
+		_wakeup.wait(settings.CONTACT_FLUSH_INTERVAL)
+		_wakeup.clear()
+		if not _buffered and not any(n.startswith('batch-') for n in os.listdir(_spool_dir())):
+			continue
+		try:
+			close_old_connections()
+			flush()
+		except Exception:
+			# Rows stay in the spool and are retried on the next tick.
+			logger.exception("Contact spool flush failed")
+
+
+def _flush_at_exit() -> None:
+	try:
+		flush()
+	except Exception:
+		# flush() sealed the buffer first, so the next process's flush picks it up.
+		logger.exception("Contact spool flush at exit failed")
+		_seal_current()
+
+
+def _ensure_worker() -> None:
+	global _worker
+	with _lock:
+		if _worker is None or not _worker.is_alive():
+			if _worker is None:
+				atexit.register(_flush_at_exit)
+			_worker = threading.Thread(target=_run, name='contact-ingest', daemon=True)
+			_worker.start()
@@ -0,0 +1,204 @@
+"""Database-backed queue for admin exports.
+
+Admin actions call ``enqueue()`` and return straight away; the
+``run_export_jobs`` management command claims queued jobs one at a time and
+writes the result to ``ExportJob.file`` (or syncs Google Sheets), updating
+``progress`` as rows are written.
+
+A worker killed mid-job (a redeploy) leaves its job ``running``. Progress
+reports double as a heartbeat, and ``requeue_stale()`` -- run by the worker
+every ``EXPORT_JOB_STALE_SECONDS`` / 4 -- puts jobs whose heartbeat stopped
+back in the queue, or fails them after ``EXPORT_JOB_MAX_ATTEMPTS`` claims. A
+worker that was only slow rather than dead finds its claim gone: its progress
+and result are discarded rather than written over the new attempt's.
+"""
+import datetime
+import io
+import itertools
+import logging
+import tempfile
+import threading
+import time
+import traceback
+
+from django.conf import settings
+from django.core.files import File
+from django.db import transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from . import exports, metrics, sheets
+from .models import ExportJob, ExportSelection, WorkshopRegistration
+
+logger = logging.getLogger(__name__)
+
+FILENAMES = {
+	'csv': 'registrations.csv',
+	'xlsx': 'registrations.xlsx',
+	'xlsx_by_workshop': 'registrations_by_workshop.xlsx',
+}
+SELECTION_BATCH_SIZE = 500
+
+
+def _whole_workshops(registrations) -> list:
+	"""Ids of the workshops all of whose registrations are in ``registrations``."""
+	selected = dict(registrations.order_by().values_list('workshop_id').annotate(n=Count('id')))
+	totals = WorkshopRegistration.objects.filter(workshop_id__in=selected).order_by().values_list('workshop_id').annotate(n=Count('id'))
+	return sorted(workshop_id for workshop_id, n in totals if selected[workshop_id] == n)
+
+
+def enqueue(kind: str, requested_by=None, workshop_ids=None, registrations=None) -> ExportJob:
+	"""Queue an export of ``workshop_ids``' registrations, or of the ``registrations`` queryset.
+
+	A selection is stored as the workshops it covers entirely, plus
+	``ExportSelection`` rows for the rest, never as a list of ids in
+	``params``: "select all" on the changelist can pick any number of rows.
+	"""
+	params = {}
+	if workshop_ids is not None:
+		params['workshop_ids'] = list(workshop_ids)
+	if registrations is None:
+		return ExportJob.objects.create(kind=kind, params=params, requested_by=requested_by)
+	params['workshop_ids'] = _whole_workshops(registrations)
+	rest = registrations.exclude(workshop_id__in=params['workshop_ids']).order_by().values_list('id', flat=True)
+	if rest.exists():
+		params['selection'] = True
+	# One transaction, so a worker never claims the job before its selection is stored.
+	with transaction.atomic():
+		job = ExportJob.objects.create(kind=kind, params=params, requested_by=requested_by)
+		if params.get('selection'):
+			ids = rest.iterator(chunk_size=SELECTION_BATCH_SIZE)
+			while batch := list(itertools.islice(ids, SELECTION_BATCH_SIZE)):
+				ExportSelection.objects.bulk_create([ExportSelection(job=job, registration_id=i) for i in batch])
+	return job
+
+
+def job_queryset(job: ExportJob):
+	regs = WorkshopRegistration.objects.all()
+	if job.params.get('selection'):
+		selected = ExportSelection.objects.filter(job=job).values('registration_id')
+		return regs.filter(Q(workshop_id__in=job.params['workshop_ids']) | Q(id__in=selected))
+	if 'workshop_ids' in job.params:
+		regs = regs.filter(workshop_id__in=job.params['workshop_ids'])
+	if 'registration_ids' in job.params:
+		# Jobs queued before selections were stored in ExportSelection.
+		regs = regs.filter(id__in=job.params['registration_ids'])
+	return regs
+
+
+_lock = threading.Lock()
+_next_sweep = 0.0
+
+
+def requeue_stale() -> tuple:
+	"""Requeue running jobs whose heartbeat stopped; fail those out of attempts.
+
+	Returns ``(requeued, failed)`` counts.
+	"""
+	now = timezone.now()
+	cutoff = now - datetime.timedelta(seconds=settings.EXPORT_JOB_STALE_SECONDS)
+	stale = ExportJob.objects.filter(Q(heartbeat_at__lt=cutoff) | Q(heartbeat_at__isnull=True, started_at__lt=cutoff), status='running')
+	failed = stale.filter(attempts__gte=settings.EXPORT_JOB_MAX_ATTEMPTS).update(
+		status='failed', finished_at=now,
+		error=f"The worker stopped during the job {settings.EXPORT_JOB_MAX_ATTEMPTS} times; giving up.",
+	)
+	requeued = stale.update(status='queued', progress=0)
+	return requeued, failed
+
+
+def _sweep() -> None:
+	global _next_sweep
+	with _lock:
+		if time.monotonic() < _next_sweep:
+			return
+		_next_sweep = time.monotonic() + settings.EXPORT_JOB_STALE_SECONDS / 4
+	requeued, failed = requeue_stale()
+	if requeued or failed:
+		logger.warning("Recovered stale export jobs: %s requeued, %s failed", requeued, failed)
+
+
+def claim_next():
+	"""Atomically move the oldest queued job to running and return it, or None."""
+	while True:
+		job = ExportJob.objects.filter(status='queued').order_by('created_at', 'id').first()
+		if job is None:
+			return None
+		# Conditional UPDATE so two workers can never claim the same job.
+		now = timezone.now()
+		claimed = ExportJob.objects.filter(pk=job.pk, status='queued').update(
+			status='running', started_at=now, heartbeat_at=now, attempts=F('attempts') + 1,
+		)
+		if claimed:
+			job.refresh_from_db()
+			return job
+
+
+def _attempt(job):
+	"""The job's row, as long as this worker's claim on it still stands.
+
+	Once ``requeue_stale()`` has given the job to another worker, updates
+	through this match nothing, so a slow worker can't overwrite the new
+	attempt's progress or result.
+	"""
+	return ExportJob.objects.filter(pk=job.pk, status='running', attempts=job.attempts)
+
+
+def _progress(job):
+	def report(done):
+		_attempt(job).update(progress=done, heartbeat_at=timezone.now())
+	return report
+
+
+def run_job(job: ExportJob) -> ExportJob:
+	report = _progress(job)
+	try:
+		regs = job_queryset(job)
+		job.total = regs.count()
+		_attempt(job).update(total=job.total)
+		if job.kind == 'sheets':
+			appended, updated = sheets.sync_registrations(
+				regs, sheets.get_client(), settings.GOOGLE_SHEETS_SPREADSHEET_ID, progress=report,
+			)
+			job.result = f"{appended} new, {updated} updated"
+		else:
+			with tempfile.TemporaryFile() as spool:
+				if job.kind == 'csv':
+					text = io.TextIOWrapper(spool, encoding='utf-8', newline='')
+					exports.write_csv(regs, text, progress=report)
+					text.flush()
+					text.detach()
+				else:
+					exports.write_xlsx(regs, spool, per_workshop=job.kind == 'xlsx_by_workshop', progress=report)
+				spool.seek(0)
+				job.file.save(FILENAMES[job.kind], File(spool), save=False)
+			job.result = f"{job.total} rows"
+		job.status = 'done'
+	except Exception:
+		logger.exception("Export job %s failed", job.pk)
+		job.status = 'failed'
+		job.error = traceback.format_exc()
+	job.finished_at = timezone.now()
+	finished = _attempt(job).update(
+		status=job.status, file=job.file.name or '', result=job.result, error=job.error, finished_at=job.finished_at,
+	)
+	if not finished:
+		logger.warning("Export job %s was requeued while this worker ran it; discarding this attempt", job.pk)
+		if job.file:
+			job.file.delete(save=False)
+		return job
+	if job.started_at:
+		metrics.observe(
+			'export_job_duration_seconds', {'kind': job.kind, 'status': job.status},
+			(job.finished_at - job.started_at).total_seconds(), buckets=metrics.JOB_BUCKETS,
+		)
+	# The worker is idle between jobs, so publish now rather than on the next record.
+	metrics.flush()
+	return job
+
+
+def run_next():
+	_sweep()
+	job = claim_next()
+	if job is None:
+		return None
+	return run_job(job)
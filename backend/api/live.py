@@ -0,0 +1,134 @@
+"""Live seat availability for the Server-Sent Events endpoints.
+
+``/api/workshops/<id>/seats`` and ``/api/workshops/seats`` (every active
+workshop) stream ``seats`` events -- ``{"id", "registrations_count",
+"is_sold_out"}`` -- with the current state on connect and then each change.
+
+Streams watch an in-process hub. A registration, cancellation or workshop
+edit publishes after commit with one query for the workshop's counters, and
+the hub fans the event out to every watcher in the process: a change costs
+one query however many clients are listening, and nothing at all while
+nobody is.
+
+Each process has its own hub. To hear about changes committed by other
+worker processes, a poller thread runs while anyone is watching and
+publishes workshops whose ``updated_at`` moved (registrations bump it): one
+query per ``LIVE_POLL_INTERVAL`` per process. The hub remembers what it last
+sent for each workshop, so a change seen both ways is delivered once.
+
+Streams are only served by the async views (``ASYNC_VIEWS``, under ASGI);
+under WSGI the same URLs answer with one JSON snapshot.
+"""
+import datetime
+import json
+import logging
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.utils import timezone
+
+from .models import Workshop
+
+logger = logging.getLogger(__name__)
+
+FIELDS = ('id', 'seats_taken', 'capacity', 'status')
+RETRY = b'retry: 3000\n\n'
+KEEPALIVE = b': keepalive\n\n'
+# updated_at is set before commit, so re-read a window behind the newest row
+# seen rather than trusting it as a high-water mark.
+POLL_OVERLAP = datetime.timedelta(seconds=5)
+
+_lock = threading.Lock()
+_watchers = {}
+_last = {}
+_poller = None
+
+
+def event(row) -> dict:
+	return {'id': row['id'], 'registrations_count': row['seats_taken'], 'is_sold_out': row['seats_taken'] >= row['capacity']}
+
+
+def format_event(data: dict) -> bytes:
+	return f'event: seats\ndata: {json.dumps(data)}\n\n'.encode('utf-8')
+
+
+def snapshot(workshop_id=None):
+	"""Rows for the current state of one workshop, or of every active one."""
+	qs = Workshop.objects.values(*FIELDS).order_by('id')
+	return qs.filter(pk=workshop_id) if workshop_id is not None else qs.filter(status='active')
+
+
+def watch(workshop_id, deliver):
+	"""Call ``deliver(event)`` for changes to ``workshop_id`` (None: any active workshop).
+
+	``deliver`` is called from whichever thread publishes and must not block.
+	Returns a token for ``unwatch()``.
+	"""
+	global _poller
+	token = object()
+	with _lock:
+		_watchers[token] = (workshop_id, deliver)
+		if settings.LIVE_POLL_INTERVAL and _poller is None:
+			_poller = threading.Thread(target=_poll, name='live-seats', daemon=True)
+			_poller.start()
+	return token
+
+
+def unwatch(token) -> None:
+	with _lock:
+		_watchers.pop(token, None)
+		if not _watchers:
+			_last.clear()
+
+
+def publish(rows) -> None:
+	"""Send each row's seat state to its watchers, unless it's what they last got."""
+	for row in rows:
+		data = event(row)
+		with _lock:
+			# The status decides who gets it (all-active watchers), so a workshop
+			# activated with unchanged counts is still news.
+			if _last.get(row['id']) == (row['status'], data):
+				continue
+			_last[row['id']] = (row['status'], data)
+			targets = [
+				deliver for workshop_id, deliver in _watchers.values()
+				if workshop_id == row['id'] or (workshop_id is None and row['status'] == 'active')
+			]
+		for deliver in targets:
+			try:
+				deliver(data)
+			except Exception:
+				# e.g. the watcher's event loop already closed; its stream will unwatch.
+				logger.debug("Dropped seat event for a closed watcher", exc_info=True)
+
+
+def changed(workshop_id) -> None:
+	"""Publish ``workshop_id``'s seats once the current transaction commits, if anyone is watching."""
+	if _watchers:
+		transaction.on_commit(lambda: publish(snapshot(workshop_id)))
+
+
+def poll(since):
+	"""Publish workshops updated since ``since``; returns the next ``since``."""
+	rows = list(Workshop.objects.filter(updated_at__gte=since).values(*FIELDS, 'updated_at'))
+	publish(rows)
+	return max((row['updated_at'] - POLL_OVERLAP for row in rows), default=since)
+
+
+def _poll() -> None:
+	global _poller
+	since = timezone.now() - POLL_OVERLAP
+	while True:
+		time.sleep(settings.LIVE_POLL_INTERVAL)
+		with _lock:
+			if not _watchers:
+				_poller = None
+				return
+		try:
+			close_old_connections()
+			since = poll(since)
+		except Exception:
+			logger.exception("Seat availability poll failed")
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+
+from api import thumbnails
+from api.models import Workshop
+
+
+class Command(BaseCommand):
+	help = "Build missing or outdated responsive image renditions for workshops."
+
+	def handle(self, *args, **options):
+		built = 0
+		for ws in Workshop.objects.only('id', 'image', 'payment_qr', 'image_derivatives', 'payment_qr_derivatives').iterator():
+			updates = {}
+			for field_name in ('image', 'payment_qr'):
+				field_file = getattr(ws, field_name)
+				if thumbnails.derivatives_stale(field_file, getattr(ws, f'{field_name}_derivatives')):
+					updates[f'{field_name}_derivatives'] = thumbnails.build_derivatives(field_file)
+			if updates:
+				# .save() so the usual signals refresh updated_at and the API cache.
+				for field, manifest in updates.items():
+					setattr(ws, field, manifest)
+				ws.save(update_fields=[*updates, 'updated_at'])
+				built += 1
+		self.stdout.write(f"Built renditions for {built} workshop(s).")
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from api import ingest
+
+
+class Command(BaseCommand):
+	help = "Write spooled contact submissions (CONTACT_INGEST_MODE=buffered) to the database."
+
+	def handle(self, *args, **options):
+		self.stdout.write(f"Flushed {ingest.flush()} spooled submissions.")
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from api import stored_files
+
+
+class Command(BaseCommand):
+	help = "Delete uploaded images and renditions that no row references any more."
+
+	def add_arguments(self, parser):
+		parser.add_argument('--dry-run', action='store_true', help="List what would be deleted.")
+		parser.add_argument('--grace', type=int, help="Only files untouched for this many seconds (default MEDIA_GC_GRACE).")
+
+	def handle(self, *args, **options):
+		removed = stored_files.collect_garbage(grace=options['grace'], dry_run=options['dry_run'])
+		for name in removed:
+			self.stdout.write(name, style_func=None)
+		verb = "Would delete" if options['dry_run'] else "Deleted"
+		self.stdout.write(f"{verb} {len(removed)} file(s).")
@@ -0,0 +1,25 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from api import jobs
+
+
+class Command(BaseCommand):
+	help = "Run queued admin export jobs (CSV, XLSX, Google Sheets)."
+
+	def add_arguments(self, parser):
+		parser.add_argument('--once', action='store_true', help="Drain the queue, then exit.")
+		parser.add_argument('--interval', type=float, default=2.0, help="Seconds to sleep when the queue is empty.")
+
+	def handle(self, *args, **options):
+		while True:
+			close_old_connections()
+			job = jobs.run_next()
+			if job is not None:
+				self.stdout.write(f"{job}: {job.result or job.error.splitlines()[-1]}")
+				continue
+			if options['once']:
+				return
+			time.sleep(options['interval'])
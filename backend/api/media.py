@@ -0,0 +1,144 @@
+"""Serving for user-uploaded media (``MEDIA_ROOT``).
+
+``MEDIA_SERVE_MODE`` picks how bytes leave the process:
+
+* ``x-accel-redirect`` -- nginx serves ``MEDIA_ACCEL_REDIRECT_PREFIX + path``.
+* ``x-sendfile`` -- Apache/lighttpd serve the absolute file path.
+* ``django`` -- serve in-process for single-dyno deployments. Whole files go
+  through ``wsgi.file_wrapper`` (sendfile under gunicorn); responses carry an
+  ETag, honour If-None-Match/If-Modified-Since and single byte ranges.
+
+Payment proofs are personal data: only signed-in staff (the admin) get them,
+and never from a cache. Content-hashed workshop images, QR codes and their
+renditions are cached as immutable.
+"""
+import mimetypes
+import os
+import re
+import stat
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_http_date_safe
+from django.views.decorators.http import require_safe
+
+PRIVATE_DIRS = ('workshops/proofs/',)
+PUBLIC_IMAGE_DIRS = ('workshops/images/', 'workshops/qr/')
+# Names produced by api.thumbnails.build_derivatives and other content-hashed writers.
+HASHED_NAME_RE = re.compile(r'(?:^|/)[0-9a-f]{16,64}(?:-\d+w)?\.[A-Za-z0-9]+$')
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+# As FileResponse maps them; no Content-Encoding is ever sent.
+ENCODED_TYPES = {'bzip2': 'application/x-bzip', 'gzip': 'application/gzip', 'xz': 'application/x-xz'}
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+CHUNK_SIZE = 64 * 1024
+
+
+def _cache_control(path: str) -> str:
+	if path.startswith(PRIVATE_DIRS):
+		return 'private, no-store'
+	if path.startswith(PUBLIC_IMAGE_DIRS) and HASHED_NAME_RE.search(path):
+		return f'public, max-age={IMMUTABLE_MAX_AGE}, immutable'
+	return f'public, max-age={settings.MEDIA_CACHE_MAX_AGE}'
+
+
+def _parse_range(header: str, size: int):
+	"""Return ``(start, end)`` inclusive for a single byte range, None to ignore it, or raise ValueError if unsatisfiable."""
+	match = RANGE_RE.match(header.strip())
+	if not match or match.groups() == ('', ''):
+		return None
+	first, last = match.groups()
+	if first == '':
+		length = int(last)
+		if length == 0:
+			raise ValueError
+		return max(0, size - length), size - 1
+	start = int(first)
+	end = min(int(last), size - 1) if last else size - 1
+	if start >= size or start > end:
+		raise ValueError
+	return start, end
+
+
+def _iter_range(fh, start: int, length: int):
+	with fh:
+		fh.seek(start)
+		while length > 0:
+			chunk = fh.read(min(CHUNK_SIZE, length))
+			if not chunk:
+				break
+			length -= len(chunk)
+			yield chunk
+
+
+@require_safe
+def serve_media(request, path):
+	try:
+		fullpath = safe_join(settings.MEDIA_ROOT, path)
+		st = os.stat(fullpath)
+	except (SuspiciousFileOperation, OSError):
+		raise Http404("Media file not found")
+	if not stat.S_ISREG(st.st_mode):
+		raise Http404("Media file not found")
+	# Decide access on the resolved name, not the URL (e.g. "workshops//proofs/").
+	path = os.path.relpath(fullpath, settings.MEDIA_ROOT).replace(os.sep, '/')
+	if path.startswith(PRIVATE_DIRS) and not (request.user.is_active and request.user.is_staff):
+		raise Http404("Media file not found")
+	content_type, encoding = mimetypes.guess_type(fullpath)
+	if encoding:
+		# "data.csv.gz" is a gzip file to download, not CSV to decompress on the fly.
+		content_type = ENCODED_TYPES.get(encoding, 'application/octet-stream')
+	content_type = content_type or 'application/octet-stream'
+	mode = settings.MEDIA_SERVE_MODE
+
+	if mode in ('x-accel-redirect', 'x-sendfile'):
+		response = HttpResponse(content_type=content_type)
+		if mode == 'x-accel-redirect':
+			response['X-Accel-Redirect'] = settings.MEDIA_ACCEL_REDIRECT_PREFIX.rstrip('/') + '/' + path
+		else:
+			response['X-Sendfile'] = fullpath
+		response['Cache-Control'] = _cache_control(path)
+		return response
+
+	etag = f'"{st.st_mtime_ns:x}-{st.st_size:x}"'
+	headers = {
+		'ETag': etag,
+		'Last-Modified': http_date(st.st_mtime),
+		'Cache-Control': _cache_control(path),
+		'Accept-Ranges': 'bytes',
+	}
+	if_none_match = request.headers.get('If-None-Match')
+	if if_none_match:
+		not_modified = etag in [t.strip() for t in if_none_match.split(',')] or if_none_match.strip() == '*'
+	else:
+		since = parse_http_date_safe(request.headers.get('If-Modified-Since', ''))
+		not_modified = since is not None and int(st.st_mtime) <= since
+	if not_modified:
+		response = HttpResponseNotModified()
+		for key, value in headers.items():
+			response[key] = value
+		return response
+
+	byte_range = None
+	range_header = request.headers.get('Range')
+	if range_header and request.headers.get('If-Range', etag) == etag:
+		try:
+			byte_range = _parse_range(range_header, st.st_size)
+		except ValueError:
+			response = HttpResponse(status=416)
+			response['Content-Range'] = f'bytes */{st.st_size}'
+			return response
+
+	if byte_range is None:
+		# FileResponse exposes the file to wsgi.file_wrapper, i.e. sendfile().
+		response = FileResponse(open(fullpath, 'rb'), content_type=content_type)
+	else:
+		start, end = byte_range
+		length = end - start + 1
+		response = StreamingHttpResponse(_iter_range(open(fullpath, 'rb'), start, length), status=206, content_type=content_type)
+		response['Content-Range'] = f'bytes {start}-{end}/{st.st_size}'
+		response['Content-Length'] = str(length)
+	for key, value in headers.items():
+		response[key] = value
+	return response
@@ -0,0 +1,273 @@
+"""Prometheus metrics aggregated across worker processes.
+
+Off unless ``METRICS_ENABLED``. Every process (gunicorn workers,
+``run_export_jobs``) keeps its counters and histograms in memory and writes
+them to ``METRICS_DIR/<pid>-<start time>.json`` at most every
+``METRICS_FLUSH_INTERVAL`` seconds. ``/api/metrics`` sums all the files, so
+whichever worker answers the scrape reports totals for the whole instance.
+Counters must never go backwards, so the files of exited processes aren't
+just dropped: each scrape folds them into ``archive.json`` and deletes them,
+which keeps the directory as small as the number of live processes (on Unix;
+elsewhere they stay). The start time in the name stops a new process that
+gets a recycled pid from overwriting a file not folded in yet.
+
+Recorded here:
+
+* ``http_requests_total`` / ``http_request_duration_seconds`` per URL name,
+  by ``MetricsMiddleware``;
+* ``workshop_registrations_total`` per workshop, from the registration signal;
+* ``export_job_duration_seconds`` per job kind and outcome, by ``api.jobs``;
+* ``db_connections_created_total`` and ``db_connection_reuses_total``: how
+  often a request found its persistent connection (``CONN_MAX_AGE``) open.
+"""
+import atexit
+import contextlib
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+try:
+	import fcntl
+except ImportError:  # Windows: no compaction
+	fcntl = None
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+JOB_BUCKETS = (1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0)
+ARCHIVE = 'archive.json'
+LOCK = '.lock'
+
+METRICS = {
+	'http_requests_total': ('counter', "HTTP requests by URL name, method and status."),
+	'http_request_duration_seconds': ('histogram', "HTTP request latency by URL name."),
+	'workshop_registrations_total': ('counter', "Registrations created per workshop."),
+	'export_job_duration_seconds': ('histogram', "Admin export job run time by kind and status."),
+	'db_connections_created_total': ('counter', "Database connections opened."),
+	'db_connection_reuses_total': ('counter', "Requests that reused an already open database connection."),
+}
+
+_lock = threading.Lock()
+_counters = defaultdict(lambda: defaultdict(float))
+_histograms = defaultdict(dict)
+_last_flush = 0.0
+_file_name = None
+
+
+def _reset():
+	global _last_flush, _file_name
+	_counters.clear()
+	_histograms.clear()
+	_last_flush = 0.0
+	_file_name = None
+
+
+# A forked worker must not re-report what its parent had already counted.
+os.register_at_fork(after_in_child=_reset)
+
+
+def _escape(value) -> str:
+	return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels: dict) -> str:
+	return ','.join(f'{key}="{_escape(value)}"' for key, value in sorted(labels.items()))
+
+
+def inc(name: str, labels: dict, value: float = 1) -> None:
+	if not settings.METRICS_ENABLED:
+		return
+	with _lock:
+		_counters[name][_labels(labels)] += value
+	_maybe_flush()
+
+
+def observe(name: str, labels: dict, value: float, buckets=LATENCY_BUCKETS) -> None:
+	if not settings.METRICS_ENABLED:
+		return
+	with _lock:
+		series = _histograms[name].setdefault(_labels(labels), {'le': list(buckets), 'buckets': [0] * len(buckets), 'sum': 0.0, 'count': 0})
+		for i, bound in enumerate(series['le']):
+			if value <= bound:
+				series['buckets'][i] += 1
+		series['sum'] += value
+		series['count'] += 1
+	_maybe_flush()
+
+
+def _path() -> str:
+	global _file_name
+	if _file_name is None:
+		_file_name = f'{os.getpid()}-{time.time_ns()}.json'
+	return os.path.join(str(settings.METRICS_DIR), _file_name)
+
+
+def flush() -> None:
+	"""Write this process's metrics file (atomically); does nothing unless ``METRICS_ENABLED``."""
+	global _last_flush
+	if not settings.METRICS_ENABLED:
+		return
+	with _lock:
+		os.makedirs(str(settings.METRICS_DIR), exist_ok=True)
+		_write(_path(), {'counters': _counters, 'histograms': _histograms})
+		_last_flush = time.monotonic()
+
+
+def _maybe_flush() -> None:
+	if time.monotonic() - _last_flush >= settings.METRICS_FLUSH_INTERVAL:
+		flush()
+
+
+atexit.register(lambda: (_counters or _histograms) and flush())
+
+
+def _read(path):
+	try:
+		with open(path, encoding='utf-8') as fh:
+			return json.load(fh)
+	except (OSError, ValueError):
+		return None
+
+
+def _write(path, data) -> None:
+	tmp = f'{path}.tmp'
+	with open(tmp, 'w', encoding='utf-8') as fh:
+		json.dump(data, fh)
+	os.replace(tmp, path)
+
+
+def _add(totals: tuple, data: dict) -> None:
+	counters, histograms = totals
+	for metric, series in data['counters'].items():
+		for labels, value in series.items():
+			counters[metric][labels] += value
+	for metric, series in data['histograms'].items():
+		for labels, hist in series.items():
+			total = histograms[metric].setdefault(labels, {'le': hist['le'], 'buckets': [0] * len(hist['le']), 'sum': 0.0, 'count': 0})
+			total['buckets'] = [a + b for a, b in zip(total['buckets'], hist['buckets'])]
+			total['sum'] += hist['sum']
+			total['count'] += hist['count']
+
+
+def _exited(name: str) -> bool:
+	try:
+		pid = int(name.removesuffix('.json').split('-', 1)[0])
+	except ValueError:
+		return False
+	if pid == os.getpid():
+		return False
+	try:
+		os.kill(pid, 0)
+	except ProcessLookupError:
+		return True
+	except OSError:
+		pass
+	return False
+
+
+def _compact(directory: str, names: list) -> None:
+	"""Fold the files of exited processes into ``ARCHIVE`` and delete them."""
+	path = os.path.join(directory, ARCHIVE)
+	archive = _read(path) or {'counters': {}, 'histograms': {}, 'merged': []}
+	exited = [name for name in names if name != ARCHIVE and name not in archive['merged'] and _exited(name)]
+	if exited:
+		totals = (defaultdict(lambda: defaultdict(float)), defaultdict(dict))
+		_add(totals, archive)
+		for name in exited:
+			data = _read(os.path.join(directory, name))
+			if data:
+				_add(totals, data)
+		# Merged names are recorded until their files are gone, so a crash
+		# between the two steps can't count them twice.
+		archive = {'counters': totals[0], 'histograms': totals[1], 'merged': archive['merged'] + exited}
+		_write(path, archive)
+	if archive['merged']:
+		for name in archive['merged']:
+			with contextlib.suppress(FileNotFoundError):
+				os.remove(os.path.join(directory, name))
+		_write(path, {**archive, 'merged': []})
+
+
+def collect() -> tuple:
+	"""Sum every process file into ``(counters, histograms)``."""
+	totals = (defaultdict(lambda: defaultdict(float)), defaultdict(dict))
+	directory = str(settings.METRICS_DIR)
+	if not os.path.isdir(directory):
+		return totals
+	with open(os.path.join(directory, LOCK), 'a') as lock:
+		if fcntl is not None:
+			# One scrape at a time, so none reads the files mid-compaction.
+			fcntl.flock(lock, fcntl.LOCK_EX)
+			_compact(directory, [name for name in os.listdir(directory) if name.endswith('.json')])
+		for name in os.listdir(directory):
+			data = _read(os.path.join(directory, name)) if name.endswith('.json') else None
+			if data:
+				_add(totals, data)
+	return totals
+
+
+def _join(labels: str, extra: str) -> str:
+	return '{' + ','.join(part for part in (labels, extra) if part) + '}'
+
+
+def render() -> str:
+	"""Prometheus text exposition (version 0.0.4) for the whole instance."""
+	flush()
+	counters, histograms = collect()
+	lines = []
+	for metric, (kind, help_text) in METRICS.items():
+		lines += [f'# HELP {metric} {help_text}', f'# TYPE {metric} {kind}']
+		if kind == 'counter':
+			for labels, value in sorted(counters.get(metric, {}).items()):
+				lines.append(f'{metric}{_join(labels, "")} {value:g}')
+			continue
+		for labels, hist in sorted(histograms.get(metric, {}).items()):
+			for bound, count in zip(hist['le'], hist['buckets']):
+				lines.append(f'{metric}_bucket{_join(labels, _labels({"le": f"{bound:g}"}))} {count}')
+			lines.append(f'{metric}_bucket{_join(labels, _labels({"le": "+Inf"}))} {hist["count"]}')
+			lines.append(f'{metric}_sum{_join(labels, "")} {hist["sum"]:g}')
+			lines.append(f'{metric}_count{_join(labels, "")} {hist["count"]}')
+	return '\n'.join(lines) + '\n'
+
+
+class MetricsMiddleware:
+	sync_capable = True
+	async_capable = True
+
+	def __init__(self, get_response):
+		if not settings.METRICS_ENABLED:
+			raise MiddlewareNotUsed
+		self.get_response = get_response
+		if iscoroutinefunction(get_response):
+			markcoroutinefunction(self)
+
+	def __call__(self, request):
+		if iscoroutinefunction(self):
+			return self.__acall__(request)
+		open_before = {conn.alias: conn.connection for conn in connections.all() if conn.connection is not None}
+		started = time.perf_counter()
+		response = self.get_response(request)
+		self._record(request, response, time.perf_counter() - started)
+		for alias, raw in open_before.items():
+			if connections[alias].connection is raw:
+				inc('db_connection_reuses_total', {'alias': alias})
+		return response
+
+	async def __acall__(self, request):
+		# Connections live in sync_to_async's worker threads under ASGI, so
+		# reuses aren't visible from here; only connections created are counted.
+		started = time.perf_counter()
+		response = await self.get_response(request)
+		self._record(request, response, time.perf_counter() - started)
+		return response
+
+	def _record(self, request, response, elapsed):
+		match = getattr(request, 'resolver_match', None)
+		view = (match.url_name or match.view_name) if match else 'unmatched'
+		inc('http_requests_total', {'view': view, 'method': request.method, 'status': response.status_code})
+		observe('http_request_duration_seconds', {'view': view}, elapsed)
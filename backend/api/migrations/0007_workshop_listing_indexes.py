@@ -0,0 +1,25 @@
+# Generated by Django 5.2.6 on 2026-10-18 05:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0006_workshop_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='workshop',
+            index=models.Index(fields=['-date', '-id'], name='workshop_date_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='workshop',
+            index=models.Index(fields=['status', '-date', '-id'], name='workshop_status_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='workshop',
+            index=models.Index(fields=['venue', '-date', '-id'], name='workshop_venue_date_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.6 on 2026-10-18 05:27
+
+from django.db import migrations, models
+
+
+def backfill_seats_taken(apps, schema_editor):
+    Workshop = apps.get_model('api', 'Workshop')
+    for ws in Workshop.objects.annotate(reg_count=models.Count('registrations')):
+        Workshop.objects.filter(pk=ws.pk).update(seats_taken=ws.reg_count)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0007_workshop_listing_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='workshop',
+            name='seats_taken',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_seats_taken, migrations.RunPython.noop),
+    ]
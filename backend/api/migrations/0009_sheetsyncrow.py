@@ -0,0 +1,29 @@
+# Generated by Django 5.2.6 on 2026-10-18 05:31
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0008_workshop_seats_taken'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SheetSyncRow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('spreadsheet_id', models.CharField(max_length=128)),
+                ('worksheet', models.CharField(max_length=100)),
+                ('row_number', models.PositiveIntegerField()),
+                ('checksum', models.CharField(max_length=40)),
+                ('synced_at', models.DateTimeField(auto_now=True)),
+                ('registration', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='sheet_rows', to='api.workshopregistration')),
+            ],
+            options={
+                'unique_together': {('spreadsheet_id', 'worksheet', 'registration')},
+            },
+        ),
+    ]
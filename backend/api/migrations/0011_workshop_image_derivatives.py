@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-18 05:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0010_exportjob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='workshop',
+            name='image_derivatives',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+        migrations.AddField(
+            model_name='workshop',
+            name='payment_qr_derivatives',
+            field=models.JSONField(blank=True, default=dict, editable=False),
+        ),
+    ]
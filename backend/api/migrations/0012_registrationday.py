@@ -0,0 +1,39 @@
+# Generated by Django 5.2.6 on 2026-10-18 05:39
+
+from django.db import migrations, models
+from django.db.models.functions import TruncDate
+
+
+def backfill_registration_days(apps, schema_editor):
+    WorkshopRegistration = apps.get_model('api', 'WorkshopRegistration')
+    RegistrationDay = apps.get_model('api', 'RegistrationDay')
+    rows = (
+        WorkshopRegistration.objects
+        .annotate(day=TruncDate('created_at'))
+        .values('day')
+        .annotate(count=models.Count('id'))
+        .order_by()
+    )
+    RegistrationDay.objects.bulk_create([RegistrationDay(day=row['day'], count=row['count']) for row in rows])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0011_workshop_image_derivatives'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RegistrationDay',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(unique=True)),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ('day',),
+            },
+        ),
+        migrations.RunPython(backfill_registration_days, migrations.RunPython.noop),
+    ]
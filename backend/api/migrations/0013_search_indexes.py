@@ -0,0 +1,100 @@
+from django.db import migrations
+
+# Frozen copy of the DDL api.search had when this migration was written; later
+# changes to api.search must not change what this migration does.
+SQLITE_INDEXES = (
+    (
+        'api_registration_search',
+        "CREATE VIRTUAL TABLE api_registration_search USING fts5(name, email, workshop_title, tokenize='trigram')",
+        "INSERT INTO api_registration_search(rowid, name, email, workshop_title) "
+        "SELECT r.id, r.name, r.email, w.title FROM api_workshopregistration r "
+        "JOIN api_workshop w ON w.id = r.workshop_id",
+        (
+            ('api_registration_search_ai', """CREATE TRIGGER IF NOT EXISTS api_registration_search_ai AFTER INSERT ON api_workshopregistration BEGIN
+                INSERT INTO api_registration_search(rowid, name, email, workshop_title)
+                VALUES (new.id, new.name, new.email, (SELECT title FROM api_workshop WHERE id = new.workshop_id));
+            END"""),
+            ('api_registration_search_au', """CREATE TRIGGER IF NOT EXISTS api_registration_search_au AFTER UPDATE OF name, email, workshop_id ON api_workshopregistration BEGIN
+                UPDATE api_registration_search SET name = new.name, email = new.email,
+                    workshop_title = (SELECT title FROM api_workshop WHERE id = new.workshop_id)
+                WHERE rowid = new.id;
+            END"""),
+            ('api_registration_search_ad', """CREATE TRIGGER IF NOT EXISTS api_registration_search_ad AFTER DELETE ON api_workshopregistration BEGIN
+                DELETE FROM api_registration_search WHERE rowid = old.id;
+            END"""),
+            ('api_registration_search_wu', """CREATE TRIGGER IF NOT EXISTS api_registration_search_wu AFTER UPDATE OF title ON api_workshop BEGIN
+                UPDATE api_registration_search SET workshop_title = new.title
+                WHERE rowid IN (SELECT id FROM api_workshopregistration WHERE workshop_id = new.id);
+            END"""),
+        ),
+    ),
+    (
+        'api_contact_search',
+        "CREATE VIRTUAL TABLE api_contact_search USING fts5(name, email, service, tokenize='trigram')",
+        "INSERT INTO api_contact_search(rowid, name, email, service) "
+        "SELECT id, name, email, service FROM api_contactsubmission",
+        (
+            ('api_contact_search_ai', """CREATE TRIGGER IF NOT EXISTS api_contact_search_ai AFTER INSERT ON api_contactsubmission BEGIN
+                INSERT INTO api_contact_search(rowid, name, email, service) VALUES (new.id, new.name, new.email, new.service);
+            END"""),
+            ('api_contact_search_au', """CREATE TRIGGER IF NOT EXISTS api_contact_search_au AFTER UPDATE OF name, email, service ON api_contactsubmission BEGIN
+                UPDATE api_contact_search SET name = new.name, email = new.email, service = new.service WHERE rowid = new.id;
+            END"""),
+            ('api_contact_search_ad', """CREATE TRIGGER IF NOT EXISTS api_contact_search_ad AFTER DELETE ON api_contactsubmission BEGIN
+                DELETE FROM api_contact_search WHERE rowid = old.id;
+            END"""),
+        ),
+    ),
+)
+
+POSTGRES_INDEXES = (
+    ('api_workshopregistration', 'name'),
+    ('api_workshopregistration', 'email'),
+    ('api_workshop', 'title'),
+    ('api_contactsubmission', 'name'),
+    ('api_contactsubmission', 'email'),
+    ('api_contactsubmission', 'service'),
+)
+
+
+def install_search_indexes(apps, schema_editor):
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            for table, create, fill, triggers in SQLITE_INDEXES:
+                cursor.execute(f"DROP TABLE IF EXISTS {table}")
+                cursor.execute(create)
+                cursor.execute(fill)
+                for _name, trigger in triggers:
+                    cursor.execute(trigger)
+        elif connection.vendor == 'postgresql':
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+            for table, column in POSTGRES_INDEXES:
+                cursor.execute(
+                    f'CREATE INDEX IF NOT EXISTS {table}_{column}_trgm '
+                    f'ON {table} USING gin ((UPPER("{column}"::text)) gin_trgm_ops)'
+                )
+
+
+def drop_search_indexes(apps, schema_editor):
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        if connection.vendor == 'sqlite':
+            for table, _create, _fill, triggers in SQLITE_INDEXES:
+                cursor.execute(f"DROP TABLE IF EXISTS {table}")
+                for name, _trigger in triggers:
+                    cursor.execute(f"DROP TRIGGER IF EXISTS {name}")
+        elif connection.vendor == 'postgresql':
+            for table, column in POSTGRES_INDEXES:
+                cursor.execute(f"DROP INDEX IF EXISTS {table}_{column}_trgm")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0012_registrationday'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search_indexes, drop_search_indexes),
+    ]
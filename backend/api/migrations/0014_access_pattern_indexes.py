@@ -0,0 +1,37 @@
+# Generated by Django 5.2.6 on 2026-10-18 05:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0013_search_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='contactsubmission',
+            index=models.Index(fields=['service', '-created_at'], name='contact_service_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='contactsubmission',
+            index=models.Index(fields=['created_at'], name='contact_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='workshopregistration',
+            index=models.Index(fields=['workshop', 'status', '-created_at'], name='reg_workshop_status_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='workshopregistration',
+            index=models.Index(fields=['workshop', '-created_at'], name='reg_workshop_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='workshopregistration',
+            index=models.Index(fields=['status', '-created_at'], name='reg_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='workshopregistration',
+            index=models.Index(fields=['created_at'], name='reg_created_idx'),
+        ),
+    ]
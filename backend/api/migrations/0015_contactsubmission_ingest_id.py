@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 05:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0014_access_pattern_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='contactsubmission',
+            name='ingest_id',
+            field=models.CharField(blank=True, editable=False, max_length=26, null=True, unique=True),
+        ),
+    ]
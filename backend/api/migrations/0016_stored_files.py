@@ -0,0 +1,62 @@
+# Generated by Django 5.2.6 on 2026-10-18 06:13
+
+from collections import Counter
+
+import api.storage
+from django.db import migrations, models
+
+
+def backfill_stored_files(apps, schema_editor):
+    StoredFile = apps.get_model('api', 'StoredFile')
+    refs = Counter()
+    for model_name, fields in (('Workshop', ('image', 'payment_qr')), ('WorkshopRegistration', ('payment_proof',))):
+        model = apps.get_model('api', model_name)
+        for field in fields:
+            rows = model.objects.exclude(**{f'{field}__isnull': True}).exclude(**{field: ''}).values(field).annotate(n=models.Count('id')).order_by()
+            for row in rows:
+                refs[row[field]] += row['n']
+    StoredFile.objects.bulk_create([StoredFile(name=name, refs=n) for name, n in refs.items()], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0015_contactsubmission_ingest_id'),
+    ]
+
+    operations = [
+        # Storage is Python-only; altering it in the database would make SQLite
+        # rebuild tables under the search triggers.
+        migrations.SeparateDatabaseAndState(
+            state_operations=[
+                migrations.AlterField(
+                    model_name='workshop',
+                    name='image',
+                    field=models.ImageField(blank=True, null=True, storage=api.storage.content_addressed_storage, upload_to='workshops/images/'),
+                ),
+                migrations.AlterField(
+                    model_name='workshop',
+                    name='payment_qr',
+                    field=models.ImageField(blank=True, null=True, storage=api.storage.content_addressed_storage, upload_to='workshops/qr/'),
+                ),
+                migrations.AlterField(
+                    model_name='workshopregistration',
+                    name='payment_proof',
+                    field=models.ImageField(blank=True, null=True, storage=api.storage.content_addressed_storage, upload_to='workshops/proofs/'),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name='StoredFile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('refs', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['refs', 'updated_at'], name='storedfile_gc_idx')],
+            },
+        ),
+        migrations.RunPython(backfill_stored_files, migrations.RunPython.noop),
+    ]
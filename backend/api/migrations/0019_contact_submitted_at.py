@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-18 06:37
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0018_export_job_recovery'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='contactsubmission',
+            name='created_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False),
+        ),
+    ]
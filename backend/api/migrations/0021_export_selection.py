@@ -0,0 +1,25 @@
+# Generated by Django 5.2.6 on 2026-10-18 06:57
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0020_idempotency_fingerprint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportSelection',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('job', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='selection', to='api.exportjob')),
+                ('registration', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='api.workshopregistration')),
+            ],
+            options={
+                'unique_together': {('job', 'registration')},
+            },
+        ),
+    ]
@@ -1,4 +1,13 @@
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import FileSystemStorage, Storage
 from django.db import models
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .storage import content_addressed_storage
 
 # Create your models here.
 
@@ -8,12 +17,41 @@ class ContactSubmission(models.Model):
 	email = models.EmailField()
 	service = models.CharField(max_length=100, blank=True)
 	message = models.TextField()
-	created_at = models.DateTimeField(auto_now_add=True)
+	# ULID acknowledged to the client by buffered ingest (api.ingest); unique so
+	# replaying a spool file after a crash can't insert a submission twice.
+	ingest_id = models.CharField(max_length=26, unique=True, null=True, blank=True, editable=False)
+	# A default rather than auto_now_add, so buffered ingest can keep the time
+	# the submission was made instead of the time its batch was written.
+	created_at = models.DateTimeField(default=timezone.now, editable=False)
+
+	class Meta:
+		# Admin "service" and "created at" filters.
+		indexes = [
+			models.Index(fields=['service', '-created_at'], name='contact_service_idx'),
+			models.Index(fields=['created_at'], name='contact_created_idx'),
+		]
 
 	def __str__(self) -> str:
 		return f"{self.name} <{self.email}> @ {self.created_at:%Y-%m-%d %H:%M}"
 
 
+class WorkshopQuerySet(models.QuerySet):
+	def reserve_seat(self, workshop_id) -> bool:
+		"""Atomically take one seat; returns False when the workshop is full."""
+		updated = self.filter(pk=workshop_id, seats_taken__lt=models.F('capacity')).update(
+			seats_taken=models.F('seats_taken') + 1,
+		)
+		return updated == 1
+
+	def release_seat(self, workshop_id) -> None:
+		self.filter(pk=workshop_id, seats_taken__gt=0).update(seats_taken=models.F('seats_taken') - 1)
+
+	def recount_seats(self) -> int:
+		"""Recompute seats_taken from the registrations, after writes that skip the signals (bulk_create, raw SQL)."""
+		taken = WorkshopRegistration.objects.filter(workshop=models.OuterRef('pk')).order_by().values('workshop').annotate(n=models.Count('id')).values('n')
+		return self.update(seats_taken=Coalesce(models.Subquery(taken), 0))
+
+
 class Workshop(models.Model):
 	title = models.CharField(max_length=200)
 	description = models.TextField(blank=True)
@@ -23,21 +61,39 @@ class Workshop(models.Model):
 	venue = models.CharField(max_length=200)
 	perks = models.TextField(blank=True)
 	capacity = models.PositiveIntegerField(default=30)
-	image = models.ImageField(upload_to='workshops/images/', blank=True, null=True)
+	# Denormalized registrations count, kept in step by reserve_seat() and the
+	# registration signals so reads never need a COUNT(*).
+	seats_taken = models.PositiveIntegerField(default=0, editable=False)
+	image = models.ImageField(upload_to='workshops/images/', storage=content_addressed_storage, blank=True, null=True)
 	status = models.CharField(max_length=16, choices=(("active", "Active"), ("inactive", "Inactive")), default="active")
-	payment_qr = models.ImageField(upload_to='workshops/qr/', blank=True, null=True)
+	payment_qr = models.ImageField(upload_to='workshops/qr/', storage=content_addressed_storage, blank=True, null=True)
+	# Manifests of responsive renditions written by api.thumbnails.build_derivatives().
+	image_derivatives = models.JSONField(default=dict, blank=True, editable=False)
+	payment_qr_derivatives = models.JSONField(default=dict, blank=True, editable=False)
 	upi_id = models.CharField(max_length=128, blank=True)
 	bank_name = models.CharField(max_length=128, blank=True)
 	account_no = models.CharField(max_length=64, blank=True)
 	amount = models.DecimalField(max_digits=10, decimal_places=2, default=0)
 	created_at = models.DateTimeField(auto_now_add=True)
+	updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+	objects = WorkshopQuerySet.as_manager()
+
+	class Meta:
+		# Keyset pagination in WorkshopsView orders by (-date, -id), optionally
+		# after an equality filter on status or venue.
+		indexes = [
+			models.Index(fields=['-date', '-id'], name='workshop_date_id_idx'),
+			models.Index(fields=['status', '-date', '-id'], name='workshop_status_date_idx'),
+			models.Index(fields=['venue', '-date', '-id'], name='workshop_venue_date_idx'),
+		]
 
 	def __str__(self) -> str:
 		return self.title
 
 	@property
 	def registrations_count(self) -> int:
-		return self.registrations.count()
+		return self.seats_taken
 
 	@property
 	def is_sold_out(self) -> bool:
@@ -50,7 +106,7 @@ class WorkshopRegistration(models.Model):
 	email = models.EmailField()
 	whatsapp = models.CharField(max_length=30, blank=True)
 	organization = models.CharField(max_length=200, blank=True)
-	payment_proof = models.ImageField(upload_to='workshops/proofs/', blank=True, null=True)
+	payment_proof = models.ImageField(upload_to='workshops/proofs/', storage=content_addressed_storage, blank=True, null=True)
 	status = models.CharField(
 		max_length=20,
 		choices=(
@@ -65,6 +121,182 @@ class WorkshopRegistration(models.Model):
 
 	class Meta:
 		unique_together = ("workshop", "email")
+		indexes = [
+			# Per-workshop status breakdowns and the inline's status filter,
+			# both ordered newest first.
+			models.Index(fields=['workshop', 'status', '-created_at'], name='reg_workshop_status_idx'),
+			models.Index(fields=['workshop', '-created_at'], name='reg_workshop_created_idx'),
+			# Registration admin status filter and the dashboard aggregate.
+			models.Index(fields=['status', '-created_at'], name='reg_status_created_idx'),
+			# created_at ranges: admin date filter and exports.
+			models.Index(fields=['created_at'], name='reg_created_idx'),
+		]
+
+	def __str__(self) -> str:
+		return f"{self.name} - {self.workshop.title}"
+
+class RegistrationDay(models.Model):
+	"""Registrations created per day, maintained by the registration signals
+	so the dashboard time series never scans WorkshopRegistration."""
+	day = models.DateField(unique=True)
+	count = models.PositiveIntegerField(default=0)
+
+	class Meta:
+		ordering = ("day",)
+
+	def __str__(self) -> str:
+		return f"{self.day}: {self.count}"
+
+
+class StoredFile(models.Model):
+	"""How many rows reference a file in content-addressed storage (see api.stored_files)."""
+	name = models.CharField(max_length=255, unique=True)
+	refs = models.IntegerField(default=0)
+	updated_at = models.DateTimeField(auto_now=True)
+
+	class Meta:
+		# gc_media: unreferenced files, oldest first.
+		indexes = [models.Index(fields=['refs', 'updated_at'], name='storedfile_gc_idx')]
+
+	def __str__(self) -> str:
+		return f"{self.name} ({self.refs} refs)"
+
+
+class IdempotencyKey(models.Model):
+	"""A client's Idempotency-Key for a POST, and the response it got (see api.idempotency)."""
+	path = models.CharField(max_length=255)
+	key = models.CharField(max_length=255)
+	# Null while the first request with the key is still running.
+	status_code = models.PositiveSmallIntegerField(null=True, blank=True)
+	content_type = models.CharField(max_length=100, blank=True)
+	body = models.BinaryField(blank=True, default=b'')
+	# Hash of the request the response answered; a retry must match it.
+	fingerprint = models.CharField(max_length=64, blank=True, default='')
+	created_at = models.DateTimeField(auto_now_add=True)
+	expires_at = models.DateTimeField()
+
+	class Meta:
+		unique_together = ("path", "key")
+		indexes = [models.Index(fields=['expires_at'], name='idempotencykey_expires_idx')]
+
+	def __str__(self) -> str:
+		return f"{self.path} {self.key}"
+
+
+class SheetSyncRow(models.Model):
+	"""Where a registration lives in a Google Sheet, and what was last written there."""
+	spreadsheet_id = models.CharField(max_length=128)
+	worksheet = models.CharField(max_length=100)
+	registration = models.ForeignKey(WorkshopRegistration, related_name='sheet_rows', on_delete=models.CASCADE)
+	row_number = models.PositiveIntegerField()
+	checksum = models.CharField(max_length=40)
+	synced_at = models.DateTimeField(auto_now=True)
+
+	class Meta:
+		unique_together = ("spreadsheet_id", "worksheet", "registration")
 
 	def __str__(self) -> str:
-		return f"{self.name} - {self.workshop.title}"
\ No newline at end of file
+		return f"{self.worksheet}!{self.row_number} -> {self.registration_id}"
+
+
+class ExportStorage(FileSystemStorage):
+	"""Finished exports hold personal data, so they live in EXPORTS_ROOT outside
+	MEDIA_ROOT and are only reachable through the admin download view."""
+
+	@property
+	def base_location(self):
+		return settings.EXPORTS_ROOT
+
+	@property
+	def location(self):
+		return os.path.abspath(self.base_location)
+
+
+class ExportFile(models.Model):
+	"""A finished export's contents when EXPORTS_STORAGE is "database"."""
+	name = models.CharField(max_length=255, unique=True)
+	content = models.BinaryField()
+	created_at = models.DateTimeField(auto_now_add=True)
+
+	def __str__(self) -> str:
+		return self.name
+
+
+class DatabaseExportStorage(Storage):
+	"""Keeps finished exports in ``ExportFile`` rows, for an export worker that
+	doesn't share a disk with the web service (e.g. a separate Render worker)."""
+
+	def _open(self, name, mode='rb'):
+		content = ExportFile.objects.filter(name=name).values_list('content', flat=True).first()
+		if content is None:
+			raise FileNotFoundError(name)
+		return ContentFile(bytes(content), name=name)
+
+	def _save(self, name, content):
+		content.seek(0)
+		ExportFile.objects.create(name=name, content=b''.join(content.chunks()))
+		return name
+
+	def exists(self, name):
+		return ExportFile.objects.filter(name=name).exists()
+
+	def delete(self, name):
+		ExportFile.objects.filter(name=name).delete()
+
+	def size(self, name):
+		return len(self._open(name).read())
+
+
+def export_storage():
+	if settings.EXPORTS_STORAGE == 'database':
+		return DatabaseExportStorage()
+	return ExportStorage()
+
+
+class ExportJob(models.Model):
+	KIND_CHOICES = (
+		("csv", "CSV"),
+		("xlsx", "XLSX"),
+		("xlsx_by_workshop", "XLSX (one sheet per workshop)"),
+		("sheets", "Google Sheets sync"),
+	)
+	STATUS_CHOICES = (
+		("queued", "Queued"),
+		("running", "Running"),
+		("done", "Done"),
+		("failed", "Failed"),
+	)
+
+	kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+	params = models.JSONField(default=dict)
+	status = models.CharField(max_length=10, choices=STATUS_CHOICES, default="queued")
+	progress = models.PositiveIntegerField(default=0)
+	total = models.PositiveIntegerField(default=0)
+	file = models.FileField(storage=export_storage, upload_to='%Y/%m/', blank=True)
+	result = models.CharField(max_length=255, blank=True)
+	error = models.TextField(blank=True)
+	requested_by = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL)
+	created_at = models.DateTimeField(auto_now_add=True)
+	started_at = models.DateTimeField(null=True, blank=True)
+	# Bumped on claim and with each progress report; a running job whose
+	# heartbeat stops was orphaned by its worker (see jobs.requeue_stale).
+	heartbeat_at = models.DateTimeField(null=True, blank=True)
+	attempts = models.PositiveIntegerField(default=0)
+	finished_at = models.DateTimeField(null=True, blank=True)
+
+	class Meta:
+		ordering = ("-created_at",)
+		indexes = [models.Index(fields=['status', 'created_at'], name='exportjob_status_created_idx')]
+
+	def __str__(self) -> str:
+		return f"{self.get_kind_display()} export #{self.pk} ({self.status})"
+
+
+class ExportSelection(models.Model):
+	"""A registration picked for an export job, when the job's selection isn't whole workshops."""
+
+	job = models.ForeignKey(ExportJob, on_delete=models.CASCADE, related_name='selection')
+	registration = models.ForeignKey(WorkshopRegistration, on_delete=models.CASCADE, related_name='+')
+
+	class Meta:
+		unique_together = ("job", "registration")
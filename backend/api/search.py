@@ -0,0 +1,188 @@
+"""Indexed admin search for registrations and contact submissions.
+
+The admin's default search ORs ``icontains`` over every search field, which is
+a ``LIKE '%q%'`` scan of the whole table. Instead:
+
+* SQLite keeps a trigram FTS5 table per model (``api_registration_search``,
+  ``api_contact_search``), filled and kept in sync by triggers, so bulk
+  ``update()``/``bulk_create()`` are covered too. Trigram matching is
+  case-insensitive substring matching, the same semantics as ``icontains``.
+* Postgres gets ``pg_trgm`` GIN indexes on ``UPPER(col::text)``, the
+  expression Django's ``icontains`` compiles to, so the same lookups become
+  index scans. Related fields are searched through an indexed subquery rather
+  than a join.
+
+``IndexedSearchMixin`` plugs this into ``ModelAdmin.get_search_results``. Terms
+shorter than three characters can't use a trigram index and fall back to the
+admin's default search.
+"""
+from django.db import connections
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils.text import smart_split, unescape_string_literal
+
+MIN_TERM_LENGTH = 3
+
+# The current DDL, which ``install()`` repairs to after every migrate.
+# Migration 0013 keeps its own frozen copy of the original.
+INDEXES = {
+	'registration': {
+		'table': 'api_registration_search',
+		'source': 'api_workshopregistration',
+		'columns': ('name', 'email', 'workshop_title'),
+		'select': (
+			"SELECT r.id, r.name, r.email, w.title FROM api_workshopregistration r "
+			"JOIN api_workshop w ON w.id = r.workshop_id"
+		),
+		'triggers': (
+			"""CREATE TRIGGER IF NOT EXISTS api_registration_search_ai AFTER INSERT ON api_workshopregistration BEGIN
+				INSERT INTO api_registration_search(rowid, name, email, workshop_title)
+				VALUES (new.id, new.name, new.email, (SELECT title FROM api_workshop WHERE id = new.workshop_id));
+			END""",
+			"""CREATE TRIGGER IF NOT EXISTS api_registration_search_au AFTER UPDATE OF name, email, workshop_id ON api_workshopregistration BEGIN
+				UPDATE api_registration_search SET name = new.name, email = new.email,
+					workshop_title = (SELECT title FROM api_workshop WHERE id = new.workshop_id)
+				WHERE rowid = new.id;
+			END""",
+			"""CREATE TRIGGER IF NOT EXISTS api_registration_search_ad AFTER DELETE ON api_workshopregistration BEGIN
+				DELETE FROM api_registration_search WHERE rowid = old.id;
+			END""",
+			"""CREATE TRIGGER IF NOT EXISTS api_registration_search_wu AFTER UPDATE OF title ON api_workshop BEGIN
+				UPDATE api_registration_search SET workshop_title = new.title
+				WHERE rowid IN (SELECT id FROM api_workshopregistration WHERE workshop_id = new.id);
+			END""",
+		),
+		'postgres': (
+			('api_workshopregistration', 'name'),
+			('api_workshopregistration', 'email'),
+			('api_workshop', 'title'),
+		),
+	},
+	'contact': {
+		'table': 'api_contact_search',
+		'source': 'api_contactsubmission',
+		'columns': ('name', 'email', 'service'),
+		'select': "SELECT id, name, email, service FROM api_contactsubmission",
+		'triggers': (
+			"""CREATE TRIGGER IF NOT EXISTS api_contact_search_ai AFTER INSERT ON api_contactsubmission BEGIN
+				INSERT INTO api_contact_search(rowid, name, email, service) VALUES (new.id, new.name, new.email, new.service);
+			END""",
+			"""CREATE TRIGGER IF NOT EXISTS api_contact_search_au AFTER UPDATE OF name, email, service ON api_contactsubmission BEGIN
+				UPDATE api_contact_search SET name = new.name, email = new.email, service = new.service WHERE rowid = new.id;
+			END""",
+			"""CREATE TRIGGER IF NOT EXISTS api_contact_search_ad AFTER DELETE ON api_contactsubmission BEGIN
+				DELETE FROM api_contact_search WHERE rowid = old.id;
+			END""",
+		),
+		'postgres': (
+			('api_contactsubmission', 'name'),
+			('api_contactsubmission', 'email'),
+			('api_contactsubmission', 'service'),
+		),
+	},
+}
+
+_ready = set()
+
+
+def _sqlite_install(connection) -> None:
+	with connection.cursor() as cursor:
+		for index in INDEXES.values():
+			cursor.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND tbl_name = %s", [index['source']])
+			triggers = {row[0] for row in cursor.fetchall()}
+			cursor.execute("SELECT 1 FROM sqlite_master WHERE name = %s", [index['table']])
+			complete = cursor.fetchone() is not None and all(
+				name in triggers for name in (f"{index['table']}_ai", f"{index['table']}_au", f"{index['table']}_ad")
+			)
+			if complete:
+				continue
+			# Missing table or triggers (SQLite drops triggers when a migration
+			# rebuilds a table), so the contents may be stale: rebuild them.
+			columns = ', '.join(index['columns'])
+			cursor.execute(f"DROP TABLE IF EXISTS {index['table']}")
+			cursor.execute(f"CREATE VIRTUAL TABLE {index['table']} USING fts5({columns}, tokenize='trigram')")
+			cursor.execute(f"INSERT INTO {index['table']}(rowid, {columns}) {index['select']}")
+			for trigger in index['triggers']:
+				cursor.execute(trigger)
+
+
+def _postgres_install(connection) -> None:
+	with connection.cursor() as cursor:
+		cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+		for index in INDEXES.values():
+			for table, column in index['postgres']:
+				cursor.execute(
+					f'CREATE INDEX IF NOT EXISTS {table}_{column}_trgm '
+					f'ON {table} USING gin ((UPPER("{column}"::text)) gin_trgm_ops)'
+				)
+
+
+def install(connection) -> None:
+	"""Create (or repair) the search indexes for ``connection``'s database."""
+	if connection.vendor == 'sqlite':
+		_sqlite_install(connection)
+	elif connection.vendor == 'postgresql':
+		_postgres_install(connection)
+
+
+def _sqlite_ready(connection, table: str) -> bool:
+	key = (connection.settings_dict['NAME'], table)
+	if key not in _ready:
+		with connection.cursor() as cursor:
+			cursor.execute("SELECT 1 FROM sqlite_master WHERE name = %s", [table])
+			if cursor.fetchone() is None:
+				return False
+		_ready.add(key)
+	return True
+
+
+def _terms(search_term: str) -> list:
+	terms = []
+	for bit in smart_split(search_term):
+		if bit.startswith(('"', "'")) and bit[0] == bit[-1]:
+			bit = unescape_string_literal(bit)
+		if bit:
+			terms.append(bit)
+	return terms
+
+
+def _postgres_term(model, search_fields, term) -> Q:
+	q = Q()
+	for field in search_fields:
+		if '__' in field:
+			relation, column = field.split('__', 1)
+			related = model._meta.get_field(relation).related_model
+			q |= Q(**{f'{relation}__in': related._default_manager.filter(**{f'{column}__icontains': term}).values('pk')})
+		else:
+			q |= Q(**{f'{field}__icontains': term})
+	return q
+
+
+def search(queryset, index: str, search_fields, search_term: str):
+	"""Filter ``queryset`` through ``index``, or return None to use the default search."""
+	terms = _terms(search_term)
+	if not terms or any(len(term) < MIN_TERM_LENGTH for term in terms):
+		return None
+	connection = connections[queryset.db]
+	if connection.vendor == 'sqlite':
+		table = INDEXES[index]['table']
+		if not _sqlite_ready(connection, table):
+			return None
+		match = ' AND '.join('"{}"'.format(term.replace('"', '""')) for term in terms)
+		return queryset.filter(pk__in=RawSQL(f"SELECT rowid FROM {table} WHERE {table} MATCH %s", [match]))
+	if connection.vendor == 'postgresql':
+		for term in terms:
+			queryset = queryset.filter(_postgres_term(queryset.model, search_fields, term))
+		return queryset
+	return None
+
+
+class IndexedSearchMixin:
+	"""ModelAdmin mixin routing the changelist search box through ``search_index``."""
+	search_index = None
+
+	def get_search_results(self, request, queryset, search_term):
+		results = search(queryset, self.search_index, self.get_search_fields(request), search_term)
+		if results is None:
+			return super().get_search_results(request, queryset, search_term)
+		return results, False
@@ -0,0 +1,260 @@
+"""Incremental Google Sheets sync for workshop registrations.
+
+Each synced registration is remembered in ``SheetSyncRow`` with its sheet row
+number and a checksum of the values written. A sync only appends
+registrations the sheet hasn't seen and rewrites rows whose values changed
+(status, admin notes, ...), in batched API calls with retry and backoff.
+Appends aren't idempotent, so ``append_once`` checks whether a failed append
+landed before retrying it.
+
+The engine talks to a small ``SheetsClient`` interface: ``GspreadClient``
+wraps gspread for production and ``FakeSheetsClient`` keeps everything in
+memory for tests and local development.
+"""
+import abc
+import hashlib
+import random
+import re
+import time
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+
+from . import exports
+from .models import SheetSyncRow
+
+WORKSHEET_TITLE = 'Registrations'
+BATCH_SIZE = 500
+MAX_ATTEMPTS = 5
+BACKOFF_BASE = 1.0
+
+
+class RetryableSheetsError(Exception):
+	"""Raised by clients for rate limits and transient server errors."""
+
+
+class SheetsClient(abc.ABC):
+	@abc.abstractmethod
+	def worksheet(self, spreadsheet_id: str, title: str):
+		"""Return a worksheet handle, creating the worksheet if missing."""
+
+
+class WorksheetHandle(abc.ABC):
+	@abc.abstractmethod
+	def first_row(self) -> list:
+		pass
+
+	@abc.abstractmethod
+	def data_rows(self) -> int:
+		"""Number of rows up to the last one with a value in column A."""
+
+	@abc.abstractmethod
+	def append_rows(self, rows: list) -> int:
+		"""Append ``rows`` after the last data row; return the first row number written."""
+
+	@abc.abstractmethod
+	def batch_update(self, updates: list) -> None:
+		"""Write ``[{'range': 'A5:H5', 'values': [[...]]}, ...]`` in one call."""
+
+
+class GspreadWorksheet(WorksheetHandle):
+	def __init__(self, worksheet):
+		self._ws = worksheet
+
+	def _call(self, fn, *args, **kwargs):
+		import gspread  # type: ignore
+		try:
+			return fn(*args, **kwargs)
+		except gspread.exceptions.APIError as exc:
+			code = getattr(exc, 'code', None) or getattr(getattr(exc, 'response', None), 'status_code', None)
+			if code == 429 or (code and code >= 500):
+				raise RetryableSheetsError(str(exc)) from exc
+			raise
+
+	def first_row(self) -> list:
+		return self._call(self._ws.row_values, 1)
+
+	def data_rows(self) -> int:
+		return len(self._call(self._ws.col_values, 1))
+
+	def append_rows(self, rows: list) -> int:
+		response = self._call(
+			self._ws.append_rows, rows, value_input_option='USER_ENTERED', table_range='A1',
+		)
+		updated = response['updates']['updatedRange']
+		return int(re.search(r'![A-Z]+(\d+)', updated).group(1))
+
+	def batch_update(self, updates: list) -> None:
+		self._call(self._ws.batch_update, updates, value_input_option='USER_ENTERED')
+
+
+class GspreadClient(SheetsClient):
+	def __init__(self, credentials_file):
+		import gspread  # type: ignore
+		from google.oauth2.service_account import Credentials  # type: ignore
+		scope = [
+			'https://www.googleapis.com/auth/spreadsheets',
+			'https://www.googleapis.com/auth/drive',
+		]
+		credentials = Credentials.from_service_account_file(str(credentials_file), scopes=scope)
+		self._gspread = gspread
+		self._client = gspread.authorize(credentials)
+
+	def worksheet(self, spreadsheet_id: str, title: str):
+		sh = self._client.open_by_key(spreadsheet_id)
+		try:
+			ws = sh.worksheet(title)
+		except self._gspread.WorksheetNotFound:
+			ws = sh.add_worksheet(title=title, rows=1000, cols=20)
+		return GspreadWorksheet(ws)
+
+
+class FakeWorksheet(WorksheetHandle):
+	def __init__(self):
+		self.rows = []
+		self.calls = []
+
+	def first_row(self) -> list:
+		self.calls.append('first_row')
+		return list(self.rows[0]) if self.rows else []
+
+	def data_rows(self) -> int:
+		self.calls.append('data_rows')
+		return len(self.rows)
+
+	def append_rows(self, rows: list) -> int:
+		self.calls.append('append_rows')
+		first = len(self.rows) + 1
+		self.rows.extend(list(r) for r in rows)
+		return first
+
+	def batch_update(self, updates: list) -> None:
+		self.calls.append('batch_update')
+		for update in updates:
+			row_number = int(re.match(r'[A-Z]+(\d+)', update['range']).group(1))
+			self.rows[row_number - 1] = list(update['values'][0])
+
+
+class FakeSheetsClient(SheetsClient):
+	def __init__(self):
+		self.sheets = {}
+
+	def worksheet(self, spreadsheet_id: str, title: str):
+		return self.sheets.setdefault((spreadsheet_id, title), FakeWorksheet())
+
+
+def get_client() -> SheetsClient:
+	"""Build the production client from settings; raises ImportError or ImproperlyConfigured."""
+	creds_path = getattr(settings, 'GOOGLE_SHEETS_CREDENTIALS_FILE', None)
+	if not creds_path or not getattr(settings, 'GOOGLE_SHEETS_SPREADSHEET_ID', None):
+		raise ImproperlyConfigured("Google Sheets credentials or Spreadsheet ID not configured in settings.")
+	return GspreadClient(creds_path)
+
+
+def _backoff(attempt: int) -> float:
+	return BACKOFF_BASE * (2 ** attempt) + random.uniform(0, BACKOFF_BASE)
+
+
+def with_retry(fn, *args, sleep=time.sleep, attempts: int = MAX_ATTEMPTS):
+	for attempt in range(attempts):
+		try:
+			return fn(*args)
+		except RetryableSheetsError:
+			if attempt == attempts - 1:
+				raise
+			sleep(_backoff(attempt))
+
+
+def append_once(ws: WorksheetHandle, rows: list, sleep=time.sleep, attempts: int = MAX_ATTEMPTS) -> int:
+	"""``ws.append_rows(rows)`` with retries that can't append the rows twice.
+
+	An append that failed with a timeout or 5xx may still have been applied, so
+	before retrying, the sheet's row count is re-read: if it already grew by
+	``len(rows)``, the earlier call went through. (This assumes nothing else
+	appends to the worksheet during a sync.)
+	"""
+	before = with_retry(ws.data_rows, sleep=sleep)
+	for attempt in range(attempts):
+		try:
+			return ws.append_rows(rows)
+		except RetryableSheetsError:
+			if attempt == attempts - 1:
+				raise
+			sleep(_backoff(attempt))
+			if with_retry(ws.data_rows, sleep=sleep) >= before + len(rows):
+				return before + 1
+
+
+def _checksum(row) -> str:
+	return hashlib.sha1('\x1f'.join(str(v) for v in row).encode('utf-8')).hexdigest()
+
+
+def _column_letter(n: int) -> str:
+	letters = ''
+	while n:
+		n, rem = divmod(n - 1, 26)
+		letters = chr(ord('A') + rem) + letters
+	return letters
+
+
+def sync_registrations(queryset, client: SheetsClient, spreadsheet_id: str, worksheet_title: str = WORKSHEET_TITLE, sleep=time.sleep, progress=None):
+	"""Push new and changed registrations in ``queryset`` to the sheet.
+
+	Returns ``(appended, updated)`` row counts.
+	"""
+	ws = client.worksheet(spreadsheet_id, worksheet_title)
+	synced = SheetSyncRow.objects.filter(spreadsheet_id=spreadsheet_id, worksheet=worksheet_title)
+	if not synced.exists() and not with_retry(ws.first_row, sleep=sleep):
+		append_once(ws, [exports.EXPORT_HEADER], sleep=sleep)
+	known = {
+		reg_id: (pk, row_number, checksum)
+		for pk, reg_id, row_number, checksum in synced.filter(registration__in=queryset)
+		.values_list('pk', 'registration_id', 'row_number', 'checksum').iterator(chunk_size=exports.EXPORT_CHUNK_SIZE)
+	}
+	last_col = _column_letter(len(exports.EXPORT_HEADER))
+	appended = updated = 0
+	new_rows, changes = [], []
+
+	def flush_new():
+		nonlocal appended
+		if not new_rows:
+			return
+		first = append_once(ws, [row for _, row, _ in new_rows], sleep=sleep)
+		SheetSyncRow.objects.bulk_create([
+			SheetSyncRow(
+				spreadsheet_id=spreadsheet_id, worksheet=worksheet_title,
+				registration_id=reg_id, row_number=first + i, checksum=checksum,
+			)
+			for i, (reg_id, _, checksum) in enumerate(new_rows)
+		])
+		appended += len(new_rows)
+		new_rows.clear()
+
+	def flush_changes():
+		nonlocal updated
+		if not changes:
+			return
+		with_retry(ws.batch_update, [
+			{'range': f'A{row_number}:{last_col}{row_number}', 'values': [row]}
+			for _, row_number, row, _ in changes
+		], sleep=sleep)
+		SheetSyncRow.objects.bulk_update(
+			[SheetSyncRow(pk=pk, checksum=checksum) for pk, _, _, checksum in changes], ['checksum'],
+		)
+		updated += len(changes)
+		changes.clear()
+
+	for reg_id, _workshop_id, row in exports.iter_keyed_rows(queryset, progress=progress):
+		checksum = _checksum(row)
+		if reg_id not in known:
+			new_rows.append((reg_id, row, checksum))
+			if len(new_rows) >= BATCH_SIZE:
+				flush_new()
+		elif known[reg_id][2] != checksum:
+			pk, row_number, _ = known[reg_id]
+			changes.append((pk, row_number, row, checksum))
+			if len(changes) >= BATCH_SIZE:
+				flush_changes()
+	flush_new()
+	flush_changes()
+	return appended, updated
@@ -0,0 +1,140 @@
+from django.db.backends.signals import connection_created
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from . import cache, live, metrics, stats, stored_files, thumbnails
+from .models import Workshop, WorkshopRegistration
+
+
+@receiver(post_save, sender=Workshop)
+@receiver(post_delete, sender=Workshop)
+def invalidate_workshop(sender, instance, **kwargs):
+	cache.bump(cache.LIST_VERSION_KEY, cache.detail_version_key(instance.pk), cache.STATS_VERSION_KEY)
+
+
+@receiver(post_save, sender=Workshop)
+def thumbnail_workshop_images(sender, instance, **kwargs):
+	def refresh():
+		# The API serves rendition URLs once they exist, so the payload changed.
+		Workshop.objects.filter(pk=instance.pk).update(updated_at=timezone.now())
+		cache.bump(cache.LIST_VERSION_KEY, cache.detail_version_key(instance.pk))
+
+	for field_name in ('image', 'payment_qr'):
+		field_file = getattr(instance, field_name)
+		manifest_field = f'{field_name}_derivatives'
+		if not thumbnails.derivatives_stale(field_file, getattr(instance, manifest_field)):
+			continue
+
+		def build(field_name=field_name, field_file=field_file, manifest_field=manifest_field):
+			manifest = thumbnails.build_derivatives(field_file)
+			# Only record it if the source hasn't been replaced in the meantime.
+			Workshop.objects.filter(pk=instance.pk, **{field_name: field_file.name}).update(**{manifest_field: manifest})
+			refresh()
+
+		thumbnails.run_in_background(('derivatives', field_file.name), build)
+
+
+@receiver(post_save, sender=WorkshopRegistration)
+def thumbnail_payment_proof(sender, instance, **kwargs):
+	if thumbnails.missing(instance.payment_proof):
+		thumbnails.schedule(instance.payment_proof)
+
+
+@receiver(post_save, sender=WorkshopRegistration)
+def count_registration(sender, instance, created, **kwargs):
+	# Registrations made through WorkshopRegisterView already took their seat
+	# with Workshop.objects.reserve_seat(); admin-created ones haven't.
+	if created and not getattr(instance, 'seat_reserved', False):
+		Workshop.objects.filter(pk=instance.workshop_id).update(seats_taken=F('seats_taken') + 1)
+
+
+@receiver(post_delete, sender=WorkshopRegistration)
+def release_registration(sender, instance, **kwargs):
+	Workshop.objects.release_seat(instance.workshop_id)
+
+
+@receiver(pre_save, sender=WorkshopRegistration)
+def remember_workshop(sender, instance, update_fields=None, **kwargs):
+	# A registration moved to another workshop (admin) takes its seat along.
+	instance._moved_from = None
+	if instance._state.adding or (update_fields is not None and 'workshop' not in update_fields):
+		return
+	previous = WorkshopRegistration.objects.filter(pk=instance.pk).values_list('workshop_id', flat=True).first()
+	if previous is not None and previous != instance.workshop_id:
+		instance._moved_from = previous
+
+
+@receiver(post_save, sender=WorkshopRegistration)
+def move_registration(sender, instance, created, **kwargs):
+	previous = getattr(instance, '_moved_from', None)
+	if previous is None:
+		return
+	Workshop.objects.release_seat(previous)
+	Workshop.objects.filter(pk=instance.workshop_id).update(seats_taken=F('seats_taken') + 1)
+	Workshop.objects.filter(pk__in=(previous, instance.workshop_id)).update(updated_at=timezone.now())
+	cache.bump(cache.detail_version_key(previous))
+	live.changed(previous)
+	live.changed(instance.workshop_id)
+
+
+@receiver(post_save, sender=WorkshopRegistration)
+def roll_up_registration(sender, instance, created, **kwargs):
+	if created:
+		stats.record_registration(instance.created_at)
+		metrics.inc('workshop_registrations_total', {'workshop_id': instance.workshop_id})
+
+
+@receiver(post_delete, sender=WorkshopRegistration)
+def roll_down_registration(sender, instance, **kwargs):
+	stats.record_registration(instance.created_at, -1)
+
+
+@receiver(post_save, sender=WorkshopRegistration)
+@receiver(post_delete, sender=WorkshopRegistration)
+def invalidate_registration(sender, instance, **kwargs):
+	if kwargs.get('created', True):
+		# Registrations change the workshop's seat count, so they count as a
+		# modification of the workshop for ETag / Last-Modified purposes.
+		Workshop.objects.filter(pk=instance.workshop_id).update(updated_at=timezone.now())
+	cache.bump(cache.LIST_VERSION_KEY, cache.detail_version_key(instance.workshop_id), cache.STATS_VERSION_KEY)
+
+
+@receiver(post_save, sender=Workshop)
+@receiver(post_save, sender=WorkshopRegistration)
+@receiver(post_delete, sender=WorkshopRegistration)
+def publish_seats(sender, instance, **kwargs):
+	if sender is Workshop:
+		live.changed(instance.pk)
+	elif kwargs.get('created', True):
+		live.changed(instance.workshop_id)
+
+
+@receiver(pre_save, sender=Workshop)
+@receiver(pre_save, sender=WorkshopRegistration)
+def read_stored_files(sender, instance, update_fields=None, **kwargs):
+	stored_files.before_save(instance, update_fields)
+
+
+@receiver(post_save, sender=Workshop)
+@receiver(post_save, sender=WorkshopRegistration)
+def count_stored_files(sender, instance, **kwargs):
+	stored_files.saved(instance)
+
+
+@receiver(pre_delete, sender=Workshop)
+@receiver(pre_delete, sender=WorkshopRegistration)
+def read_deleted_stored_files(sender, instance, **kwargs):
+	stored_files.before_delete(instance)
+
+
+@receiver(post_delete, sender=Workshop)
+@receiver(post_delete, sender=WorkshopRegistration)
+def release_stored_files(sender, instance, **kwargs):
+	stored_files.released(instance)
+
+
+@receiver(connection_created)
+def count_connection(sender, connection, **kwargs):
+	metrics.inc('db_connections_created_total', {'alias': connection.alias})
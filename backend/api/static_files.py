@@ -0,0 +1,39 @@
+"""WhiteNoise for both WSGI and ASGI.
+
+WhiteNoise 6.7 only ships a sync middleware. Under ASGI, Django adapts the
+whole middleware chain around it, so every API request paid for a hop to a
+thread and back ("Asynchronous handler adapted for middleware ...") just to
+learn it wasn't a static file. This subclass keeps WhiteNoise's file lookup
+and responses but is async-capable: under ASGI only requests for static files
+go through a thread (to stat and open the file).
+
+It uses WhiteNoise internals (``autorefresh``, ``files``, ``find_file``,
+``serve``), so ``whitenoise`` is pinned to 6.7.x and ``StaticFilesTests``
+fails if they change.
+"""
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from whitenoise.middleware import WhiteNoiseMiddleware
+
+
+class StaticFilesMiddleware(WhiteNoiseMiddleware):
+	sync_capable = True
+	async_capable = True
+
+	def __init__(self, get_response=None, *args, **kwargs):
+		super().__init__(get_response, *args, **kwargs)
+		if iscoroutinefunction(get_response):
+			markcoroutinefunction(self)
+
+	def __call__(self, request):
+		if iscoroutinefunction(self):
+			return self.__acall__(request)
+		return super().__call__(request)
+
+	async def __acall__(self, request):
+		if self.autorefresh:
+			static_file = await sync_to_async(self.find_file)(request.path_info)
+		else:
+			static_file = self.files.get(request.path_info)
+		if static_file is not None:
+			return await sync_to_async(self.serve)(static_file, request)
+		return await self.get_response(request)
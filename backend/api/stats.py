@@ -0,0 +1,76 @@
+"""Numbers for the admin dashboard.
+
+``dashboard_stats()`` is cached under ``cache.STATS_VERSION_KEY``, which the
+workshop and registration signals bump. A cold build costs three queries: one
+conditional aggregate over registrations, the recent workshops (with the workshop
+total as a scalar COUNT subquery), and the ``RegistrationDay`` rollup for the
+per-day series.
+"""
+import datetime
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Subquery, Value
+from django.utils import timezone
+
+from . import cache
+from .models import RegistrationDay, Workshop, WorkshopRegistration
+
+RECENT_WORKSHOPS = 20
+SERIES_DAYS = 30
+
+
+def record_registration(created_at, delta: int = 1) -> None:
+	"""Add ``delta`` to the rollup row for the day of ``created_at``."""
+	day = timezone.localdate(created_at)
+	rows = RegistrationDay.objects.filter(day=day)
+	if delta < 0:
+		rows.filter(count__gte=-delta).update(count=F('count') + delta)
+		return
+	if rows.update(count=F('count') + delta):
+		return
+	try:
+		with transaction.atomic():
+			RegistrationDay.objects.create(day=day, count=delta)
+	except IntegrityError:
+		# Another request created the row first.
+		rows.update(count=F('count') + delta)
+
+
+def _series(today):
+	start = today - datetime.timedelta(days=SERIES_DAYS - 1)
+	counts = dict(RegistrationDay.objects.filter(day__gte=start, day__lte=today).values_list('day', 'count'))
+	return [
+		{'day': day, 'count': counts.get(day, 0)}
+		for day in (start + datetime.timedelta(days=i) for i in range(SERIES_DAYS))
+	]
+
+
+def _compute(today):
+	stats = WorkshopRegistration.objects.aggregate(
+		registrations_total=Count('id'),
+		registrations_verified=Count('id', filter=Q(status='verified')),
+		registrations_pending=Count('id', filter=Q(status='pending')),
+		registrations_rejected=Count('id', filter=Q(status='rejected')),
+	)
+	by_workshop = list(
+		Workshop.objects
+		.annotate(reg_count=F('seats_taken'), workshops_total=Subquery(
+			# Grouping by a constant leaves no GROUP BY: one row counting every workshop.
+			Workshop.objects.order_by().annotate(all=Value(1)).values('all').annotate(n=Count('id')).values('n')
+		))
+		.values('id', 'title', 'status', 'date', 'reg_count', 'workshops_total')
+		.order_by('-date', '-id')[:RECENT_WORKSHOPS]
+	)
+	stats['workshops_total'] = by_workshop[0]['workshops_total'] if by_workshop else 0
+	series = _series(today)
+	return {
+		'stats': stats,
+		'by_workshop': by_workshop,
+		'series': series,
+		'series_max': max([row['count'] for row in series] + [1]),
+	}
+
+
+def dashboard_stats() -> dict:
+	today = timezone.localdate()
+	return cache.cached_value(cache.STATS_VERSION_KEY, f'dashboard:{today.isoformat()}', lambda: _compute(today))
@@ -0,0 +1,69 @@
+"""Content-addressed storage for uploaded images.
+
+``ContentAddressedStorage`` stores every upload as ``<upload_to>/<sha256>.<ext>``
+under ``MEDIA_ROOT``: identical bytes get the same name, so a screenshot
+uploaded on every retry is written once. Names never point at different
+content, so ``api.media`` serves them as immutable.
+
+Files derived from an upload (thumbnails, responsive renditions) have names
+of their own and are written through ``storage.derived``, a plain
+``FileSystemStorage`` on the same location.
+
+How many rows reference each file is tracked in ``StoredFile`` (see
+``api.stored_files``), which ``manage.py gc_media`` uses to delete files
+nothing points at any more.
+"""
+import hashlib
+import os
+import posixpath
+
+from django.core.files.base import File
+from django.core.files.storage import FileSystemStorage
+from django.core.files.utils import validate_file_name
+
+
+class ContentAddressedStorage(FileSystemStorage):
+	def __init__(self, **kwargs):
+		# Two writers of the same name are writing the same bytes.
+		kwargs.setdefault('allow_overwrite', True)
+		super().__init__(**kwargs)
+
+	@property
+	def derived(self):
+		return FileSystemStorage(location=self._location, base_url=self._base_url)
+
+	def hashed_name(self, name, content) -> str:
+		digest = hashlib.sha256()
+		for chunk in content.chunks():
+			digest.update(chunk)
+		content.seek(0)
+		directory, filename = posixpath.split(str(name).replace('\\', '/'))
+		return posixpath.join(directory, digest.hexdigest() + os.path.splitext(filename)[1].lower())
+
+	def save(self, name, content, max_length=None):
+		if name is None:
+			name = content.name
+		if not hasattr(content, 'chunks'):
+			content = File(content, name)
+		name = self.hashed_name(name, content)
+		validate_file_name(name, allow_relative_path=True)
+		# Touch the file's StoredFile row before trusting exists(): gc_media
+		# only deletes a file while holding that row (see api.stored_files).
+		from . import stored_files
+		stored_files.touch(name)
+		if self.exists(name):
+			# Already stored. Touch it so gc_media's grace period restarts for
+			# a file that is about to be referenced again.
+			os.utime(self.path(name))
+			return name
+		return super().save(name, content, max_length)
+
+	def get_available_name(self, name, max_length=None):
+		return name
+
+
+_storage = ContentAddressedStorage()
+
+
+def content_addressed_storage():
+	return _storage
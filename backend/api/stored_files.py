@@ -0,0 +1,186 @@
+"""Reference counts for content-addressed uploads, and their garbage collection.
+
+With ``api.storage`` one file can back any number of rows, so a file can only
+be deleted once nothing points at it. The model signals keep
+``StoredFile.refs`` in step with the rows, in the same transaction as the
+row change: +1 when a row starts pointing at a name, -1 when it stops or is
+deleted. The names a row pointed at are read from the database just before
+it is saved or deleted, not from what the instance was loaded with, which
+may be stale or deferred.
+
+``collect_garbage()`` (``manage.py gc_media``) then deletes, with their
+thumbnails:
+
+* files whose count reached zero;
+* files in an upload directory with no ``StoredFile`` row at all -- written
+  by a save that rolled back, or from before counting started;
+* responsive renditions no workshop manifest lists any more.
+
+Only files untouched for ``MEDIA_GC_GRACE`` seconds are collected: a save
+writes the file before its row commits, and re-uploading an existing file
+touches it. A file is deleted while its ``StoredFile`` row is held deleted in
+an open transaction, and ``ContentAddressedStorage.save`` touches that row
+before trusting that the file exists, so a concurrent upload of the same
+bytes either keeps the file or waits and writes it again.
+"""
+import datetime
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.fields.files import FieldFile
+from django.utils import timezone
+
+from . import thumbnails
+from .models import StoredFile, Workshop, WorkshopRegistration
+from .storage import content_addressed_storage
+
+TRACKED_FIELDS = {
+	Workshop: ('image', 'payment_qr'),
+	WorkshopRegistration: ('payment_proof',),
+}
+BATCH_SIZE = 500
+
+
+def _stored_name(value):
+	"""The stored name behind a file field's raw value, or None for an upload not yet saved."""
+	if value is None or isinstance(value, str):
+		return value or ''
+	if isinstance(value, FieldFile) and value._committed:
+		return value.name or ''
+	return None
+
+
+def _stored(instance, fields) -> dict:
+	"""The names ``instance``'s row holds for ``fields`` in the database."""
+	if not fields or instance.pk is None:
+		return {}
+	row = type(instance)._base_manager.filter(pk=instance.pk).values(*fields).first()
+	return {field: row[field] or '' for field in fields} if row else {}
+
+
+def before_save(instance, update_fields) -> None:
+	"""Record the names the save is about to replace (pre_save)."""
+	# Deferred fields that were never assigned aren't written by the save.
+	fields = [
+		field for field in TRACKED_FIELDS[type(instance)]
+		if field in instance.__dict__ and (update_fields is None or field in update_fields)
+	]
+	instance._stored_fields = fields
+	instance._stored_names = _stored(instance, fields)
+
+
+def adjust(name: str, delta: int) -> None:
+	now = timezone.now()
+	if StoredFile.objects.filter(name=name).update(refs=F('refs') + delta, updated_at=now) or delta < 0:
+		return
+	StoredFile.objects.bulk_create([StoredFile(name=name, refs=0)], ignore_conflicts=True)
+	StoredFile.objects.filter(name=name).update(refs=F('refs') + delta, updated_at=now)
+
+
+def touch(name: str) -> None:
+	"""Create or touch ``name``'s row; ``ContentAddressedStorage.save`` calls it before ``exists()``."""
+	adjust(name, 0)
+
+
+def saved(instance) -> None:
+	before = getattr(instance, '_stored_names', {})
+	for field in getattr(instance, '_stored_fields', ()):
+		old, new = before.get(field, ''), getattr(instance, field).name or ''
+		if old == new:
+			continue
+		if new:
+			adjust(new, 1)
+		if old:
+			adjust(old, -1)
+
+
+def before_delete(instance) -> None:
+	"""Record the names the row holds (pre_delete), reading any that aren't loaded."""
+	names = {}
+	for field in TRACKED_FIELDS[type(instance)]:
+		name = _stored_name(instance.__dict__[field]) if field in instance.__dict__ else None
+		if name is not None:
+			names[field] = name
+	names.update(_stored(instance, [field for field in TRACKED_FIELDS[type(instance)] if field not in names]))
+	instance._stored_names = names
+
+
+def released(instance) -> None:
+	for name in getattr(instance, '_stored_names', {}).values():
+		if name:
+			adjust(name, -1)
+
+
+def _upload_dirs() -> list:
+	return sorted({model._meta.get_field(field).upload_to.rstrip('/') for model, fields in TRACKED_FIELDS.items() for field in fields})
+
+
+def _untouched_since(storage, name, cutoff) -> bool:
+	try:
+		return storage.get_modified_time(name) < cutoff
+	except FileNotFoundError:
+		return True
+
+
+def _delete(storage, name) -> None:
+	storage.delete(name)
+	for size in settings.THUMBNAIL_SIZES:
+		storage.delete(thumbnails.thumbnail_name(name, size))
+
+
+def _collect(storage, name, cutoff) -> bool:
+	"""Delete ``name`` and its row unless it's referenced or was touched after ``cutoff``."""
+	with transaction.atomic():
+		if not StoredFile.objects.filter(name=name, refs__lte=0, updated_at__lt=cutoff).delete()[0]:
+			# No row (never counted): create one to hold while the file goes.
+			try:
+				with transaction.atomic():
+					StoredFile.objects.create(name=name)
+			except IntegrityError:
+				return False
+			StoredFile.objects.filter(name=name).delete()
+		_delete(storage, name)
+	return True
+
+
+def collect_garbage(grace=None, dry_run=False) -> list:
+	"""Delete unreferenced files older than ``grace`` seconds; returns the names removed."""
+	storage = content_addressed_storage()
+	cutoff = timezone.now() - datetime.timedelta(seconds=settings.MEDIA_GC_GRACE if grace is None else grace)
+	removed = []
+
+	for stored in StoredFile.objects.filter(refs__lte=0, updated_at__lt=cutoff).order_by('updated_at').iterator():
+		if not _untouched_since(storage, stored.name, cutoff):
+			continue
+		if dry_run or _collect(storage, stored.name, cutoff):
+			removed.append(stored.name)
+
+	for directory in _upload_dirs():
+		if not storage.exists(directory):
+			continue
+		names = [f'{directory}/{filename}' for filename in storage.listdir(directory)[1]]
+		for start in range(0, len(names), BATCH_SIZE):
+			batch = names[start:start + BATCH_SIZE]
+			known = set(StoredFile.objects.filter(name__in=batch).values_list('name', flat=True))
+			for name in batch:
+				if name not in known and name not in removed and _untouched_since(storage, name, cutoff):
+					if dry_run or _collect(storage, name, cutoff):
+						removed.append(name)
+
+	listed = set()
+	for manifests in Workshop.objects.values_list('image_derivatives', 'payment_qr_derivatives').iterator():
+		for manifest in manifests:
+			for key, _fmt in thumbnails.DERIVATIVE_FORMATS:
+				listed.update(name for _width, name in (manifest or {}).get(key, ()))
+	for directory in _upload_dirs():
+		derived = f'{directory}/derivatives'
+		if not storage.exists(derived):
+			continue
+		for filename in storage.listdir(derived)[1]:
+			name = f'{derived}/{filename}'
+			if name not in listed and _untouched_since(storage, name, cutoff):
+				if not dry_run:
+					storage.delete(name)
+				removed.append(name)
+	return removed
@@ -1,3 +1,1723 @@
-from django.test import TestCase
+import asyncio
+import contextlib
+import datetime
+import importlib
+import io
+import json
+import logging
+import os
+import re
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import unittest
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.exceptions import MiddlewareNotUsed
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIRequest
+from django.core.management import call_command
+from django.db import DatabaseError, connection, connections, transaction
+from django.test import Client, RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.http import HttpResponse
+from django.urls import clear_url_caches, resolve, reverse
+from django.utils import timezone
+
+from PIL import Image
+from server import urls as server_urls
+
+from . import async_views, idempotency, ingest, jobs, live, metrics, search, sheets, stats, stored_files, thumbnails, timing, uploads, views
+from . import urls as api_urls
+from .admin import ContactSubmissionAdmin, WorkshopAdmin, WorkshopRegistrationAdmin, _proof_preview
+from .media import IMMUTABLE_MAX_AGE
+from .models import ContactSubmission, DatabaseExportStorage, ExportFile, ExportJob, IdempotencyKey, RegistrationDay, SheetSyncRow, StoredFile, Workshop, WorkshopRegistration
+from .static_files import StaticFilesMiddleware
+from .storage import content_addressed_storage
+
+try:
+	import openpyxl
+except ImportError:  # optional dependency
+	openpyxl = None
+
+
+def make_workshop(**kwargs):
+	defaults = {
+		'title': 'Workshop',
+		'date': datetime.date(2025, 1, 1),
+		'start_time': datetime.time(10, 0),
+		'end_time': datetime.time(12, 0),
+		'venue': 'Studio',
+		'capacity': 5,
+	}
+	defaults.update(kwargs)
+	return Workshop.objects.create(**defaults)
+
+
+def make_image(name='photo.jpg', size=(1600, 1200), fmt='JPEG'):
+	buf = io.BytesIO()
+	Image.new('RGB', size, (200, 30, 90)).save(buf, fmt)
+	return SimpleUploadedFile(name, buf.getvalue(), content_type=f'image/{fmt.lower()}')
+
+
+def make_registrations(ws, count):
+	WorkshopRegistration.objects.bulk_create([
+		WorkshopRegistration(workshop=ws, name=f'User {i}', email=f'user{i}-{ws.id}@example.com')
+		for i in range(count)
+	])
+	# bulk_create skips the signals that keep seats_taken in step.
+	Workshop.objects.filter(pk=ws.pk).recount_seats()
+
+
+class TempMediaMixin:
+	"""An empty workshop cache and a throwaway ``MEDIA_ROOT`` (``self.media_root``) per test."""
+
+	def setUp(self):
+		super().setUp()
+		caches['workshops'].clear()
+		self.media_root = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, self.media_root, True)
+		self.enterContext(override_settings(MEDIA_ROOT=self.media_root))
+
+
+class QueryPlanMixin:
+	"""``assertNoFullTableScans()``: EXPLAIN every SELECT run inside the block
+	and fail if one reads a table without an index."""
+
+	def _plan_scans(self, sql, params):
+		with connection.cursor() as cursor:
+			if connection.vendor == 'sqlite':
+				cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+				details = [row[-1] for row in cursor.fetchall()]
+				# "SCAN t" is a full scan; "SCAN t USING [COVERING] INDEX i" walks
+				# an index. Derived tables ("SCAN subquery") aren't tables.
+				# An unfiltered page read in rowid order (no top-level WHERE, no
+				# sort, a LIMIT) also shows as "SCAN t" but stops after one page.
+				outer = sql
+				while (inner := re.sub(r'\([^()]*\)', '', outer)) != outer:
+					outer = inner
+				if ' LIMIT ' in outer and ' WHERE ' not in outer and not any('TEMP B-TREE' in d for d in details):
+					return []
+				tables = set(connection.introspection.table_names(cursor))
+				return [d.split()[1] for d in details if d.startswith('SCAN ') and len(d.split()) == 2 and d.split()[1] in tables]
+			if connection.vendor == 'postgresql':
+				# Small test tables are always cheapest to seq scan; only
+				# accept one when no index can serve the query at all.
+				with transaction.atomic():
+					cursor.execute('SET LOCAL enable_seqscan = off')
+					cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+					plan = cursor.fetchone()[0]
+				scans, nodes = [], [plan[0]['Plan']]
+				while nodes:
+					node = nodes.pop()
+					if node['Node Type'] == 'Seq Scan':
+						scans.append(node['Relation Name'])
+					nodes.extend(node.get('Plans', []))
+				return scans
+		return []
+
+	@contextlib.contextmanager
+	def assertNoFullTableScans(self, allow=()):
+		statements = []
+
+		def record(execute, sql, params, many, context):
+			if sql.lstrip().upper().startswith('SELECT') and not many:
+				statements.append((sql, params))
+			return execute(sql, params, many, context)
+
+		with connection.execute_wrapper(record):
+			yield
+		failures = []
+		for sql, params in statements:
+			scans = [t for t in self._plan_scans(sql, params) if t not in allow]
+			if scans:
+				failures.append(f"{', '.join(scans)}: {sql % tuple(repr(p) for p in (params or ()))}")
+		if failures:
+			self.fail("Full table scans:\n" + "\n".join(failures))
+
+
+class WorkshopListQueryTests(TempMediaMixin, TestCase):
+	def _list_queries(self):
+		with CaptureQueriesContext(connection) as ctx:
+			response = self.client.get(reverse('workshops_list'))
+		self.assertEqual(response.status_code, 200)
+		return len(ctx.captured_queries), response.json()['items']
+
+	def test_query_count_is_constant(self):
+		for i in range(2):
+			make_registrations(make_workshop(title=f'W{i}'), 2)
+		small, _ = self._list_queries()
+		for i in range(2, 12):
+			make_registrations(make_workshop(title=f'W{i}'), 3)
+		large, items = self._list_queries()
+		self.assertEqual(small, large)
+		self.assertEqual(len(items), 12)
+
+	def test_counts_and_sold_out(self):
+		ws = make_workshop(capacity=2)
+		make_registrations(ws, 2)
+		# One lookup for the conditional-GET validators, one for the payload.
+		with self.assertNumQueries(2):
+			response = self.client.get(reverse('workshops_detail', args=[ws.id]))
+		data = response.json()
+		self.assertEqual(data['registrations_count'], 2)
+		self.assertTrue(data['is_sold_out'])
+
+
+class WorkshopResponseCacheTests(TempMediaMixin, TestCase):
+	def setUp(self):
+		super().setUp()
+		self.ws = make_workshop(capacity=3)
+
+	def _assert_cached_and_invalidated(self):
+		list_url = reverse('workshops_list')
+		detail_url = reverse('workshops_detail', args=[self.ws.id])
+		self.client.get(list_url)
+		self.client.get(detail_url)
+		with self.assertNumQueries(0):
+			self.assertEqual(self.client.get(list_url).json()['items'][0]['registrations_count'], 0)
+			self.assertEqual(self.client.get(detail_url).json()['registrations_count'], 0)
+
+		reg = WorkshopRegistration.objects.create(workshop=self.ws, name='A', email='a@example.com')
+		self.assertEqual(self.client.get(list_url).json()['items'][0]['registrations_count'], 1)
+		self.assertEqual(self.client.get(detail_url).json()['registrations_count'], 1)
+
+		reg.delete()
+		self.assertEqual(self.client.get(detail_url).json()['registrations_count'], 0)
+
+		self.ws.title = 'Renamed'
+		self.ws.save()
+		self.assertEqual(self.client.get(list_url).json()['items'][0]['title'], 'Renamed')
+		self.assertEqual(self.client.get(detail_url).json()['title'], 'Renamed')
+
+		self.ws.delete()
+		self.assertEqual(self.client.get(list_url).json()['items'], [])
+		self.assertEqual(self.client.get(detail_url).status_code, 404)
+
+	def test_default_backend_is_shared_by_workers(self):
+		# Invalidation bumps keys in the cache, so a per-process backend would
+		# only invalidate the worker that handled the write.
+		self.assertNotIsInstance(caches['workshops'], LocMemCache)
+		self._assert_cached_and_invalidated()
+
+	def test_locmem_backend(self):
+		backend = {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'test-workshops'}
+		with override_settings(CACHES={'default': backend, 'workshops': backend}):
+			self._assert_cached_and_invalidated()
+
+	def test_filebased_backend(self):
+		location = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, location, True)
+		backend = {
+			'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+			'LOCATION': location,
+			'OPTIONS': {'MAX_ENTRIES': 50},
+		}
+		with override_settings(CACHES={'default': backend, 'workshops': backend}):
+			self._assert_cached_and_invalidated()
+
+
+class WorkshopConditionalGetTests(TempMediaMixin, TestCase):
+	def setUp(self):
+		super().setUp()
+		self.ws = make_workshop()
+
+	def test_if_none_match_returns_304(self):
+		for url in (reverse('workshops_list'), reverse('workshops_detail', args=[self.ws.id])):
+			response = self.client.get(url)
+			etag = response['ETag']
+			self.assertFalse(etag.startswith('W/'))
+			self.assertIn('Last-Modified', response)
+			not_modified = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+			self.assertEqual(not_modified.status_code, 304)
+			self.assertEqual(not_modified.content, b'')
+
+	def test_if_modified_since_returns_304(self):
+		url = reverse('workshops_detail', args=[self.ws.id])
+		last_modified = self.client.get(url)['Last-Modified']
+		self.assertEqual(self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified).status_code, 304)
+
+	def test_registration_changes_validators(self):
+		url = reverse('workshops_detail', args=[self.ws.id])
+		etag = self.client.get(url)['ETag']
+		before = Workshop.objects.get(id=self.ws.id).updated_at
+		WorkshopRegistration.objects.create(workshop=self.ws, name='A', email='a@example.com')
+		self.assertGreater(Workshop.objects.get(id=self.ws.id).updated_at, before)
+		response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+		self.assertEqual(response.status_code, 200)
+		self.assertNotEqual(response['ETag'], etag)
+		self.assertEqual(response.json()['registrations_count'], 1)
+
+	def test_list_etag_varies_with_query(self):
+		make_workshop(title='Other')
+		url = reverse('workshops_list')
+		first = self.client.get(url, {'limit': 1})
+		second = self.client.get(url, {'limit': 1, 'cursor': first.json()['next_cursor']})
+		etags = {
+			self.client.get(url)['ETag'], first['ETag'], second['ETag'],
+			self.client.get(url, {'fields': 'id'})['ETag'], self.client.get(url, {'status': 'active'})['ETag'],
+		}
+		self.assertEqual(len(etags), 5)
+		self.assertEqual(self.client.get(f'{url}?cursor={first.json()["next_cursor"]}&limit=1')['ETag'], second['ETag'])
+		response = self.client.get(url, {'limit': 1, 'cursor': first.json()['next_cursor']}, HTTP_IF_NONE_MATCH=first['ETag'])
+		self.assertEqual(response.status_code, 200)
+
+	def test_list_etag_changes_on_delete(self):
+		other = make_workshop(title='Other')
+		url = reverse('workshops_list')
+		etag = self.client.get(url)['ETag']
+		other.delete()
+		self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class WorkshopListPaginationTests(TempMediaMixin, TestCase):
+	def setUp(self):
+		super().setUp()
+		for i in range(7):
+			make_workshop(
+				title=f'W{i}',
+				date=datetime.date(2025, 1, 1 + i // 2),
+				status='active' if i % 2 else 'inactive',
+				venue='Hall' if i < 3 else 'Studio',
+			)
+
+	def _collect(self, **params):
+		url = reverse('workshops_list')
+		items, cursor = [], None
+		while True:
+			query = dict(params, **({'cursor': cursor} if cursor else {}))
+			data = self.client.get(url, query).json()
+			items.extend(data['items'])
+			cursor = data['next_cursor']
+			if not cursor:
+				return items
+
+	def test_cursor_walks_every_row_once_in_order(self):
+		items = self._collect(limit=3, fields='id,date')
+		expected = list(Workshop.objects.order_by('-date', '-id').values_list('id', flat=True))
+		self.assertEqual([item['id'] for item in items], expected)
+		self.assertEqual(set(items[0]), {'id', 'date'})
+
+	def test_filters(self):
+		items = self._collect(limit=2, status='active', venue='Studio', date_from='2025-01-03')
+		expected = Workshop.objects.filter(status='active', venue='Studio', date__gte='2025-01-03')
+		self.assertEqual({item['id'] for item in items}, set(expected.values_list('id', flat=True)))
+		items = self._collect(date_to='2025-01-01')
+		self.assertEqual(len(items), 2)
+
+	def test_page_query_count_is_constant(self):
+		with self.assertNumQueries(2):
+			data = self.client.get(reverse('workshops_list'), {'limit': 2, 'fields': 'id,is_sold_out'}).json()
+		self.assertEqual(len(data['items']), 2)
+		self.assertFalse(data['items'][0]['is_sold_out'])
+
+	def test_invalid_params(self):
+		url = reverse('workshops_list')
+		self.assertEqual(self.client.get(url, {'cursor': 'not-a-cursor'}).status_code, 400)
+		self.assertEqual(self.client.get(url, {'fields': 'id,secret'}).status_code, 400)
+		self.assertEqual(self.client.get(url, {'date_from': '2025-13-01'}).status_code, 400)
+
+
+class SeatReservationTests(TempMediaMixin, TestCase):
+	def setUp(self):
+		super().setUp()
+		self.ws = make_workshop(capacity=1)
+		self.url = reverse('workshops_register', args=[self.ws.id])
+
+	def test_sold_out_and_repeat_registration(self):
+		first = self.client.post(self.url, {'name': 'A', 'email': 'a@example.com'})
+		self.assertTrue(first.json()['created'])
+		self.assertEqual(first.json()['registrations_count'], 1)
+		again = self.client.post(self.url, {'name': 'A', 'email': 'a@example.com'})
+		self.assertEqual(again.json(), dict(first.json(), created=False))
+		full = self.client.post(self.url, {'name': 'B', 'email': 'b@example.com'})
+		self.assertEqual(full.status_code, 400)
+		self.assertEqual(full.json(), {'error': 'Sold out'})
+
+	def test_counter_follows_admin_changes(self):
+		reg = WorkshopRegistration.objects.create(workshop=self.ws, name='A', email='a@example.com')
+		self.ws.refresh_from_db()
+		self.assertEqual(self.ws.seats_taken, 1)
+		other = make_workshop(title='Other')
+		reg.workshop = other
+		reg.save()
+		self.assertEqual(Workshop.objects.get(pk=self.ws.pk).seats_taken, 0)
+		self.assertEqual(Workshop.objects.get(pk=other.pk).seats_taken, 1)
+		reg.status = 'verified'
+		reg.save()
+		self.assertEqual(Workshop.objects.get(pk=other.pk).seats_taken, 1)
+		reg.delete()
+		self.assertEqual(Workshop.objects.get(pk=other.pk).seats_taken, 0)
+
+	def test_bulk_create_needs_a_recount(self):
+		WorkshopRegistration.objects.bulk_create([
+			WorkshopRegistration(workshop=self.ws, name=f'U{i}', email=f'u{i}@example.com') for i in range(3)
+		])
+		# No signals on this path, so the counter isn't maintained...
+		self.assertEqual(Workshop.objects.get(pk=self.ws.pk).seats_taken, 0)
+		# ...until it is recounted.
+		self.assertEqual(Workshop.objects.all().recount_seats(), 1)
+		self.assertEqual(Workshop.objects.get(pk=self.ws.pk).seats_taken, 3)
+
+
+class ConcurrentSeatReservationTests(TransactionTestCase):
+	capacity = 5
+	attempts = 25
+
+	def test_parallel_registrations_never_oversell(self):
+		ws = make_workshop(capacity=self.capacity)
+		url = reverse('workshops_register', args=[ws.id])
+		barrier = threading.Barrier(self.attempts)
+		statuses = []
+
+		def register(i):
+			try:
+				client = Client()
+				barrier.wait()
+				statuses.append(client.post(url, {'name': f'U{i}', 'email': f'u{i}@example.com'}).status_code)
+			finally:
+				connections.close_all()
+
+		threads = [threading.Thread(target=register, args=(i,)) for i in range(self.attempts)]
+		for t in threads:
+			t.start()
+		for t in threads:
+			t.join()
+
+		self.assertEqual(statuses.count(200), self.capacity)
+		self.assertEqual(statuses.count(400), self.attempts - self.capacity)
+		ws.refresh_from_db()
+		self.assertEqual(ws.seats_taken, self.capacity)
+		self.assertEqual(ws.registrations.count(), self.capacity)
+
+
+class AdminExportTests(TempMediaMixin, TestCase):
+	def setUp(self):
+		super().setUp()
+		exports_root = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, exports_root, True)
+		self.enterContext(override_settings(EXPORTS_ROOT=exports_root))
+		user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'pw')
+		self.client.force_login(user)
+		self.ws = make_workshop(title='Intro, Part 1')
+		make_registrations(self.ws, 3)
+		make_registrations(make_workshop(title='Other'), 2)
+
+	def _export(self, model, action, ids):
+		"""Run the admin action, then the worker, and return the downloaded bytes."""
+		url = reverse(f'admin:api_{model}_changelist')
+		response = self.client.post(url, {'action': action, '_selected_action': ids})
+		self.assertEqual(response.status_code, 302)
+		job = ExportJob.objects.get()
+		self.assertEqual(job.status, 'queued')
+		self.assertEqual(jobs.run_next().status, 'done')
+		self.assertIsNone(jobs.run_next())
+		job.refresh_from_db()
+		self.assertEqual(job.progress, job.total)
+		download = self.client.get(reverse('admin:api_exportjob_download', args=[job.pk]))
+		self.assertEqual(download.status_code, 200)
+		return b''.join(download.streaming_content)
+
+	def test_workshop_csv(self):
+		lines = self._export('workshop', 'export_workshop_registrations_csv', [self.ws.id]).decode().splitlines()
+		self.assertEqual(lines[0], 'Workshop,Name,Email,WhatsApp,Organization,Status,Admin Notes,Created At')
+		self.assertEqual(len(lines), 4)
+		self.assertTrue(lines[1].startswith('"Intro, Part 1",User 0,'))
+
+	@unittest.skipIf(openpyxl is None, "openpyxl not installed")
+	def test_workshop_xlsx_one_sheet_per_workshop(self):
+		ids = list(Workshop.objects.values_list('id', flat=True))
+		content = self._export('workshop', 'export_workshop_registrations_xlsx_by_workshop', ids)
+		wb = openpyxl.load_workbook(io.BytesIO(content), read_only=True)
+		self.assertEqual(wb.sheetnames, ['Intro, Part 1', 'Other'])
+		self.assertEqual(len(list(wb['Intro, Part 1'].values)), 4)
+		self.assertEqual(len(list(wb['Other'].values)), 3)
+
+	@unittest.skipIf(openpyxl is None, "openpyxl not installed")
+	def test_registration_xlsx(self):
+		ids = list(WorkshopRegistration.objects.values_list('id', flat=True))
+		content = self._export('workshopregistration', 'download_xlsx', ids)
+		rows = list(openpyxl.load_workbook(io.BytesIO(content), read_only=True)['Registrations'].values)
+		self.assertEqual(rows[0][0], 'Workshop')
+		self.assertEqual(len(rows), 6)
+
+	def test_registration_csv(self):
+		ids = list(WorkshopRegistration.objects.values_list('id', flat=True)[:2])
+		content = self._export('workshopregistration', 'download_csv', ids)
+		self.assertEqual(len(content.decode().splitlines()), 3)
+
+	def test_selection_is_stored_as_workshops_and_rows_not_ids(self):
+		other = Workshop.objects.get(title='Other')
+		url = reverse('admin:api_workshopregistration_changelist')
+		# "Select all" across the changelist: whole workshops, no ids.
+		self.client.post(url, {'action': 'download_csv', 'select_across': '1', '_selected_action': [0], 'index': 0})
+		job = ExportJob.objects.get()
+		self.assertEqual(job.params, {'workshop_ids': sorted([self.ws.id, other.id])})
+		self.assertEqual(jobs.job_queryset(job).count(), 5)
+		ExportJob.objects.all().delete()
+		ids = list(self.ws.registrations.values_list('id', flat=True)) + [other.registrations.first().id]
+		content = self._export('workshopregistration', 'download_csv', ids)
+		job = ExportJob.objects.get()
+		self.assertEqual(job.params, {'workshop_ids': [self.ws.id], 'selection': True})
+		self.assertEqual(list(job.selection.values_list('registration_id', flat=True)), ids[-1:])
+		self.assertEqual(len(content.decode().splitlines()), 5)
+
+	def test_failed_job_records_error(self):
+		job = jobs.enqueue('sheets', registrations=WorkshopRegistration.objects.none())
+		with self.assertLogs('api.jobs', level='ERROR'):
+			jobs.run_next()
+		job.refresh_from_db()
+		self.assertEqual(job.status, 'failed')
+		self.assertIn('ImproperlyConfigured', job.error)
+		self.assertEqual(self.client.get(reverse('admin:api_exportjob_download', args=[job.pk])).status_code, 404)
+
+	def test_database_error_before_export_fails_the_job(self):
+		job = jobs.enqueue('csv', workshop_ids=[self.ws.id])
+		with mock.patch.object(jobs, 'job_queryset', side_effect=DatabaseError('gone')), self.assertLogs('api.jobs', level='ERROR'):
+			jobs.run_next()
+		job.refresh_from_db()
+		self.assertEqual(job.status, 'failed')
+		self.assertIn('DatabaseError', job.error)
+
+	@override_settings(EXPORT_JOB_STALE_SECONDS=60, EXPORT_JOB_MAX_ATTEMPTS=2)
+	def test_jobs_orphaned_by_a_killed_worker_are_recovered(self):
+		job = jobs.enqueue('csv', workshop_ids=[self.ws.id])
+		self.assertEqual(jobs.claim_next().pk, job.pk)
+		# Still heartbeating: left alone.
+		self.assertEqual(jobs.requeue_stale(), (0, 0))
+		ExportJob.objects.filter(pk=job.pk).update(heartbeat_at=timezone.now() - datetime.timedelta(minutes=2))
+		self.assertEqual(jobs.requeue_stale(), (1, 0))
+		self.assertEqual(jobs.claim_next().attempts, 2)
+		ExportJob.objects.filter(pk=job.pk).update(heartbeat_at=timezone.now() - datetime.timedelta(minutes=2))
+		self.assertEqual(jobs.requeue_stale(), (0, 1))
+		job.refresh_from_db()
+		self.assertEqual(job.status, 'failed')
+		self.assertIsNone(jobs.claim_next())
+
+	@override_settings(EXPORT_JOB_STALE_SECONDS=60)
+	def test_requeued_job_ignores_its_previous_worker(self):
+		job = jobs.enqueue('csv', workshop_ids=[self.ws.id])
+		slow = jobs.claim_next()
+		ExportJob.objects.filter(pk=job.pk).update(heartbeat_at=timezone.now() - datetime.timedelta(minutes=2))
+		jobs.requeue_stale()
+		self.assertEqual(jobs.claim_next().attempts, 2)
+		with self.assertLogs('api.jobs', level='WARNING'):
+			jobs.run_job(slow)
+		job.refresh_from_db()
+		self.assertEqual((job.status, job.progress, job.total, job.file.name), ('running', 0, 0, ''))
+		self.assertEqual([files for _root, _dirs, files in os.walk(settings.EXPORTS_ROOT) if files], [])
+
+	def test_database_export_storage(self):
+		field = ExportJob._meta.get_field('file')
+		self.enterContext(mock.patch.object(field, 'storage', DatabaseExportStorage()))
+		lines = self._export('workshop', 'export_workshop_registrations_csv', [self.ws.id]).decode().splitlines()
+		self.assertEqual(len(lines), 4)
+		self.assertEqual(ExportFile.objects.count(), 1)
+		self.assertEqual(os.listdir(settings.EXPORTS_ROOT), [])
+
+
+class DashboardTests(TempMediaMixin, TestCase):
+	def setUp(self):
+		super().setUp()
+		self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'pw'))
+		self.ws = make_workshop(capacity=10)
+		# One at a time: the daily rollup is kept by the save signals.
+		for i in range(3):
+			WorkshopRegistration.objects.create(workshop=self.ws, name=f'User {i}', email=f'user{i}@example.com')
+		WorkshopRegistration.objects.filter(email__startswith='user0').update(status='verified')
+		WorkshopRegistration.objects.filter(email__startswith='user1').update(status='rejected')
+
+	def test_both_urls_share_one_cached_build(self):
+		with self.assertNumQueries(3):
+			data = stats.dashboard_stats()
+		self.assertEqual(data['stats'], {
+			'workshops_total': 1, 'registrations_total': 3, 'registrations_verified': 1,
+			'registrations_pending': 1, 'registrations_rejected': 1,
+		})
+		self.assertEqual(data['by_workshop'][0]['reg_count'], 3)
+		self.assertEqual(data['series'][-1], {'day': timezone.localdate(), 'count': 3})
+		for url in (reverse('admin-dashboard'), reverse('admin:workshop-dashboard')):
+			response = self.client.get(url)
+			self.assertEqual(response.status_code, 200)
+			self.assertEqual(response.context['stats'], data['stats'])
+
+	def test_invalidated_by_registration_changes(self):
+		stats.dashboard_stats()
+		make_registrations(make_workshop(title='Other'), 2)
+		self.assertEqual(stats.dashboard_stats()['stats']['registrations_total'], 5)
+		url = reverse('admin:api_workshopregistration_changelist')
+		ids = list(WorkshopRegistration.objects.filter(status='pending').values_list('id', flat=True))
+		self.client.post(url, {'action': 'mark_verified', '_selected_action': ids})
+		self.assertEqual(stats.dashboard_stats()['stats']['registrations_verified'], 4)
+
+	def test_daily_rollup_tracks_creates_and_deletes(self):
+		today = timezone.localdate()
+		self.assertEqual(RegistrationDay.objects.get(day=today).count, 3)
+		WorkshopRegistration.objects.first().delete()
+		self.assertEqual(RegistrationDay.objects.get(day=today).count, 2)
+
+
+class WorkshopChangelistTests(TestCase):
+	def setUp(self):
+		self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'pw'))
+		self.url = reverse('admin:api_workshop_changelist')
+
+	def _changelist_queries(self, **params):
+		with CaptureQueriesContext(connection) as ctx:
+			response = self.client.get(self.url, params)
+		self.assertEqual(response.status_code, 200)
+		return response, len(ctx.captured_queries)
+
+	def test_constant_queries_at_100_workshops(self):
+		make_registrations(make_workshop(), 2)
+		_response, baseline = self._changelist_queries()
+		for i in range(99):
+			make_workshop(title=f'Workshop {i}', date=datetime.date(2025, 2, 1) + datetime.timedelta(days=i))
+		response, queries = self._changelist_queries()
+		self.assertEqual(queries, baseline)
+		self.assertEqual(len(response.context['cl'].result_list), 100)
+
+	def test_breakdown_columns_sort_from_annotation(self):
+		busy = make_workshop(title='Busy', capacity=10)
+		make_registrations(busy, 3)
+		WorkshopRegistration.objects.filter(workshop=busy, email__startswith='user0').update(status='verified')
+		make_workshop(title='Quiet')
+		fields = list(WorkshopAdmin.list_display)
+		response, _queries = self._changelist_queries(o=f'-{fields.index("pending_count") + 1}')
+		first = response.context['cl'].result_list[0]
+		self.assertEqual((first.title, first.seats_taken, first.verified_count, first.pending_count), ('Busy', 3, 1, 2))
+
+
+class RegistrationInlineTests(TestCase):
+	def setUp(self):
+		self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'pw'))
+		self.ws = make_workshop(capacity=100)
+		self.url = reverse('admin:api_workshop_change', args=[self.ws.id])
+
+	def _get(self, **params):
+		with CaptureQueriesContext(connection) as ctx:
+			response = self.client.get(self.url, params)
+		self.assertEqual(response.status_code, 200)
+		formset = response.context['inline_admin_formsets'][0].formset
+		return formset, len(ctx.captured_queries)
+
+	def test_one_page_of_forms_in_bounded_queries(self):
+		make_registrations(self.ws, 5)
+		self._get()  # warm the ContentType cache used by show_change_link
+		_formset, baseline = self._get()
+		make_registrations(make_workshop(title='Other', capacity=100), 1)
+		for i in range(5, 80):
+			WorkshopRegistration.objects.create(workshop=self.ws, name=f'User {i}', email=f'more{i}@example.com')
+		formset, queries = self._get()
+		self.assertEqual(queries, baseline)
+		self.assertEqual(len(formset.forms), 25)
+		self.assertEqual(formset.page.paginator.num_pages, 4)
+		last, _ = self._get(registrations_page=4)
+		self.assertEqual(len(last.forms), 5)
+
+	def test_status_filter_and_save_posts_only_page_rows(self):
+		make_registrations(self.ws, 30)
+		WorkshopRegistration.objects.filter(email__startswith='user1').update(status='verified')
+		formset, _ = self._get(registrations_status='verified')
+		self.assertEqual(len(formset.forms), 11)
+		self.assertTrue(all(form.instance.status == 'verified' for form in formset.forms))
+
+		formset, _ = self._get(registrations_page=2)
+		data = {
+			'title': self.ws.title, 'status': self.ws.status, 'date': '2025-01-01',
+			'start_time': '10:00', 'end_time': '12:00', 'venue': self.ws.venue,
+			'capacity': self.ws.capacity, 'amount': '0',
+		}
+		prefix = formset.prefix
+		data.update({
+			f'{prefix}-TOTAL_FORMS': len(formset.forms), f'{prefix}-INITIAL_FORMS': len(formset.forms),
+			f'{prefix}-MIN_NUM_FORMS': 0, f'{prefix}-MAX_NUM_FORMS': 1000,
+		})
+		for i, form in enumerate(formset.forms):
+			data[f'{prefix}-{i}-id'] = form.instance.pk
+			data[f'{prefix}-{i}-workshop'] = self.ws.pk
+			data[f'{prefix}-{i}-status'] = 'rejected' if i == 0 else form.instance.status
+			data[f'{prefix}-{i}-admin_notes'] = ''
+		self.assertEqual(len(formset.forms), 5)
+		# A registration arriving between GET and POST must not shift which rows the post edits.
+		WorkshopRegistration.objects.create(workshop=self.ws, name='Late', email='late@example.com')
+		response = self.client.post(f'{self.url}?registrations_page=2', data)
+		self.assertEqual(response.status_code, 302)
+		self.assertEqual(WorkshopRegistration.objects.get(pk=formset.forms[0].instance.pk).status, 'rejected')
+		self.assertEqual(WorkshopRegistration.objects.filter(status='rejected').count(), 1)
+		self.assertEqual(self.ws.registrations.count(), 31)
+
+
+@unittest.skipUnless(connection.vendor == 'sqlite', "FTS5 index is SQLite-only")
+class AdminSearchTests(TestCase):
+	def setUp(self):
+		self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'pw'))
+		self.ws = make_workshop(title='Watercolour Basics', capacity=10)
+		WorkshopRegistration.objects.create(workshop=self.ws, name='Asha Rao', email='asha@example.com')
+		WorkshopRegistration.objects.create(workshop=self.ws, name='Ravi Kumar', email='ravi@sample.org')
+		make_registrations(make_workshop(title='Pottery', capacity=10), 2)
+
+	def _search(self, model, q):
+		with CaptureQueriesContext(connection) as ctx:
+			response = self.client.get(reverse(f'admin:api_{model}_changelist'), {'q': q})
+		self.assertEqual(response.status_code, 200)
+		sql = ' '.join(query['sql'] for query in ctx.captured_queries)
+		return sorted(str(obj) for obj in response.context['cl'].result_list), sql
+
+	def test_registration_search_uses_index(self):
+		results, sql = self._search('workshopregistration', 'SAMPLE')
+		self.assertEqual(results, ['Ravi Kumar - Watercolour Basics'])
+		self.assertIn('MATCH', sql)
+		self.assertNotIn('LIKE', sql)
+		results, _sql = self._search('workshopregistration', 'colour asha')
+		self.assertEqual(results, ['Asha Rao - Watercolour Basics'])
+
+	def test_index_follows_bulk_updates_and_renames(self):
+		WorkshopRegistration.objects.filter(name='Asha Rao').update(name='Asha Menon')
+		Workshop.objects.filter(pk=self.ws.pk).update(title='Ink Drawing')
+		self.assertEqual(self._search('workshopregistration', 'menon')[0], ['Asha Menon - Ink Drawing'])
+		self.assertEqual(len(self._search('workshopregistration', 'drawing')[0]), 2)
+		self.assertEqual(self._search('workshopregistration', 'watercolour')[0], [])
+		WorkshopRegistration.objects.filter(name='Asha Menon').delete()
+		self.assertEqual(self._search('workshopregistration', 'menon')[0], [])
+
+	def test_short_terms_fall_back_to_default_search(self):
+		results, sql = self._search('workshopregistration', 'ra')
+		self.assertIn('LIKE', sql)
+		self.assertEqual(results, ['Asha Rao - Watercolour Basics', 'Ravi Kumar - Watercolour Basics'])
+
+	def test_contact_search_and_repair(self):
+		ContactSubmission.objects.create(name='Meera', email='meera@example.com', service='Branding', message='Hi')
+		with connection.cursor() as cursor:
+			cursor.execute("DROP TRIGGER api_contact_search_ai")
+		ContactSubmission.objects.create(name='Kiran', email='kiran@example.com', service='Web design', message='Hi')
+		search.install(connection)
+		self.assertEqual(len(self._search('contactsubmission', 'example.com')[0]), 2)
+		self.assertEqual(len(self._search('contactsubmission', 'design')[0]), 1)
+
+
+class SheetsSyncTests(TempMediaMixin, TestCase):
+	def setUp(self):
+		super().setUp()
+		self.client_fake = sheets.FakeSheetsClient()
+		self.ws = make_workshop()
+		make_registrations(self.ws, 3)
+
+	def _sync(self, queryset=None):
+		queryset = queryset if queryset is not None else WorkshopRegistration.objects.all()
+		return sheets.sync_registrations(queryset, self.client_fake, 'sheet-id', sleep=lambda s: None)
+
+	def _rows(self):
+		return self.client_fake.worksheet('sheet-id', sheets.WORKSHEET_TITLE).rows
+
+	def test_only_new_and_changed_rows_are_sent(self):
+		self.assertEqual(self._sync(), (3, 0))
+		self.assertEqual(self._rows()[0][0], 'Workshop')
+		self.assertEqual(len(self._rows()), 4)
+
+		self.assertEqual(self._sync(), (0, 0))
+		self.assertEqual(len(self._rows()), 4)
+
+		reg = WorkshopRegistration.objects.order_by('id')[1]
+		WorkshopRegistration.objects.filter(pk=reg.pk).update(status='verified', admin_notes='paid')
+		WorkshopRegistration.objects.create(workshop=self.ws, name='New', email='new@example.com')
+		self.assertEqual(self._sync(), (1, 1))
+		rows = self._rows()
+		self.assertEqual(len(rows), 5)
+		self.assertEqual(rows[2][5:7], ['verified', 'paid'])
+		self.assertEqual(rows[4][1], 'New')
+		self.assertEqual(SheetSyncRow.objects.count(), 4)
+
+		worksheet = self.client_fake.worksheet('sheet-id', sheets.WORKSHEET_TITLE)
+		self.assertNotIn('get_all_values', worksheet.calls)
+		self.assertEqual(worksheet.calls.count('first_row'), 1)
+
+	def test_batches_large_syncs(self):
+		make_registrations(make_workshop(title='Big'), 7)
+		with mock.patch.object(sheets, 'BATCH_SIZE', 4):
+			self.assertEqual(self._sync(), (10, 0))
+		worksheet = self.client_fake.worksheet('sheet-id', sheets.WORKSHEET_TITLE)
+		self.assertEqual(worksheet.calls.count('append_rows'), 1 + 3)
+		row_numbers = sorted(SheetSyncRow.objects.values_list('row_number', flat=True))
+		self.assertEqual(row_numbers, list(range(2, 12)))
+
+	def test_retries_transient_errors_with_backoff(self):
+		calls, delays = [], []
+
+		def flaky():
+			calls.append(1)
+			if len(calls) < 3:
+				raise sheets.RetryableSheetsError('429')
+			return 'ok'
+
+		self.assertEqual(sheets.with_retry(flaky, sleep=delays.append), 'ok')
+		self.assertEqual(len(delays), 2)
+		self.assertLess(delays[0], delays[1] + sheets.BACKOFF_BASE)
+		calls.clear()
+		with self.assertRaises(sheets.RetryableSheetsError):
+			sheets.with_retry(flaky, sleep=delays.append, attempts=2)
+
+	def test_append_applied_despite_error_is_not_repeated(self):
+		worksheet = self.client_fake.worksheet('sheet-id', sheets.WORKSHEET_TITLE)
+		append_rows = worksheet.append_rows
+		failures = []
+
+		def timed_out_after_applying(rows):
+			first = append_rows(rows)
+			if len(rows) > 1 and not failures:
+				failures.append(rows)
+				raise sheets.RetryableSheetsError('503')
+			return first
+
+		with mock.patch.object(worksheet, 'append_rows', side_effect=timed_out_after_applying):
+			self.assertEqual(self._sync(), (3, 0))
+		self.assertEqual(len(failures), 1)
+		self.assertEqual(len(self._rows()), 4)
+		self.assertEqual(sorted(SheetSyncRow.objects.values_list('row_number', flat=True)), [2, 3, 4])
+
+	def test_clients_implement_the_interface(self):
+		with self.assertRaises(TypeError):
+			type('Partial', (sheets.WorksheetHandle,), {'first_row': lambda self: []})()
+
+	@override_settings(GOOGLE_SHEETS_SPREADSHEET_ID='sheet-id', GOOGLE_SHEETS_CREDENTIALS_FILE='creds.json')
+	def test_admin_action_queues_sync_job(self):
+		user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'pw')
+		self.client.force_login(user)
+		self.client.post(reverse('admin:api_workshop_changelist'), {
+			'action': 'export_workshop_registrations_to_google_sheets', '_selected_action': [self.ws.id],
+		})
+		self.assertEqual(self._rows(), [])
+		with mock.patch.object(sheets, 'get_client', return_value=self.client_fake):
+			job = jobs.run_next()
+		self.assertEqual(job.result, '3 new, 0 updated')
+		self.assertEqual(len(self._rows()), 4)
+
+
+@override_settings(THUMBNAIL_ASYNC=False)
+class ThumbnailTests(TempMediaMixin, TestCase):
+	def test_api_urls_use_renditions_not_thumbnails(self):
+		with self.captureOnCommitCallbacks(execute=True):
+			ws = make_workshop(image=make_image(), payment_qr=make_image('qr.png', (600, 600), 'PNG'))
+		ws.refresh_from_db()
+		for field_file in (ws.image, ws.payment_qr):
+			for size in settings.THUMBNAIL_SIZES:
+				self.assertFalse(field_file.storage.exists(thumbnails.thumbnail_name(field_file.name, size)))
+
+		data = self.client.get(reverse('workshops_detail', args=[ws.id])).json()
+		# The widest rendition up to IMAGE_URL_WIDTH, or the narrowest one.
+		image = dict(ws.image_derivatives['webp'])[settings.IMAGE_URL_WIDTH]
+		self.assertEqual(data['image_url'], 'http://testserver' + ws.image.storage.url(image))
+		qr = dict(ws.payment_qr_derivatives['webp'])[320]
+		self.assertEqual(data['payment_qr'], 'http://testserver' + ws.payment_qr.storage.url(qr))
+
+	def test_api_url_falls_back_to_original_until_renditions_exist(self):
+		ws = make_workshop(image=make_image())
+		Workshop.objects.filter(pk=ws.pk).update(image_derivatives={})
+		data = self.client.get(reverse('workshops_detail', args=[ws.id])).json()
+		self.assertEqual(data['image_url'], 'http://testserver' + ws.image.url)
+
+	def test_pool_threads_close_their_connection(self):
+		with mock.patch.object(thumbnails, 'close_old_connections') as close:
+			thumbnails._run(('thumbnails', 'a.jpg'), lambda: None, pooled=True)
+			close.assert_called_once_with()
+			close.reset_mock()
+			thumbnails._run(('thumbnails', 'a.jpg'), lambda: None)
+			close.assert_not_called()
+
+	def test_admin_preview_uses_small_thumbnail(self):
+		ws = make_workshop()
+		with self.captureOnCommitCallbacks(execute=True):
+			reg = WorkshopRegistration.objects.create(workshop=ws, name='A', email='a@example.com', payment_proof=make_image())
+		html = _proof_preview(reg, 100)
+		self.assertIn(thumbnails.thumbnail_name(reg.payment_proof.name, 'small'), html)
+		self.assertIn('loading="lazy"', html)
+
+	def test_missing_thumbnail_is_generated_lazily(self):
+		with self.captureOnCommitCallbacks(execute=True):
+			reg = WorkshopRegistration.objects.create(workshop=make_workshop(), name='A', email='a@example.com', payment_proof=make_image())
+		proof = reg.payment_proof
+		name = thumbnails.thumbnail_name(proof.name, 'small')
+		self.assertTrue(name.startswith('workshops/proofs/thumbs/'))
+		proof.storage.delete(name)
+		with self.captureOnCommitCallbacks(execute=True):
+			self.assertEqual(thumbnails.thumbnail_url(proof, 'small'), proof.url)
+		self.assertTrue(proof.storage.exists(name))
+		self.assertTrue(thumbnails.thumbnail_url(proof, 'small').endswith(name))
+
+
+@override_settings(THUMBNAIL_ASYNC=False)
+class ResponsiveImageTests(TempMediaMixin, TestCase):
+	def test_srcset_in_api(self):
+		with self.captureOnCommitCallbacks(execute=True):
+			ws = make_workshop(image=make_image(size=(1000, 500)))
+		ws.refresh_from_db()
+		self.assertEqual([w for w, _ in ws.image_derivatives['webp']], [320, 640])
+		data = self.client.get(reverse('workshops_detail', args=[ws.id])).json()
+		webp = data['image_srcset']['webp'].split(', ')
+		self.assertEqual(len(webp), 2)
+		self.assertTrue(webp[0].startswith('http://testserver/media/workshops/images/derivatives/'))
+		self.assertTrue(webp[0].endswith('.webp 320w'))
+		self.assertTrue(data['image_srcset']['jpeg'].endswith('.jpg 640w'))
+		self.assertEqual(data['payment_qr_srcset'], {})
+
+	def test_regenerates_only_when_source_changes(self):
+		with self.captureOnCommitCallbacks(execute=True):
+			ws = make_workshop(image=make_image(size=(700, 700)))
+		ws.refresh_from_db()
+		first = ws.image_derivatives
+		with mock.patch.object(thumbnails, 'build_derivatives') as build:
+			with self.captureOnCommitCallbacks(execute=True):
+				ws.title = 'Renamed'
+				ws.save()
+			build.assert_not_called()
+		with self.captureOnCommitCallbacks(execute=True):
+			ws.image = make_image('other.jpg', size=(200, 100))
+			ws.save()
+		ws.refresh_from_db()
+		self.assertNotEqual(ws.image_derivatives['sha256'], first['sha256'])
+		self.assertEqual([w for w, _ in ws.image_derivatives['jpeg']], [200])
+
+	def test_identical_uploads_share_renditions(self):
+		with self.captureOnCommitCallbacks(execute=True):
+			a = make_workshop(image=make_image('a.jpg'))
+			b = make_workshop(image=make_image('b.jpg'))
+		a.refresh_from_db()
+		b.refresh_from_db()
+		# Same bytes, same stored file.
+		self.assertEqual(a.image.name, b.image.name)
+		self.assertEqual(a.image_derivatives['webp'], b.image_derivatives['webp'])
+
+	def test_backfill_command(self):
+		ws = make_workshop(image=make_image())
+		Workshop.objects.filter(pk=ws.pk).update(image_derivatives={})
+		call_command('build_image_derivatives', stdout=io.StringIO())
+		ws.refresh_from_db()
+		self.assertEqual(len(ws.image_derivatives['webp']), 3)
+
+
+class MediaServingTests(TempMediaMixin, TestCase):
+	def setUp(self):
+		super().setUp()
+		os.makedirs(os.path.join(self.media_root, 'workshops', 'images', 'derivatives'))
+		os.makedirs(os.path.join(self.media_root, 'workshops', 'proofs'))
+		self.body = bytes(range(256)) * 4
+		self.proof = 'workshops/proofs/' + 'a' * 64 + '.jpg'
+		for name in ('workshops/photo.jpg', 'workshops/images/derivatives/0123456789abcdef-320w.webp', self.proof):
+			with open(os.path.join(self.media_root, name), 'wb') as fh:
+				fh.write(self.body)
+
+	def test_full_response_uses_file_wrapper_and_validators(self):
+		response = self.client.get('/media/workshops/photo.jpg')
+		self.assertEqual(response.status_code, 200)
+		self.assertTrue(hasattr(response, 'file_to_stream'))
+		self.assertEqual(b''.join(response.streaming_content), self.body)
+		self.assertEqual(response['Content-Type'], 'image/jpeg')
+		self.assertEqual(response['Cache-Control'], f'public, max-age={settings.MEDIA_CACHE_MAX_AGE}')
+		self.assertEqual(self.client.get('/media/workshops/photo.jpg', HTTP_IF_NONE_MATCH=response['ETag']).status_code, 304)
+		self.assertEqual(self.client.get('/media/workshops/photo.jpg', HTTP_IF_MODIFIED_SINCE=response['Last-Modified']).status_code, 304)
+
+	def test_compressed_files_are_served_as_archives(self):
+		for name, content_type in (('data.csv.gz', 'application/gzip'), ('notes.txt.br', 'application/octet-stream')):
+			with open(os.path.join(self.media_root, 'workshops', name), 'wb') as fh:
+				fh.write(self.body)
+			response = self.client.get('/media/workshops/' + name)
+			self.assertEqual(response['Content-Type'], content_type)
+			self.assertNotIn('Content-Encoding', response)
+
+	def test_hashed_names_are_immutable(self):
+		response = self.client.get('/media/workshops/images/derivatives/0123456789abcdef-320w.webp')
+		self.assertEqual(response['Cache-Control'], f'public, max-age={IMMUTABLE_MAX_AGE}, immutable')
+
+	def test_payment_proofs_are_staff_only_and_not_cached(self):
+		self.assertEqual(self.client.get('/media/' + self.proof).status_code, 404)
+		self.assertEqual(self.client.get('/media/workshops//proofs/' + self.proof.rsplit('/', 1)[1]).status_code, 404)
+		self.assertEqual(self.client.get('/media/workshops/images/../proofs/' + self.proof.rsplit('/', 1)[1]).status_code, 404)
+		self.client.force_login(get_user_model().objects.create_user('visitor', password='pw'))
+		self.assertEqual(self.client.get('/media/' + self.proof).status_code, 404)
+		self.client.force_login(get_user_model().objects.create_user('staff', password='pw', is_staff=True))
+		response = self.client.get('/media/' + self.proof)
+		self.assertEqual(response.status_code, 200)
+		self.assertEqual(response['Cache-Control'], 'private, no-store')
+
+	def test_byte_ranges(self):
+		response = self.client.get('/media/workshops/photo.jpg', HTTP_RANGE='bytes=10-19')
+		self.assertEqual(response.status_code, 206)
+		self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(self.body)}')
+		self.assertEqual(b''.join(response.streaming_content), self.body[10:20])
+		suffix = self.client.get('/media/workshops/photo.jpg', HTTP_RANGE='bytes=-5')
+		self.assertEqual(b''.join(suffix.streaming_content), self.body[-5:])
+		stale = self.client.get('/media/workshops/photo.jpg', HTTP_RANGE='bytes=0-1', HTTP_IF_RANGE='"old"')
+		self.assertEqual(stale.status_code, 200)
+		unsatisfiable = self.client.get('/media/workshops/photo.jpg', HTTP_RANGE=f'bytes={len(self.body)}-')
+		self.assertEqual(unsatisfiable.status_code, 416)
+
+	def test_missing_and_traversal(self):
+		self.assertEqual(self.client.get('/media/workshops/nope.jpg').status_code, 404)
+		self.assertEqual(self.client.get('/media/../server/settings.py').status_code, 404)
+		self.assertEqual(self.client.get('/media/workshops').status_code, 404)
+
+	def test_media_url_is_matched_literally(self):
+		with override_settings(MEDIA_URL='/media.v2/'):
+			importlib.reload(server_urls)
+		clear_url_caches()
+		self.addCleanup(clear_url_caches)
+		self.addCleanup(importlib.reload, server_urls)
+		self.assertEqual(resolve('/media.v2/workshops/photo.jpg').kwargs, {'path': 'workshops/photo.jpg'})
+		self.assertEqual(server_urls.urlpatterns[-1].resolve('mediaXv2/workshops/photo.jpg'), None)
+
+	def test_offload_modes(self):
+		with override_settings(MEDIA_SERVE_MODE='x-accel-redirect'):
+			response = self.client.get('/media/workshops/photo.jpg')
+			self.assertEqual(response['X-Accel-Redirect'], '/protected-media/workshops/photo.jpg')
+			self.assertEqual(response.content, b'')
+		with override_settings(MEDIA_SERVE_MODE='x-sendfile'):
+			response = self.client.get('/media/workshops/photo.jpg')
+			self.assertEqual(response['X-Sendfile'], os.path.join(self.media_root, 'workshops', 'photo.jpg'))
+
+
+class BufferedContactIngestTests(TestCase):
+	def setUp(self):
+		spool = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, spool, True)
+		self.enterContext(override_settings(
+			CONTACT_INGEST_MODE='buffered', CONTACT_SPOOL_DIR=spool,
+			CONTACT_BATCH_SIZE=3, CONTACT_INGEST_ASYNC=False,
+		))
+		self.spool = spool
+
+	def _post(self, name):
+		return self.client.post(
+			reverse('contact'), {'name': name, 'email': f'{name}@example.com', 'message': 'Hello'},
+			content_type='application/json',
+		)
+
+	def test_acknowledged_then_flushed_in_batches(self):
+		first = self._post('asha')
+		self.assertEqual(first.status_code, 202)
+		ingest_id = first.json()['id']
+		self.assertEqual(len(ingest_id), 26)
+		self.assertFalse(ContactSubmission.objects.exists())
+		self._post('ravi')
+		self.assertFalse(ContactSubmission.objects.exists())
+		with self.assertNumQueries(3):  # savepoint, one INSERT, release
+			self._post('meera')
+		self.assertEqual(ContactSubmission.objects.get(ingest_id=ingest_id).name, 'asha')
+		self.assertEqual(ContactSubmission.objects.count(), 3)
+		self.assertEqual(os.listdir(self.spool), [])
+		self._post('kiran')
+		call_command('flush_contact_spool', stdout=io.StringIO())
+		self.assertEqual(ContactSubmission.objects.count(), 4)
+
+	def test_created_at_is_submission_time(self):
+		submitted = timezone.now()
+		ingest_id = self._post('asha').json()['id']
+		with mock.patch('django.utils.timezone.now', return_value=submitted + datetime.timedelta(hours=1)):
+			ingest.flush()
+		created_at = ContactSubmission.objects.get(ingest_id=ingest_id).created_at
+		self.assertLess(abs(created_at - submitted), datetime.timedelta(seconds=1))
+
+	def test_flush_at_exit_writes_the_buffer(self):
+		self._post('asha')
+		ingest._flush_at_exit()
+		self.assertEqual(ContactSubmission.objects.count(), 1)
+		self._post('ravi')
+		with mock.patch.object(ContactSubmission.objects, 'bulk_create', side_effect=DatabaseError):
+			with self.assertLogs('api.ingest', level='ERROR'):
+				ingest._flush_at_exit()
+		# Sealed for the next process instead.
+		self.assertEqual([name.startswith('batch-') for name in os.listdir(self.spool)], [True])
+
+	def test_unexpected_spool_files_are_skipped(self):
+		for name in ('current-abc.jsonl', 'batch-x.jsonl.tmp', 'notes.txt'):
+			open(os.path.join(self.spool, name), 'w').close()
+		self._post('asha')
+		self.assertEqual(ingest.flush(), 1)
+		self.assertEqual(sorted(os.listdir(self.spool)), ['batch-x.jsonl.tmp', 'current-abc.jsonl', 'notes.txt'])
+
+	def test_replay_after_crash_is_idempotent(self):
+		ids = [ingest.new_ulid() for _ in range(3)]
+		ContactSubmission.objects.create(name='Already', email='a@example.com', message='m', ingest_id=ids[0])
+		lines = [json.dumps({'id': i, 'name': f'N{n}', 'email': 'x@example.com', 'service': '', 'message': 'm'}) for n, i in enumerate(ids)]
+		# A dead worker's open spool (with a torn last write) and a batch it had claimed.
+		with open(os.path.join(self.spool, 'current-999999999.jsonl'), 'w') as fh:
+			fh.write(lines[2] + '\n{"id": "01TORN')
+		with open(os.path.join(self.spool, 'batch-00000000000000000000000000.jsonl.999999999'), 'w') as fh:
+			fh.write(lines[0] + '\n' + lines[1] + '\n')
+		self.assertEqual(ingest.flush(), 3)
+		self.assertEqual(sorted(ContactSubmission.objects.values_list('ingest_id', flat=True)), sorted(ids))
+		self.assertEqual(ContactSubmission.objects.get(ingest_id=ids[0]).name, 'Already')
+		self.assertEqual(os.listdir(self.spool), [])
+
+
+class RequestTimingTests(TempMediaMixin, TestCase):
+	def setUp(self):
+		super().setUp()
+		make_workshop()
+
+	def test_disabled_by_default(self):
+		with self.assertRaises(MiddlewareNotUsed):
+			timing.RequestTimingMiddleware(lambda request: None)
+		self.assertNotIn('Server-Timing', self.client.get(reverse('workshops_list')))
+
+	@override_settings(REQUEST_TIMING=True, SLOW_REQUEST_MS=60000)
+	def test_server_timing_header(self):
+		response = Client().get(reverse('workshops_list'))
+		metrics = response['Server-Timing']
+		self.assertRegex(metrics, r'^db;dur=[\d.]+;desc="2 queries", serialize;dur=[\d.]+, total;dur=[\d.]+$')
+		cached = Client().get(reverse('workshops_list'))['Server-Timing']
+		self.assertTrue(cached.startswith('db;dur=0.0;desc="0 queries", total;'))
+
+	@override_settings(REQUEST_TIMING=True, SLOW_REQUEST_MS=60000)
+	async def test_async_views_count_queries_on_worker_thread_connections(self):
+		def query():
+			try:
+				with connection.cursor() as cursor:
+					cursor.execute('SELECT 1')
+			finally:
+				connection.close()
+
+		async def view(request):
+			# A new thread, so a connection the middleware has never seen.
+			await sync_to_async(query, thread_sensitive=False)()
+			return HttpResponse('ok')
+
+		response = await timing.RequestTimingMiddleware(view)(RequestFactory().get('/probe'))
+		self.assertRegex(response['Server-Timing'], r'^db;dur=[\d.]+;desc="1 queries", total;')
+
+	@override_settings(REQUEST_TIMING=True, SLOW_REQUEST_MS=0, N_PLUS_ONE_THRESHOLD=3)
+	def test_slow_request_and_n_plus_one_logging(self):
+		def view(request):
+			for ws in Workshop.objects.all()[:1]:
+				for _ in range(3):
+					Workshop.objects.filter(pk=ws.pk).exists()
+			return HttpResponse('ok')
+
+		middleware = timing.RequestTimingMiddleware(view)
+		with self.assertLogs('api.timing', level='WARNING') as logs:
+			response = middleware(RequestFactory().get('/probe'))
+		self.assertIn('desc="4 queries"', response['Server-Timing'])
+		self.assertEqual(len(logs.records), 2)
+		self.assertIn('Likely N+1 in /probe: 3 identical queries', logs.output[0])
+		self.assertIn('Slow request GET /probe', logs.output[1])
+		self.assertIn('SELECT', logs.output[1])
+
+
+class MetricsTests(TempMediaMixin, TestCase):
+	def setUp(self):
+		super().setUp()
+		metrics_dir = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, metrics_dir, True)
+		self.enterContext(override_settings(METRICS_ENABLED=True, METRICS_DIR=metrics_dir, METRICS_FLUSH_INTERVAL=0, DEBUG=True))
+		metrics._reset()
+		self.addCleanup(metrics._reset)
+		self.metrics_dir = metrics_dir
+
+	def _scrape(self, **headers):
+		response = self.client.get(reverse('metrics'), **headers)
+		self.assertEqual(response.status_code, 200)
+		self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+		return response.content.decode()
+
+	def test_aggregates_requests_registrations_and_jobs_across_processes(self):
+		ws = make_workshop()
+		self.client.get(reverse('workshops_list'))
+		self.client.get(reverse('workshops_list'))
+		self.client.post(reverse('workshops_register', args=[ws.id]), {'name': 'A', 'email': 'a@example.com'})
+		jobs.enqueue('csv', workshop_ids=[ws.id])
+		exports_root = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, exports_root, True)
+		with override_settings(EXPORTS_ROOT=exports_root):
+			jobs.run_next()
+		# Another worker process's file.
+		with open(os.path.join(self.metrics_dir, '999999999.json'), 'w') as fh:
+			json.dump({
+				'counters': {'http_requests_total': {'method="GET",status="200",view="workshops_list"': 3}},
+				'histograms': {'http_request_duration_seconds': {'view="workshops_list"': {
+					'le': list(metrics.LATENCY_BUCKETS), 'buckets': [3] * len(metrics.LATENCY_BUCKETS), 'sum': 0.003, 'count': 3,
+				}}},
+			}, fh)
+		text = self._scrape()
+		self.assertIn('http_requests_total{method="GET",status="200",view="workshops_list"} 5', text)
+		self.assertIn('http_request_duration_seconds_count{view="workshops_list"} 5', text)
+		self.assertIn('http_request_duration_seconds_bucket{view="workshops_list",le="+Inf"} 5', text)
+		self.assertIn(f'workshop_registrations_total{{workshop_id="{ws.id}"}} 1', text)
+		self.assertIn('export_job_duration_seconds_count{kind="csv",status="done"} 1', text)
+		self.assertIn('db_connection_reuses_total{alias="default"}', text)
+		self.assertIn('# TYPE http_request_duration_seconds histogram', text)
+
+	@override_settings(METRICS_TOKEN='s3cret')
+	def test_token(self):
+		self.assertEqual(self.client.get(reverse('metrics')).status_code, 401)
+		self.assertIn('# HELP', self._scrape(HTTP_AUTHORIZATION='Bearer s3cret'))
+
+	def test_not_served_without_token_in_production(self):
+		with override_settings(DEBUG=False):
+			self.assertEqual(self.client.get(reverse('metrics')).status_code, 404)
+		with override_settings(METRICS_ENABLED=False, METRICS_TOKEN='s3cret'):
+			self.assertEqual(self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer s3cret').status_code, 404)
+
+	def test_nothing_is_written_when_disabled(self):
+		metrics_dir = os.path.join(self.metrics_dir, 'off')
+		jobs.enqueue('csv', workshop_ids=[make_workshop().id])
+		exports_root = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, exports_root, True)
+		with override_settings(METRICS_ENABLED=False, METRICS_DIR=metrics_dir, EXPORTS_ROOT=exports_root):
+			self.assertEqual(jobs.run_next().status, 'done')
+			metrics.flush()
+		self.assertFalse(os.path.exists(metrics_dir))
+
+	def test_recycled_pid_keeps_the_dead_process_file(self):
+		metrics.inc('http_requests_total', {'view': 'a'})
+		metrics.flush()
+		metrics._reset()  # as in a new process that was given the same pid
+		metrics.inc('http_requests_total', {'view': 'a'})
+		metrics.flush()
+		self.assertEqual(len(os.listdir(self.metrics_dir)), 2)
+		self.assertEqual(metrics.collect()[0]['http_requests_total']['view="a"'], 2)
+
+	@unittest.skipIf(metrics.fcntl is None, "compaction needs fcntl")
+	def test_exited_process_files_are_folded_into_the_archive(self):
+		metrics.inc('http_requests_total', {'view': 'a'})
+		metrics.flush()
+		for n in range(1, 4):
+			exited = subprocess.Popen([sys.executable, '-c', ''])
+			exited.wait()
+			with open(os.path.join(self.metrics_dir, f'{exited.pid}-1.json'), 'w') as fh:
+				json.dump({'counters': {'http_requests_total': {'view="a"': 2}}, 'histograms': {}}, fh)
+			self.assertEqual(metrics.collect()[0]['http_requests_total']['view="a"'], 1 + 2 * n)
+		self.assertEqual(sorted(n for n in os.listdir(self.metrics_dir) if n.endswith('.json')), sorted([metrics.ARCHIVE, metrics._file_name]))
+		# A crash after writing the archive but before deleting a file doesn't count it twice.
+		with open(os.path.join(self.metrics_dir, metrics.ARCHIVE)) as fh:
+			archive = json.load(fh)
+		with open(os.path.join(self.metrics_dir, '999999999-1.json'), 'w') as fh:
+			json.dump({'counters': {'http_requests_total': {'view="a"': 5}}, 'histograms': {}}, fh)
+		archive['counters']['http_requests_total']['view="a"'] += 5
+		archive['merged'] = ['999999999-1.json']
+		with open(os.path.join(self.metrics_dir, metrics.ARCHIVE), 'w') as fh:
+			json.dump(archive, fh)
+		self.assertEqual(metrics.collect()[0]['http_requests_total']['view="a"'], 12)
+		self.assertFalse(os.path.exists(os.path.join(self.metrics_dir, '999999999-1.json')))
+
+
+class QueryPlanTests(QueryPlanMixin, TempMediaMixin, TestCase):
+	def setUp(self):
+		super().setUp()
+		self.client.force_login(get_user_model().objects.create_superuser('admin', 'admin@example.com', 'pw'))
+		self.ws = make_workshop(status='active', venue='Studio', capacity=50)
+		make_registrations(self.ws, 5)
+		ContactSubmission.objects.create(name='Meera', email='meera@example.com', service='Branding', message='Hi')
+
+	def test_api_queries_use_indexes(self):
+		urls = [
+			reverse('workshops_list'),
+			reverse('workshops_list') + '?status=active',
+			reverse('workshops_list') + '?venue=Studio&date_from=2024-01-01&date_to=2026-01-01',
+			reverse('workshops_detail', args=[self.ws.id]),
+		]
+		with self.assertNoFullTableScans():
+			for url in urls:
+				self.assertEqual(self.client.get(url).status_code, 200)
+			response = self.client.post(
+				reverse('workshops_register', args=[self.ws.id]),
+				{'name': 'New', 'email': 'new@example.com'},
+			)
+			self.assertEqual(response.status_code, 200)
+		page = self.client.get(reverse('workshops_list') + '?limit=1').json()
+		with self.assertNoFullTableScans():
+			self.client.get(reverse('workshops_list') + f"?limit=1&cursor={page['next_cursor']}")
+
+	def test_admin_queries_use_indexes(self):
+		urls = [
+			reverse('admin:api_workshop_changelist') + '?status__exact=active',
+			reverse('admin:api_workshop_change', args=[self.ws.id]) + '?registrations_status=pending',
+			reverse('admin:api_workshopregistration_changelist') + f'?workshop__id__exact={self.ws.id}&status__exact=pending',
+			reverse('admin:api_workshopregistration_changelist') + '?created_at__gte=2025-01-01+00:00:00%2B00:00&created_at__lt=2025-02-01+00:00:00%2B00:00',
+			reverse('admin:api_workshopregistration_changelist') + '?q=example',
+			reverse('admin:api_contactsubmission_changelist') + '?created_at__gte=2025-01-01+00:00:00%2B00:00&created_at__lt=2025-02-01+00:00:00%2B00:00',
+			reverse('admin-dashboard'),
+		]
+		with self.assertNoFullTableScans():
+			for url in urls:
+				self.assertEqual(self.client.get(url).status_code, 200, url)
+
+	def test_default_admin_changelists_use_indexes(self):
+		for model_admin in (WorkshopAdmin, WorkshopRegistrationAdmin, ContactSubmissionAdmin):
+			# One row per page, so the page query is bounded as it is with real data.
+			self.enterContext(mock.patch.object(model_admin, 'list_per_page', 1))
+		make_workshop(title='Second')
+		ContactSubmission.objects.create(name='Ravi', email='ravi@example.com', service='Web', message='Hello')
+		with self.assertNoFullTableScans():
+			for name in ('api_workshop', 'api_workshopregistration', 'api_contactsubmission'):
+				url = reverse(f'admin:{name}_changelist')
+				self.assertEqual(self.client.get(url).status_code, 200, url)
+
+
+class PaymentProofUploadTests(TempMediaMixin, TestCase):
+	def setUp(self):
+		super().setUp()
+		self.ws = make_workshop(capacity=2)
+		self.url = reverse('workshops_register', args=[self.ws.id])
+
+	def _stored_files(self):
+		return [name for _dirpath, _dirs, names in os.walk(self.media_root) for name in names]
+
+	def _assert_nothing_written(self):
+		self.assertFalse(WorkshopRegistration.objects.exists())
+		self.assertEqual(Workshop.objects.get(pk=self.ws.pk).seats_taken, 0)
+		self.assertEqual(self._stored_files(), [])
+
+	def test_registration_and_proof_saved_together(self):
+		with CaptureQueriesContext(connection) as queries:
+			response = self.client.post(self.url, {'name': 'A', 'email': 'a@example.com', 'payment_proof': make_image()})
+		self.assertEqual(response.status_code, 200)
+		reg = WorkshopRegistration.objects.get()
+		self.assertRegex(reg.payment_proof.name, r'^workshops/proofs/[0-9a-f]{64}\.jpg$')
+		writes = [q['sql'] for q in queries.captured_queries if 'api_workshopregistration' in q['sql'] and not q['sql'].startswith('SELECT')]
+		self.assertEqual(len(writes), 1)
+		self.assertTrue(writes[0].startswith('INSERT'))
+		# Resubmitting replaces the proof on the existing registration.
+		again = self.client.post(self.url, {'name': 'A', 'email': 'a@example.com', 'payment_proof': make_image('new.png', fmt='PNG')})
+		self.assertFalse(again.json()['created'])
+		reg.refresh_from_db()
+		self.assertRegex(reg.payment_proof.name, r'^workshops/proofs/[0-9a-f]{64}\.png$')
+
+	@override_settings(PAYMENT_PROOF_MAX_BYTES=10 * 1024)
+	def test_oversized_proof_rejected(self):
+		buf = io.BytesIO()
+		Image.frombytes('RGB', (120, 120), os.urandom(120 * 120 * 3)).save(buf, 'JPEG', quality=95)
+		big = SimpleUploadedFile('noise.jpg', buf.getvalue(), content_type='image/jpeg')
+		# Over the limit, but not by enough for the Content-Length check to catch it.
+		self.assertGreater(big.size, 10 * 1024)
+		self.assertLess(big.size, 64 * 1024)
+		response = self.client.post(self.url, {'name': 'A', 'email': 'a@example.com', 'payment_proof': big})
+		self.assertEqual(response.status_code, 413)
+		self._assert_nothing_written()
+		# Refused from Content-Length alone, before the body is parsed.
+		huge = SimpleUploadedFile('huge.jpg', b'\xff\xd8\xff' + b'0' * 200 * 1024, content_type='image/jpeg')
+		response = self.client.post(self.url, {'name': 'A', 'email': 'a@example.com', 'payment_proof': huge})
+		self.assertEqual(response.status_code, 413)
+		self._assert_nothing_written()
+
+	def test_non_image_rejected(self):
+		for upload in (
+			SimpleUploadedFile('proof.pdf', b'%PDF-1.4 ...', content_type='application/pdf'),
+			SimpleUploadedFile('proof.png', b'<?php echo "not a png"; ?>', content_type='image/png'),
+			SimpleUploadedFile('tiny.gif', b'GIF', content_type='image/gif'),
+			SimpleUploadedFile('fake.jpg', b'\xff\xd8\xff' + b'0' * 1024, content_type='image/jpeg'),
+		):
+			response = self.client.post(self.url, {'name': 'A', 'email': 'a@example.com', 'payment_proof': upload})
+			self.assertEqual(response.status_code, 400, upload.name)
+			self.assertIn('image', response.json()['error'])
+			self._assert_nothing_written()
+
+	def test_bad_upload_stops_reading_the_body(self):
+		junk = SimpleUploadedFile('proof.jpg', b'MZ' + b'0' * 512 * 1024, content_type='image/jpeg')
+		environ = RequestFactory().post(self.url, {'name': 'A', 'email': 'a@example.com', 'payment_proof': junk}).environ
+		body = environ['wsgi.input'].read()
+		environ['wsgi.input'] = stream = io.BytesIO(body)
+		response = views.WorkshopRegisterView.as_view()(WSGIRequest(environ), workshop_id=self.ws.id)
+		self.assertEqual(response.status_code, 400)
+		self.assertLess(stream.tell(), 128 * 1024)
+		self._assert_nothing_written()
+
+	def test_failed_insert_leaves_proof_for_gc(self):
+		# Fails after the insert, inside the same transaction.
+		with mock.patch.object(live, 'changed', side_effect=RuntimeError('db down')):
+			with self.assertRaises(RuntimeError):
+				self.client.post(self.url, {'name': 'A', 'email': 'a@example.com', 'payment_proof': make_image()})
+		self.assertFalse(WorkshopRegistration.objects.exists())
+		self.assertFalse(StoredFile.objects.exists())
+		# The file may be shared with another row, so only gc_media removes it.
+		self.assertEqual(len(self._stored_files()), 1)
+		self.assertEqual(len(stored_files.collect_garbage(grace=0)), 1)
+		self._assert_nothing_written()
+
+
+class StoredFileTests(TempMediaMixin, TestCase):
+	def setUp(self):
+		super().setUp()
+		self.ws = make_workshop(capacity=5)
+
+	def _register(self, email, image):
+		return WorkshopRegistration.objects.create(workshop=self.ws, name='A', email=email, payment_proof=image)
+
+	def _refs(self, name):
+		return StoredFile.objects.get(name=name).refs
+
+	def _exists(self, name):
+		return os.path.exists(os.path.join(self.media_root, name))
+
+	def test_identical_uploads_share_one_file(self):
+		first = self._register('a@example.com', make_image())
+		second = self._register('b@example.com', make_image('retry.JPG'))
+		self.assertEqual(first.payment_proof.name, second.payment_proof.name)
+		self.assertEqual(os.listdir(os.path.join(self.media_root, 'workshops/proofs')), [os.path.basename(first.payment_proof.name)])
+		self.assertEqual(self._refs(first.payment_proof.name), 2)
+
+	def test_refs_follow_rows(self):
+		first = self._register('a@example.com', make_image())
+		second = self._register('b@example.com', make_image())
+		shared = first.payment_proof.name
+		# Saving without touching the file, or loading it deferred, changes nothing.
+		WorkshopRegistration.objects.get(pk=first.pk).save()
+		WorkshopRegistration.objects.defer('payment_proof').get(pk=first.pk).save()
+		self.assertEqual(self._refs(shared), 2)
+		first.payment_proof = make_image('new.png', fmt='PNG')
+		first.save()
+		self.assertEqual(self._refs(shared), 1)
+		self.assertEqual(self._refs(first.payment_proof.name), 1)
+		WorkshopRegistration.objects.get(pk=second.pk).delete()
+		self.assertEqual(self._refs(shared), 0)
+		self.ws.image = make_image('cover.png', fmt='PNG')
+		self.ws.save()
+		self.assertEqual(self._refs(self.ws.image.name), 1)
+		self.ws.delete()
+		self.assertEqual(set(StoredFile.objects.values_list('refs', flat=True)), {0})
+
+	def test_gc_deletes_unreferenced_files_only(self):
+		kept = self._register('a@example.com', make_image()).payment_proof.name
+		dropped = self._register('b@example.com', make_image('other.png', fmt='PNG'))
+		dropped_name = dropped.payment_proof.name
+		thumb = thumbnails.thumbnail_name(dropped_name, 'small')
+		os.makedirs(os.path.dirname(os.path.join(self.media_root, thumb)))
+		open(os.path.join(self.media_root, thumb), 'wb').close()
+		stray = 'workshops/proofs/' + 'f' * 64 + '.jpg'
+		open(os.path.join(self.media_root, stray), 'wb').close()
+		dropped.delete()
+		# Nothing is old enough yet.
+		self.assertEqual(stored_files.collect_garbage(), [])
+		self.assertEqual(sorted(stored_files.collect_garbage(grace=0, dry_run=True)), sorted([dropped_name, stray]))
+		self.assertTrue(self._exists(dropped_name))
+		call_command('gc_media', grace=0, stdout=io.StringIO())
+		self.assertFalse(self._exists(dropped_name))
+		self.assertFalse(self._exists(thumb))
+		self.assertFalse(self._exists(stray))
+		self.assertTrue(self._exists(kept))
+		self.assertFalse(StoredFile.objects.filter(name=dropped_name).exists())
+		self.assertEqual(self._refs(kept), 1)
+
+	def test_refs_follow_rows_loaded_partially_or_refreshed(self):
+		ws = Workshop.objects.only('id', 'title').get(pk=self.ws.pk)
+		ws.image = make_image()
+		ws.save()
+		self.assertEqual(self._refs(ws.image.name), 1)
+
+		reg = self._register('a@example.com', make_image('a.png', (40, 40), 'PNG'))
+		first = reg.payment_proof.name
+		other = WorkshopRegistration.objects.get(pk=reg.pk)
+		other.payment_proof = make_image('b.png', (50, 50), 'PNG')
+		other.save()
+		second = other.payment_proof.name
+		reg.refresh_from_db()
+		reg.payment_proof = make_image('c.png', (60, 60), 'PNG')
+		reg.save()
+		self.assertEqual((self._refs(first), self._refs(second), self._refs(reg.payment_proof.name)), (0, 0, 1))
+
+	def test_gc_keeps_files_an_upload_touched(self):
+		storage = content_addressed_storage()
+		long_ago = timezone.now() - datetime.timedelta(hours=1)
+		counted = storage.save('workshops/proofs/a.jpg', make_image())
+		uncounted = storage.save('workshops/proofs/b.png', make_image('b.png', fmt='PNG'))
+		StoredFile.objects.filter(name=counted).update(updated_at=long_ago)
+		StoredFile.objects.filter(name=uncounted).delete()
+		# Uploaded again while gc_media runs: after it checked the files' mtimes,
+		# before it deleted them. The save touches the rows before trusting exists().
+		self.assertEqual(storage.save('workshops/proofs/again.jpg', make_image()), counted)
+		self.assertEqual(storage.save('workshops/proofs/again.png', make_image('b.png', fmt='PNG')), uncounted)
+		for name in (counted, uncounted):
+			os.utime(os.path.join(self.media_root, name), (long_ago.timestamp(), long_ago.timestamp()))
+		self.assertEqual(stored_files.collect_garbage(grace=60), [])
+		self.assertTrue(self._exists(counted) and self._exists(uncounted))
+		StoredFile.objects.update(updated_at=long_ago)
+		self.assertEqual(sorted(stored_files.collect_garbage(grace=60)), sorted([counted, uncounted]))
+		self.assertFalse(StoredFile.objects.exists())
+
+	def test_hashed_uploads_served_immutable(self):
+		self.ws.image = make_image()
+		self.ws.save()
+		response = self.client.get(settings.MEDIA_URL + self.ws.image.name)
+		self.assertEqual(response.status_code, 200)
+		self.assertIn('immutable', response['Cache-Control'])
+		proof = self._register('a@example.com', make_image('proof.png', fmt='PNG')).payment_proof.name
+		self.assertEqual(self.client.get(settings.MEDIA_URL + proof).status_code, 404)
+
+
+class IdempotencyKeyTests(TempMediaMixin, TestCase):
+	def setUp(self):
+		super().setUp()
+		self.ws = make_workshop(capacity=5)
+		self.url = reverse('workshops_register', args=[self.ws.id])
+
+	def _register(self, key, **data):
+		data = {'name': 'A', 'email': 'a@example.com', 'payment_proof': make_image(), **data}
+		return self.client.post(self.url, data, headers={'Idempotency-Key': key})
+
+	def test_replay_skips_body_uploads_and_writes(self):
+		first = self._register('k1')
+		self.assertEqual(first.status_code, 200)
+		environ = RequestFactory().post(
+			self.url, {'name': 'A', 'email': 'a@example.com', 'payment_proof': make_image()}, headers={'Idempotency-Key': 'k1'},
+		).environ
+		environ['wsgi.input'] = io.BytesIO(environ['wsgi.input'].read())
+		with mock.patch.object(uploads, 'PaymentProofUploadHandler') as handler:
+			with CaptureQueriesContext(connection) as queries:
+				replayed = views.WorkshopRegisterView.as_view()(WSGIRequest(environ), workshop_id=self.ws.id)
+		handler.assert_not_called()
+		self.assertEqual(replayed.status_code, 200)
+		self.assertEqual(replayed.content, first.content)
+		self.assertEqual(replayed['Idempotent-Replayed'], 'true')
+		self.assertEqual([q['sql'] for q in queries.captured_queries if 'api_idempotencykey' not in q['sql'] and 'SAVEPOINT' not in q['sql']], [])
+		self.assertEqual(WorkshopRegistration.objects.count(), 1)
+		self.assertEqual(StoredFile.objects.get().refs, 1)
+		# The key is per path, and a new key is a new request.
+		self.assertTrue(self._register('k2', email='b@example.com').json()['created'])
+
+	def test_contact_retries_create_one_submission(self):
+		data = {'name': 'A', 'email': 'a@example.com', 'message': 'Hi'}
+		responses = [
+			self.client.post(reverse('contact'), data, content_type='application/json', headers={'Idempotency-Key': 'c1'})
+			for _ in range(3)
+		]
+		self.assertEqual({r.content for r in responses}, {responses[0].content})
+		self.assertEqual(ContactSubmission.objects.count(), 1)
+		self.client.post(reverse('contact'), data, content_type='application/json')
+		self.assertEqual(ContactSubmission.objects.count(), 2)
+
+	def test_key_reused_for_a_different_request_is_rejected(self):
+		self.assertEqual(self._register('k1').status_code, 200)
+		for data in ({'email': 'b@example.com'}, {'payment_proof': make_image(size=(800, 600))}):
+			response = self._register('k1', **data)
+			self.assertEqual(response.status_code, 422)
+			self.assertNotIn('Idempotent-Replayed', response)
+		self.assertEqual(WorkshopRegistration.objects.count(), 1)
+		contact = {'name': 'A', 'email': 'a@example.com', 'message': 'Hi'}
+		post = lambda data: self.client.post(reverse('contact'), data, content_type='application/json', headers={'Idempotency-Key': 'c1'})
+		self.assertEqual(post(contact).status_code, 200)
+		# Key order doesn't matter; the message does.
+		self.assertEqual(post(dict(reversed(contact.items()))).status_code, 200)
+		self.assertEqual(post({**contact, 'message': 'Bye'}).status_code, 422)
+		self.assertEqual(ContactSubmission.objects.count(), 1)
+
+	def test_failed_request_releases_key(self):
+		self.assertEqual(self._register('k1', email='').status_code, 400)
+		self.assertFalse(IdempotencyKey.objects.exists())
+		with mock.patch.object(views, '_reserve_registration', side_effect=RuntimeError('db down')):
+			with self.assertRaises(RuntimeError):
+				self._register('k1')
+		self.assertFalse(IdempotencyKey.objects.exists())
+		self.assertTrue(self._register('k1').json()['created'])
+
+	def test_key_in_progress_conflicts(self):
+		IdempotencyKey.objects.create(path=self.url, key='k1', expires_at=timezone.now() + datetime.timedelta(minutes=1))
+		response = self._register('k1')
+		self.assertEqual(response.status_code, 409)
+		self.assertEqual(response['Retry-After'], '1')
+		self.assertFalse(WorkshopRegistration.objects.exists())
+		self.assertEqual(self._register('k' * 300).status_code, 400)
+
+	def test_expired_keys_are_reused_and_purged(self):
+		past = timezone.now() - datetime.timedelta(seconds=1)
+		IdempotencyKey.objects.create(path=self.url, key='k1', status_code=200, body=b'{}', expires_at=past)
+		IdempotencyKey.objects.create(path=self.url, key='old', status_code=200, body=b'{}', expires_at=past)
+		self.enterContext(mock.patch.object(idempotency, '_next_purge', 0.0))
+		self.assertTrue(self._register('k1').json()['created'])
+		self.assertEqual(list(IdempotencyKey.objects.values_list('key', flat=True)), ['k1'])
+		self.assertGreater(IdempotencyKey.objects.get().expires_at, timezone.now() + datetime.timedelta(hours=1))
+
+
+@override_settings(LIVE_POLL_INTERVAL=0, LIVE_KEEPALIVE=0.05, LIVE_STREAM_SECONDS=0.5)
+class LiveSeatsTests(TestCase):
+	def setUp(self):
+		self.ws = make_workshop(capacity=2)
+
+	def _events(self, chunks, count):
+		events = []
+		while len(events) < count:
+			chunk = next(chunks)
+			if chunk.startswith(b'event: seats'):
+				events.append(json.loads(chunk.split(b'data: ', 1)[1]))
+		return events
+
+	def test_wsgi_serves_a_snapshot_not_a_stream(self):
+		make_workshop(status='inactive')
+		response = self.client.get(reverse('workshop_seats', args=[self.ws.id]))
+		self.assertEqual(response['Content-Type'], 'application/json')
+		self.assertEqual(response.json(), {'id': self.ws.id, 'registrations_count': 0, 'is_sold_out': False})
+		response = self.client.get(reverse('workshops_seats'))
+		self.assertEqual([item['id'] for item in response.json()['items']], [self.ws.id])
+		self.assertEqual(self.client.get(reverse('workshop_seats', args=[0])).status_code, 404)
+
+	def test_activation_reaches_all_active_watchers(self):
+		received = []
+		token = live.watch(None, received.append)
+		self.addCleanup(live.unwatch, token)
+		Workshop.objects.filter(pk=self.ws.id).update(status='inactive')
+		live.publish(live.snapshot(self.ws.id))
+		self.assertEqual(received, [])
+		# Same counts, but all-active watchers haven't seen it yet.
+		Workshop.objects.filter(pk=self.ws.id).update(status='active')
+		live.publish(live.snapshot(self.ws.id))
+		self.assertEqual(received, [{'id': self.ws.id, 'registrations_count': 0, 'is_sold_out': False}])
+
+	def test_one_query_per_change_for_any_number_of_watchers(self):
+		received = []
+		tokens = [live.watch(self.ws.id if n % 2 else None, received.append) for n in range(1000)]
+		self.addCleanup(lambda: [live.unwatch(token) for token in tokens])
+		with self.captureOnCommitCallbacks() as callbacks:
+			WorkshopRegistration.objects.create(workshop=self.ws, name='A', email='a@example.com')
+		with self.assertNumQueries(1):
+			for callback in callbacks:
+				callback()
+		self.assertEqual(len(received), 1000)
+		self.assertEqual(received[0], {'id': self.ws.id, 'registrations_count': 1, 'is_sold_out': False})
+		# The same state seen again (e.g. by the poller) isn't re-sent.
+		with self.assertNumQueries(1):
+			live.poll(timezone.now() - datetime.timedelta(minutes=1))
+		self.assertEqual(len(received), 1000)
+
+	def test_poll_picks_up_changes_from_other_processes(self):
+		received = []
+		token = live.watch(self.ws.id, received.append)
+		self.addCleanup(live.unwatch, token)
+		since = timezone.now() - live.POLL_OVERLAP
+		# What another worker's registration leaves behind, without this process's signals.
+		Workshop.objects.filter(pk=self.ws.id).update(seats_taken=2, updated_at=timezone.now())
+		live.poll(since)
+		self.assertEqual(received, [{'id': self.ws.id, 'registrations_count': 2, 'is_sold_out': True}])
+
+
+class AsyncViewTests(TempMediaMixin, TestCase):
+	"""The ASYNC_VIEWS routes, driven through the ASGI handler."""
+
+	def setUp(self):
+		super().setUp()
+		self._route(async_=True)
+		self.addCleanup(self._route, async_=False)
+		self.ws = make_workshop(capacity=1)
+
+	def _route(self, async_):
+		with override_settings(ASYNC_VIEWS=async_):
+			importlib.reload(api_urls)
+			importlib.reload(server_urls)
+		clear_url_caches()
+
+	def test_routes_use_async_views(self):
+		self.assertIs(resolve(reverse('workshops_list')).func.view_class, async_views.WorkshopsView)
+		self.assertIs(resolve(reverse('health')).func, async_views.health)
+
+	async def test_list_and_detail_match_sync_views_and_honour_validators(self):
+		for url in (reverse('workshops_list'), reverse('workshops_detail', args=[self.ws.id])):
+			response = await self.async_client.get(url)
+			self.assertEqual(response.status_code, 200)
+			self.assertIn('Last-Modified', response)
+			self._route(async_=False)
+			expected = await sync_to_async(self.client.get)(url)
+			self._route(async_=True)
+			self.assertEqual(response.json(), expected.json())
+			self.assertEqual(response['ETag'], expected['ETag'])
+			not_modified = await self.async_client.get(url, headers={'If-None-Match': response['ETag']})
+			self.assertEqual(not_modified.status_code, 304)
+		self.assertEqual((await self.async_client.get(reverse('workshops_detail', args=[0]))).status_code, 404)
+		self.assertEqual((await self.async_client.get(reverse('workshops_list'), {'cursor': 'x'})).status_code, 400)
+
+	async def test_idempotent_register(self):
+		url = reverse('workshops_register', args=[self.ws.id])
+		headers = {'Idempotency-Key': 'retry-1'}
+		first = await self.async_client.post(url, {'name': 'A', 'email': 'a@example.com', 'payment_proof': make_image()}, headers=headers)
+		again = await self.async_client.post(url, {'name': 'A', 'email': 'a@example.com', 'payment_proof': make_image()}, headers=headers)
+		self.assertEqual(again.status_code, 200)
+		self.assertEqual(again.content, first.content)
+		self.assertEqual(again['Idempotent-Replayed'], 'true')
+		self.assertEqual(await WorkshopRegistration.objects.acount(), 1)
+
+	async def test_register_with_proof_then_sold_out(self):
+		url = reverse('workshops_register', args=[self.ws.id])
+		first = await self.async_client.post(url, {'name': 'A', 'email': 'a@example.com', 'payment_proof': make_image()})
+		self.assertEqual(first.status_code, 200)
+		self.assertTrue(first.json()['created'])
+		self.assertEqual(first.json()['registrations_count'], 1)
+		reg = await WorkshopRegistration.objects.aget(email='a@example.com')
+		self.assertTrue(reg.payment_proof.name)
+		again = await self.async_client.post(url, {'name': 'A', 'email': 'a@example.com'})
+		self.assertEqual(again.json(), dict(first.json(), created=False))
+		full = await self.async_client.post(url, {'name': 'B', 'email': 'b@example.com'})
+		self.assertEqual(full.json(), {'error': 'Sold out'})
+
+	async def test_contact(self):
+		payload = {'name': 'Asha', 'email': 'asha@example.com', 'message': 'Hello'}
+		response = await self.async_client.post(reverse('contact'), payload, content_type='application/json')
+		self.assertEqual(response.status_code, 200)
+		self.assertTrue(await ContactSubmission.objects.filter(id=response.json()['id']).aexists())
+		bad = await self.async_client.post(reverse('contact'), 'not json', content_type='application/json')
+		self.assertEqual(bad.status_code, 400)
+		spool = tempfile.mkdtemp()
+		self.addCleanup(shutil.rmtree, spool, True)
+		with override_settings(CONTACT_INGEST_MODE='buffered', CONTACT_SPOOL_DIR=spool, CONTACT_INGEST_ASYNC=False):
+			queued = await self.async_client.post(reverse('contact'), payload, content_type='application/json')
+			self.assertEqual(queued.status_code, 202)
+			await sync_to_async(ingest.flush)()
+		self.assertTrue(await ContactSubmission.objects.filter(ingest_id=queued.json()['id']).aexists())
+
+	@override_settings(LIVE_POLL_INTERVAL=0, LIVE_KEEPALIVE=5, LIVE_STREAM_SECONDS=0.5)
+	async def test_seats_stream(self):
+		response = await self.async_client.get(reverse('workshop_seats', args=[self.ws.id]))
+		chunks = aiter(response.streaming_content)
+		self.assertEqual(await anext(chunks), live.RETRY)
+		self.assertIn(b'"registrations_count": 0', await anext(chunks))
+		row = {'id': self.ws.id, 'seats_taken': 1, 'capacity': 1, 'status': 'active'}
+		# Published from another thread, as a commit in a sync view would be.
+		await asyncio.to_thread(live.publish, [row])
+		self.assertIn(b'"is_sold_out": true', await anext(chunks))
+		self.assertEqual({chunk async for chunk in chunks}, {live.KEEPALIVE})
+		self.assertEqual(live._watchers, {})
+
+	@override_settings(LIVE_POLL_INTERVAL=0, LIVE_KEEPALIVE=5, LIVE_STREAM_SECONDS=0.1)
+	async def test_all_active_seats_stream(self):
+		await sync_to_async(make_workshop)(status='inactive')
+		response = await self.async_client.get(reverse('workshops_seats'))
+		self.assertEqual(response['Content-Type'], 'text/event-stream')
+		chunks = [chunk async for chunk in response.streaming_content]
+		events = [json.loads(chunk.split(b'data: ', 1)[1]) for chunk in chunks if chunk.startswith(b'event: seats')]
+		self.assertEqual([event['id'] for event in events], [self.ws.id])
+
+
+@override_settings(WHITENOISE_AUTOREFRESH=True, WHITENOISE_USE_FINDERS=True)
+class StaticFilesTests(TestCase):
+	url = '/static/admin/css/base.css'
+
+	@override_settings(DEBUG=True)  # Django only logs adaptations with DEBUG on
+	def test_async_middleware_chain_is_not_adapted(self):
+		with self.assertLogs('django.request', level='DEBUG') as logs:
+			ASGIHandler().load_middleware(is_async=True)
+			logging.getLogger('django.request').debug('loaded')
+		adapted = {line.rsplit(' ', 1)[1].rstrip('.') for line in logs.output if 'adapted for middleware' in line}
+		# Adapted before they got the chance to remove themselves (MiddlewareNotUsed).
+		unused = {line.split("'")[1] for line in logs.output if 'MiddlewareNotUsed' in line}
+		self.assertEqual(adapted - unused, set())
+
+	def test_whitenoise_internals_are_still_there(self):
+		async def get_response(request):
+			return HttpResponse()
+
+		middleware = StaticFilesMiddleware(get_response)
+		self.assertIsInstance(middleware.autorefresh, bool)
+		self.assertTrue(callable(middleware.find_file))
+		self.assertTrue(callable(middleware.serve))
+		self.assertTrue(callable(middleware.files.get))
+		static_file = middleware.find_file(self.url) if middleware.autorefresh else middleware.files.get(self.url)
+		self.assertIsNotNone(static_file, "WhiteNoise no longer finds files the way api.static_files expects")
+		self.assertEqual(middleware.serve(static_file, RequestFactory().get(self.url)).status_code, 200)
+
+	async def test_served_under_asgi_and_wsgi(self):
+		response = await self.async_client.get(self.url)
+		self.assertEqual(response.status_code, 200)
+		self.assertIn('max-age', response['Cache-Control'])
+		self.assertEqual((await sync_to_async(self.client.get)(self.url)).status_code, 200)
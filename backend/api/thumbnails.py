@@ -0,0 +1,217 @@
+"""Resized copies of uploaded workshop images and payment proofs.
+
+Workshop images and payment QR codes get responsive derivatives
+(``build_derivatives``): fixed-width WebP and JPEG renditions named by a hash
+of the source bytes under ``derivatives/``. The resulting manifest is stored
+on the model, so they are only rebuilt when the source file changes. Both the
+``srcset`` and the single URL the API serves (``rendition_url``) come from it.
+
+Payment proofs, which only the admin previews, get thumbnails stored next to
+the original under ``thumbs/``, e.g. ``workshops/proofs/shot.jpg`` ->
+``workshops/proofs/thumbs/shot.small.webp``.
+
+Both are generated on a thread pool once the upload is committed (thumbnails
+also lazily, the first time a URL is asked for); until one exists, callers
+get the original URL so nothing ever renders broken.
+"""
+import hashlib
+import io
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps, features
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+_pending = set()
+
+
+def _format():
+	fmt = settings.THUMBNAIL_FORMAT.upper()
+	if fmt == 'WEBP' and not features.check('webp'):
+		return 'JPEG'
+	return fmt
+
+
+def thumbnail_name(name: str, size: str) -> str:
+	directory, filename = os.path.split(name)
+	stem = os.path.splitext(filename)[0]
+	ext = 'jpg' if _format() == 'JPEG' else _format().lower()
+	return os.path.join(directory, 'thumbs', f'{stem}.{size}.{ext}')
+
+
+def _writer(storage):
+	# Content-addressed storage renames whatever it saves; derived files are
+	# written under their own names through its plain sibling.
+	return getattr(storage, 'derived', storage)
+
+
+def _encode(image, fmt: str, source_format) -> bytes:
+	options = {'optimize': True}
+	if fmt == 'JPEG':
+		image = image.convert('RGB')
+		options['quality'] = settings.THUMBNAIL_QUALITY
+	elif source_format in ('PNG', 'GIF'):
+		# Flat graphics such as payment QR codes must stay crisp to scan.
+		options['lossless'] = True
+	else:
+		options['quality'] = settings.THUMBNAIL_QUALITY
+	if image.mode not in ('RGB', 'RGBA', 'L'):
+		image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+	buf = io.BytesIO()
+	image.save(buf, fmt, **options)
+	return buf.getvalue()
+
+
+def _open(field_file):
+	with field_file.storage.open(field_file.name, 'rb') as fh:
+		data = fh.read()
+	image = Image.open(io.BytesIO(data))
+	source_format = image.format
+	return data, ImageOps.exif_transpose(image), source_format
+
+
+def generate(field_file, size: str) -> str:
+	"""Render the ``size`` thumbnail for ``field_file`` and return its storage name."""
+	storage = field_file.storage
+	target = thumbnail_name(field_file.name, size)
+	max_px = settings.THUMBNAIL_SIZES[size]
+	_data, image, source_format = _open(field_file)
+	image.thumbnail((max_px, max_px))
+	content = _encode(image, _format(), source_format)
+	if storage.exists(target):
+		storage.delete(target)
+	_writer(storage).save(target, ContentFile(content))
+	return target
+
+
+DERIVATIVE_FORMATS = (('webp', 'WEBP'), ('jpeg', 'JPEG'))
+
+
+def derivatives_stale(field_file, manifest) -> bool:
+	return bool(field_file) and (manifest or {}).get('source') != field_file.name
+
+
+def build_derivatives(field_file) -> dict:
+	"""Render ``RESPONSIVE_WIDTHS`` renditions of ``field_file`` and return the manifest.
+
+	Names embed a hash of the source bytes, so identical uploads share files
+	and a name never points at different content (safe to cache forever).
+	"""
+	storage = field_file.storage
+	data, image, source_format = _open(field_file)
+	digest = hashlib.sha256(data).hexdigest()[:16]
+	directory = os.path.dirname(field_file.name)
+	# Never upscale: keep widths up to the source width, or the source width alone.
+	widths = [w for w in settings.RESPONSIVE_WIDTHS if w <= image.width] or [image.width]
+	manifest = {'source': field_file.name, 'sha256': digest, 'width': image.width}
+	for key, fmt in DERIVATIVE_FORMATS:
+		if fmt == 'WEBP' and not features.check('webp'):
+			continue
+		renditions = []
+		for width in widths:
+			name = os.path.join(directory, 'derivatives', f'{digest}-{width}w.{"jpg" if fmt == "JPEG" else key}')
+			if not storage.exists(name):
+				resized = image.resize((width, max(1, round(image.height * width / image.width))), Image.LANCZOS)
+				_writer(storage).save(name, ContentFile(_encode(resized, fmt, source_format)))
+			renditions.append([width, name])
+		manifest[key] = renditions
+	return manifest
+
+
+def srcset(manifest, storage, build_url) -> dict:
+	"""``{'webp': 'url 320w, ...', 'jpeg': ...}`` for a derivatives manifest."""
+	return {
+		key: ', '.join(f'{build_url(storage.url(name))} {width}w' for width, name in manifest[key])
+		for key, _fmt in DERIVATIVE_FORMATS if manifest.get(key)
+	}
+
+
+def rendition_url(field_file, manifest, width: int) -> str:
+	"""URL of the widest rendition up to ``width`` px, or of the original until they're built."""
+	if not field_file:
+		return ''
+	manifest = manifest or {}
+	renditions = manifest.get('webp' if _format() == 'WEBP' else 'jpeg') or manifest.get('jpeg')
+	if derivatives_stale(field_file, manifest) or not renditions:
+		return field_file.url
+	fitting = [name for rendition_width, name in renditions if rendition_width <= width]
+	return field_file.storage.url(fitting[-1] if fitting else renditions[0][1])
+
+
+def _get_executor():
+	global _executor
+	with _executor_lock:
+		if _executor is None:
+			_executor = ThreadPoolExecutor(max_workers=settings.THUMBNAIL_WORKERS, thread_name_prefix='thumbnails')
+		return _executor
+
+
+def _run(key, task, pooled=False):
+	try:
+		task()
+	except Exception:
+		logger.exception("Image processing failed for %s", key[1])
+	finally:
+		with _executor_lock:
+			_pending.discard(key)
+		if pooled:
+			# Pool threads outlive requests, so nothing else closes their
+			# connection (or notices it has gone stale).
+			close_old_connections()
+
+
+def run_in_background(key, task) -> None:
+	"""Run ``task`` on the image thread pool after commit, once per ``key`` at a time."""
+	def submit():
+		# Claimed at commit time so a rolled-back transaction can't leave the
+		# key marked pending forever.
+		with _executor_lock:
+			if key in _pending:
+				return
+			_pending.add(key)
+		if settings.THUMBNAIL_ASYNC:
+			_get_executor().submit(_run, key, task, pooled=True)
+		else:
+			_run(key, task)
+
+	transaction.on_commit(submit)
+
+
+def schedule(field_file, sizes=None, on_done=None) -> None:
+	"""Generate thumbnails for ``field_file`` off the request thread after commit."""
+	if not field_file:
+		return
+	sizes = tuple(sizes or settings.THUMBNAIL_SIZES)
+
+	def task():
+		for size in sizes:
+			generate(field_file, size)
+		if on_done:
+			on_done()
+
+	run_in_background(('thumbnails', field_file.name), task)
+
+
+def thumbnail_url(field_file, size: str) -> str:
+	"""URL of the ``size`` thumbnail, or of the original while it's being made."""
+	if not field_file:
+		return ''
+	target = thumbnail_name(field_file.name, size)
+	if field_file.storage.exists(target):
+		return field_file.storage.url(target)
+	schedule(field_file)
+	return field_file.url
+
+
+def missing(field_file) -> bool:
+	return bool(field_file) and any(
+		not field_file.storage.exists(thumbnail_name(field_file.name, size)) for size in settings.THUMBNAIL_SIZES
+	)
@@ -0,0 +1,150 @@
+"""Per-request query and timing instrumentation.
+
+``RequestTimingMiddleware`` (enabled with ``REQUEST_TIMING``) times the
+queries each request runs and reports:
+
+* a ``Server-Timing`` header with DB time and query count, serialization time
+  and total time, so the numbers show up in the browser's network panel;
+* a warning on the ``api.timing`` logger for requests slower than
+  ``SLOW_REQUEST_MS``, listing the slowest queries;
+* a warning when one SQL statement runs ``N_PLUS_ONE_THRESHOLD`` or more
+  times in a request, the usual signature of an N+1.
+
+Queries are timed by an execute wrapper installed once on each connection
+(including the ones created later, in ``sync_to_async`` worker threads under
+ASGI), which records into the current request's ContextVar; asgiref carries
+that into the worker threads, so async views are timed like sync ones.
+
+When ``REQUEST_TIMING`` is off the middleware raises ``MiddlewareNotUsed`` and
+drops out of the chain, and ``measure()`` is a single ContextVar lookup.
+"""
+import contextlib
+import contextvars
+import logging
+import time
+from collections import Counter
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger(__name__)
+
+SLOWEST_LOGGED = 5
+
+_current = contextvars.ContextVar('request_timing', default=None)
+
+
+class RequestTimings:
+	def __init__(self):
+		self.queries = []
+		self.phases = Counter()
+
+	def record_query(self, execute, sql, params, many, context):
+		started = time.perf_counter()
+		try:
+			return execute(sql, params, many, context)
+		finally:
+			self.queries.append((sql, time.perf_counter() - started))
+
+	@property
+	def db_time(self) -> float:
+		return sum(duration for _sql, duration in self.queries)
+
+	def repeated(self, threshold: int) -> list:
+		counts = Counter(sql for sql, _duration in self.queries)
+		return [(sql, n) for sql, n in counts.most_common() if n >= threshold]
+
+
+@contextlib.contextmanager
+def measure(phase: str):
+	"""Add the time spent in the block to ``phase`` for the current request, if timed."""
+	timings = _current.get()
+	if timings is None:
+		yield
+		return
+	started = time.perf_counter()
+	try:
+		yield
+	finally:
+		timings.phases[phase] += time.perf_counter() - started
+
+
+def _record_query(execute, sql, params, many, context):
+	timings = _current.get()
+	if timings is None:
+		return execute(sql, params, many, context)
+	return timings.record_query(execute, sql, params, many, context)
+
+
+def _instrument(connection, **kwargs) -> None:
+	if _record_query not in connection.execute_wrappers:
+		connection.execute_wrappers.append(_record_query)
+
+
+def _instrument_all() -> None:
+	"""Instrument this thread's connections, including ones opened before the middleware loaded."""
+	for connection in connections.all():
+		_instrument(connection)
+
+
+class RequestTimingMiddleware:
+	sync_capable = True
+	async_capable = True
+
+	def __init__(self, get_response):
+		if not settings.REQUEST_TIMING:
+			raise MiddlewareNotUsed
+		self.get_response = get_response
+		connection_created.connect(_instrument, dispatch_uid='api.timing')
+		if iscoroutinefunction(get_response):
+			markcoroutinefunction(self)
+
+	def __call__(self, request):
+		if iscoroutinefunction(self):
+			return self.__acall__(request)
+		_instrument_all()
+		timings = RequestTimings()
+		token = _current.set(timings)
+		started = time.perf_counter()
+		try:
+			response = self.get_response(request)
+		finally:
+			_current.reset(token)
+		total = time.perf_counter() - started
+		self._report(request, response, timings, total)
+		return response
+
+	async def __acall__(self, request):
+		# The views' ORM calls run in sync_to_async's thread, on its connections.
+		await sync_to_async(_instrument_all)()
+		timings = RequestTimings()
+		token = _current.set(timings)
+		started = time.perf_counter()
+		try:
+			response = await self.get_response(request)
+		finally:
+			_current.reset(token)
+		total = time.perf_counter() - started
+		self._report(request, response, timings, total)
+		return response
+
+	def _report(self, request, response, timings, total):
+		metrics = [f'db;dur={timings.db_time * 1000:.1f};desc="{len(timings.queries)} queries"']
+		metrics += [f'{phase};dur={seconds * 1000:.1f}' for phase, seconds in timings.phases.items()]
+		metrics.append(f'total;dur={total * 1000:.1f}')
+		response['Server-Timing'] = ', '.join(metrics)
+
+		match = getattr(request, 'resolver_match', None)
+		view = match.view_name if match else request.path
+		for sql, count in timings.repeated(settings.N_PLUS_ONE_THRESHOLD):
+			logger.warning("Likely N+1 in %s: %d identical queries: %s", view, count, sql)
+		if total * 1000 >= settings.SLOW_REQUEST_MS:
+			slowest = sorted(timings.queries, key=lambda q: q[1], reverse=True)[:SLOWEST_LOGGED]
+			logger.warning(
+				"Slow request %s %s (%s): %.0f ms total, %.0f ms in %d queries%s",
+				request.method, request.path, view, total * 1000, timings.db_time * 1000, len(timings.queries),
+				''.join(f'\n  {duration * 1000:.1f} ms  {sql}' for sql, duration in slowest),
+			)
@@ -0,0 +1,89 @@
+"""Upload handling for registration payment proofs.
+
+``PaymentProofUploadHandler`` replaces Django's default handlers for
+``WorkshopRegisterView``. Files stream straight to a temporary file on disk,
+never into memory, and the upload is abandoned as soon as it is known to be
+bad:
+
+* a ``Content-Length`` over ``PAYMENT_PROOF_MAX_BYTES`` (plus room for the
+  form fields) is refused before any of the body is parsed;
+* the first bytes of the file must be a JPEG, PNG, GIF or WebP signature;
+* the file must not grow past ``PAYMENT_PROOF_MAX_BYTES``;
+* once complete, Pillow must be able to parse its header.
+
+A rejected upload stops with ``StopUpload(connection_reset=True)``, so the
+rest of the body is never read, and the view answers with ``handler.error``.
+(Under ASGI, Django has already received the body into a spooled temporary
+file before the view runs; the same limits apply, but the bandwidth is spent.)
+"""
+from django.conf import settings
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+from django.http import QueryDict
+from django.utils.datastructures import MultiValueDict
+from PIL import Image, UnidentifiedImageError
+
+# Allowance for the non-file fields and multipart framing.
+FORM_OVERHEAD = 64 * 1024
+
+# JPEG, PNG, GIF; WebP is checked separately (RIFF....WEBP).
+SIGNATURES = (b'\xff\xd8\xff', b'\x89PNG\r\n\x1a\n', b'GIF87a', b'GIF89a')
+HEADER_BYTES = 12
+
+TOO_LARGE = 'too_large'
+NOT_AN_IMAGE = 'not_an_image'
+
+
+def is_image_header(head: bytes) -> bool:
+	if head[:4] == b'RIFF':
+		return head[8:12] == b'WEBP'
+	return head.startswith(SIGNATURES)
+
+
+class PaymentProofUploadHandler(FileUploadHandler):
+	def __init__(self, request=None):
+		super().__init__(request)
+		self.error = None
+		self.head = b''
+
+	def _reject(self, error):
+		self.error = error
+		raise StopUpload(connection_reset=True)
+
+	def handle_raw_input(self, input_data, META, content_length, boundary, encoding=None):
+		if content_length > settings.PAYMENT_PROOF_MAX_BYTES + FORM_OVERHEAD:
+			self.error = TOO_LARGE
+			return QueryDict(encoding=encoding), MultiValueDict()
+		return None
+
+	def new_file(self, *args, **kwargs):
+		super().new_file(*args, **kwargs)
+		if not self.content_type.startswith('image/'):
+			self._reject(NOT_AN_IMAGE)
+		self.head = b''
+		self.file = TemporaryUploadedFile(self.file_name, self.content_type, 0, self.charset, self.content_type_extra)
+
+	def receive_data_chunk(self, raw_data, start):
+		if start + len(raw_data) > settings.PAYMENT_PROOF_MAX_BYTES:
+			self._reject(TOO_LARGE)
+		if len(self.head) < HEADER_BYTES:
+			self.head += raw_data[:HEADER_BYTES - len(self.head)]
+			if len(self.head) >= HEADER_BYTES and not is_image_header(self.head):
+				self._reject(NOT_AN_IMAGE)
+		self.file.write(raw_data)
+
+	def file_complete(self, file_size):
+		self.file.flush()
+		try:
+			# Parses the header only; the pixels aren't decoded here.
+			Image.open(self.file.temporary_file_path()).close()
+		except (UnidentifiedImageError, Image.DecompressionBombError, OSError, ValueError):
+			self.file.close()
+			self._reject(NOT_AN_IMAGE)
+		self.file.seek(0)
+		self.file.size = file_size
+		return self.file
+
+	def upload_interrupted(self):
+		if hasattr(self, 'file'):
+			self.file.close()
@@ -1,10 +1,18 @@
+from django.conf import settings
 from django.urls import path
-from .views import health, ContactView, WorkshopsView, WorkshopDetailView, WorkshopRegisterView
+from . import async_views, views
+from .views import metrics_view
+
+# ASYNC_VIEWS serves the same endpoints from api.async_views (for ASGI).
+api = async_views if settings.ASYNC_VIEWS else views
 
 urlpatterns = [
-	path('health', health, name='health'),
-	path('contact', ContactView.as_view(), name='contact'),
-	path('workshops', WorkshopsView.as_view(), name='workshops_list'),
-	path('workshops/<int:workshop_id>', WorkshopDetailView.as_view(), name='workshops_detail'),
-	path('workshops/<int:workshop_id>/register', WorkshopRegisterView.as_view(), name='workshops_register'),
+	path('health', api.health, name='health'),
+	path('metrics', metrics_view, name='metrics'),
+	path('contact', api.ContactView.as_view(), name='contact'),
+	path('workshops', api.WorkshopsView.as_view(), name='workshops_list'),
+	path('workshops/seats', api.WorkshopSeatsView.as_view(), name='workshops_seats'),
+	path('workshops/<int:workshop_id>', api.WorkshopDetailView.as_view(), name='workshops_detail'),
+	path('workshops/<int:workshop_id>/seats', api.WorkshopSeatsView.as_view(), name='workshop_seats'),
+	path('workshops/<int:workshop_id>/register', api.WorkshopRegisterView.as_view(), name='workshops_register'),
 ]
@@ -1,8 +1,19 @@
-from django.http import JsonResponse
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import Count, Max, Q
+from django.http import HttpResponse, JsonResponse
+from django.utils.crypto import constant_time_compare
+from django.utils.http import urlencode
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import condition
 from django.utils.decorators import method_decorator
 from django.views import View
+import base64
+import binascii
+import datetime
+import hashlib
 import json
+from . import cache, idempotency, ingest, live, metrics, thumbnails, uploads
 from .models import ContactSubmission, Workshop, WorkshopRegistration
 
 
@@ -10,111 +21,334 @@ def health(request):
     return JsonResponse({"status": "ok"})
 
 
+def metrics_view(request):
+    token = settings.METRICS_TOKEN
+    # Never public in production: without a token it's only served with DEBUG on.
+    if not settings.METRICS_ENABLED or not (token or settings.DEBUG):
+        return HttpResponse(status=404)
+    if token and not constant_time_compare(request.headers.get("Authorization", ""), f"Bearer {token}"):
+        return HttpResponse(status=401)
+    return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+def _contact_fields(request):
+	"""Validated contact form fields, or None if a required one is missing."""
+	data = json.loads(request.body.decode("utf-8"))
+	fields = {key: data.get(key, "").strip() for key in ("name", "email", "service", "message")}
+	if not fields["name"] or not fields["email"] or not fields["message"]:
+		return None
+	return fields
+
+
+def _queued(ingest_id):
+	return JsonResponse({"id": ingest_id, "status": "queued"}, status=202)
+
+
 @method_decorator(csrf_exempt, name="dispatch")
+@method_decorator(idempotency.idempotent, name="post")
 class ContactView(View):
 	def post(self, request):
 		try:
-			data = json.loads(request.body.decode("utf-8"))
-			name = data.get("name", "").strip()
-			email = data.get("email", "").strip()
-			service = data.get("service", "").strip()
-			message = data.get("message", "").strip()
-			if not name or not email or not message:
-				return JsonResponse({"error": "Missing required fields"}, status=400)
-			sub = ContactSubmission.objects.create(
-				name=name, email=email, service=service, message=message
-			)
-			return JsonResponse({"id": sub.id, "created_at": sub.created_at.isoformat()})
+			fields = _contact_fields(request)
 		except json.JSONDecodeError:
 			return JsonResponse({"error": "Invalid JSON"}, status=400)
+		if fields is None:
+			return JsonResponse({"error": "Missing required fields"}, status=400)
+		if settings.CONTACT_INGEST_MODE == 'buffered':
+			return _queued(ingest.submit(fields))
+		sub = ContactSubmission.objects.create(**fields)
+		return JsonResponse({"id": sub.id, "created_at": sub.created_at.isoformat()})
+
+
+def _rendition_url(request, field, manifest):
+	return request.build_absolute_uri(thumbnails.rendition_url(field, manifest, settings.IMAGE_URL_WIDTH)) if field else ''
+
+
+def _srcset(request, field, manifest):
+	if not field or thumbnails.derivatives_stale(field, manifest):
+		return {}
+	return thumbnails.srcset(manifest, field.storage, request.build_absolute_uri)
+
+
+# Output key -> (model columns it reads, getter). Keeping the two together lets
+# ?fields= narrow both the payload and the SELECT.
+WORKSHOP_FIELDS = {
+	'id': (('id',), lambda request, ws: ws.id),
+	'title': (('title',), lambda request, ws: ws.title),
+	'description': (('description',), lambda request, ws: ws.description),
+	'date': (('date',), lambda request, ws: ws.date),
+	'start_time': (('start_time',), lambda request, ws: ws.start_time),
+	'end_time': (('end_time',), lambda request, ws: ws.end_time),
+	'venue': (('venue',), lambda request, ws: ws.venue),
+	'perks': (('perks',), lambda request, ws: ws.perks),
+	'capacity': (('capacity',), lambda request, ws: ws.capacity),
+	'image_url': (('image', 'image_derivatives'), lambda request, ws: _rendition_url(request, ws.image, ws.image_derivatives)),
+	'status': (('status',), lambda request, ws: ws.status),
+	'upi_id': (('upi_id',), lambda request, ws: ws.upi_id),
+	'bank_name': (('bank_name',), lambda request, ws: ws.bank_name),
+	'account_no': (('account_no',), lambda request, ws: ws.account_no),
+	'amount': (('amount',), lambda request, ws: str(ws.amount)),
+	'payment_qr': (('payment_qr', 'payment_qr_derivatives'), lambda request, ws: _rendition_url(request, ws.payment_qr, ws.payment_qr_derivatives)),
+	'image_srcset': (('image', 'image_derivatives'), lambda request, ws: _srcset(request, ws.image, ws.image_derivatives)),
+	'payment_qr_srcset': (('payment_qr', 'payment_qr_derivatives'), lambda request, ws: _srcset(request, ws.payment_qr, ws.payment_qr_derivatives)),
+	'registrations_count': (('seats_taken',), lambda request, ws: ws.registrations_count),
+	'is_sold_out': (('capacity', 'seats_taken'), lambda request, ws: ws.is_sold_out),
+}
+
+WORKSHOPS_PAGE_SIZE = 20
+WORKSHOPS_MAX_PAGE_SIZE = 100
+
+
+def _serialize_workshop(request, ws, fields=WORKSHOP_FIELDS):
+	return {name: WORKSHOP_FIELDS[name][1](request, ws) for name in fields}
+
+
+def _encode_cursor(ws) -> str:
+	raw = f"{ws.date.isoformat()}|{ws.id}".encode('utf-8')
+	return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def _decode_cursor(cursor: str):
+	padded = cursor + '=' * (-len(cursor) % 4)
+	try:
+		date_str, id_str = base64.urlsafe_b64decode(padded).decode('utf-8').split('|')
+		return datetime.date.fromisoformat(date_str), int(id_str)
+	except (ValueError, UnicodeDecodeError, binascii.Error):
+		raise ValueError("Invalid cursor")
+
+
+def _parse_date(params, name):
+	value = params.get(name)
+	if not value:
+		return None
+	try:
+		return datetime.date.fromisoformat(value)
+	except ValueError:
+		raise ValueError(f"Invalid {name}")
+
+
+def _workshop_page_query(params):
+	"""Build the filtered, projected keyset query for ``WorkshopsView``.
+
+	Returns ``(queryset, fields, limit)`` and raises ``ValueError`` on bad input.
+	"""
+	fields = list(WORKSHOP_FIELDS)
+	if params.get('fields'):
+		fields = [f.strip() for f in params['fields'].split(',') if f.strip()]
+		unknown = [f for f in fields if f not in WORKSHOP_FIELDS]
+		if unknown:
+			raise ValueError(f"Unknown fields: {', '.join(unknown)}")
+	try:
+		limit = int(params.get('limit') or WORKSHOPS_PAGE_SIZE)
+	except ValueError:
+		raise ValueError("Invalid limit")
+	limit = max(1, min(limit, WORKSHOPS_MAX_PAGE_SIZE))
+
+	qs = Workshop.objects.all()
+	if params.get('status'):
+		qs = qs.filter(status=params['status'])
+	if params.get('venue'):
+		qs = qs.filter(venue=params['venue'])
+	date_from = _parse_date(params, 'date_from')
+	if date_from:
+		qs = qs.filter(date__gte=date_from)
+	date_to = _parse_date(params, 'date_to')
+	if date_to:
+		qs = qs.filter(date__lte=date_to)
+	if params.get('cursor'):
+		date, last_id = _decode_cursor(params['cursor'])
+		qs = qs.filter(Q(date__lt=date) | Q(date=date, id__lt=last_id))
+
+	columns = {'id', 'date'}
+	for name in fields:
+		columns.update(WORKSHOP_FIELDS[name][0])
+	qs = qs.only(*columns)
+	return qs.order_by('-date', '-id'), fields, limit
+
+
+def _workshop_page(request, workshops, fields, limit):
+	"""Response body for up to ``limit + 1`` rows fetched by ``_workshop_page_query``."""
+	page = workshops[:limit]
+	return {
+		'items': [_serialize_workshop(request, ws, fields) for ws in page],
+		'next_cursor': _encode_cursor(page[-1]) if len(workshops) > limit else None,
+	}
+
+
+LIST_STATE = {'count': Count('id'), 'last': Max('updated_at')}
+
 
+def _list_validators_from(state):
+	if state['last'] is None:
+		return ('empty', None)
+	# The row count catches deletions, which don't move Max(updated_at).
+	return (f"{state['count']}-{state['last'].timestamp():.6f}", state['last'])
 
+
+def _list_etag(request, etag):
+	"""Fold the normalized query into the list ETag: each cursor/filter/fields page is its own representation."""
+	params = sorted((key, value) for key, values in request.GET.lists() for value in values)
+	if not params:
+		return etag
+	return f"{etag}-{hashlib.md5(urlencode(params).encode('utf-8')).hexdigest()[:12]}"
+
+
+def _detail_validators_from(workshop_id, updated_at):
+	if updated_at is None:
+		return (None, None)
+	return (f"{workshop_id}-{updated_at.timestamp():.6f}", updated_at)
+
+
+def _list_validators():
+	def compute():
+		return _list_validators_from(Workshop.objects.aggregate(**LIST_STATE))
+	return cache.cached_value(cache.LIST_VERSION_KEY, 'validators', compute)
+
+
+def _detail_validators(workshop_id):
+	def compute():
+		updated_at = Workshop.objects.filter(id=workshop_id).values_list('updated_at', flat=True).first()
+		return _detail_validators_from(workshop_id, updated_at)
+	return cache.cached_value(cache.detail_version_key(workshop_id), 'validators', compute)
+
+
+@method_decorator(condition(
+	etag_func=lambda request: _list_etag(request, _list_validators()[0]),
+	last_modified_func=lambda request: _list_validators()[1],
+), name='get')
 class WorkshopsView(View):
 	def get(self, request):
-		items = []
-		for ws in Workshop.objects.order_by('-date').all():
-			items.append({
-				'id': ws.id,
-				'title': ws.title,
-				'description': ws.description,
-				'date': ws.date,
-				'start_time': ws.start_time,
-				'end_time': ws.end_time,
-				'venue': ws.venue,
-				'perks': ws.perks,
-				'capacity': ws.capacity,
-				'image_url': request.build_absolute_uri(ws.image.url) if getattr(ws, 'image', None) and ws.image else '',
-				'status': ws.status,
-				'upi_id': ws.upi_id,
-				'bank_name': ws.bank_name,
-				'account_no': ws.account_no,
-				'amount': str(ws.amount),
-				'payment_qr': request.build_absolute_uri(ws.payment_qr.url) if ws.payment_qr else '',
-				'registrations_count': ws.registrations.count(),
-				'is_sold_out': ws.is_sold_out,
-			})
-		return JsonResponse({'items': items})
+		try:
+			qs, fields, limit = _workshop_page_query(request.GET)
+		except ValueError as exc:
+			return JsonResponse({"error": str(exc)}, status=400)
 
+		def build():
+			return _workshop_page(request, list(qs[:limit + 1]), fields, limit)
+		return cache.cached_json(request, cache.LIST_VERSION_KEY, build)
 
+
+@method_decorator(condition(
+	etag_func=lambda request, workshop_id: _detail_validators(workshop_id)[0],
+	last_modified_func=lambda request, workshop_id: _detail_validators(workshop_id)[1],
+), name='get')
 class WorkshopDetailView(View):
 	def get(self, request, workshop_id: int):
+		def build():
+			return _serialize_workshop(request, Workshop.objects.get(id=workshop_id))
 		try:
-			ws = Workshop.objects.get(id=workshop_id)
+			return cache.cached_json(request, cache.detail_version_key(workshop_id), build)
 		except Workshop.DoesNotExist:
 			return JsonResponse({"error": "Not found"}, status=404)
-		data = {
-			'id': ws.id,
-			'title': ws.title,
-			'description': ws.description,
-			'date': ws.date,
-			'start_time': ws.start_time,
-			'end_time': ws.end_time,
-			'venue': ws.venue,
-			'perks': ws.perks,
-			'capacity': ws.capacity,
-			'image_url': request.build_absolute_uri(ws.image.url) if getattr(ws, 'image', None) and ws.image else '',
-			'status': ws.status,
-			'upi_id': ws.upi_id,
-			'bank_name': ws.bank_name,
-			'account_no': ws.account_no,
-			'amount': str(ws.amount),
-			'payment_qr': request.build_absolute_uri(ws.payment_qr.url) if ws.payment_qr else '',
-			'registrations_count': ws.registrations.count(),
-			'is_sold_out': ws.is_sold_out,
-		}
-		return JsonResponse(data)
+
+
+def _reserve_registration(ws, email, defaults, payment_proof=None):
+	"""Return ``(registration, created)``, or ``(None, False)`` when sold out.
+
+	The seat is taken with a single conditional UPDATE on ``seats_taken`` in the
+	same transaction as the INSERT, so concurrent requests can't oversell and
+	no COUNT(*) is needed. ``payment_proof`` is stored by that same save; if
+	the transaction fails the stored file is removed again.
+	"""
+	existing = WorkshopRegistration.objects.filter(workshop=ws, email=email).first()
+	if existing is None:
+		try:
+			with transaction.atomic():
+				if not Workshop.objects.reserve_seat(ws.pk):
+					return None, False
+				reg = WorkshopRegistration(workshop=ws, email=email, payment_proof=payment_proof, **defaults)
+				reg.seat_reserved = True
+				reg.save()
+				return reg, True
+		except IntegrityError:
+			# Lost a race with the same email; the rollback released our seat.
+			existing = WorkshopRegistration.objects.get(workshop=ws, email=email)
+	if payment_proof:
+		existing.payment_proof = payment_proof
+		existing.save(update_fields=['payment_proof'])
+	return existing, False
+
+
+def _registration_fields(request):
+	"""``(email, defaults)`` from a JSON or form body; email is None if a required field is missing."""
+	if request.content_type and request.content_type.startswith('application/json'):
+		data = json.loads(request.body.decode('utf-8'))
+	else:
+		data = request.POST
+	name = (data.get('name') or '').strip()
+	email = (data.get('email') or '').strip()
+	if not name or not email:
+		return None, None
+	return email, {
+		'name': name,
+		'whatsapp': (data.get('whatsapp') or '').strip(),
+		'organization': (data.get('organization') or '').strip(),
+	}
+
+
+def _payment_proof_handler(request):
+	"""Stream uploads through ``PaymentProofUploadHandler``; call before touching POST/FILES."""
+	handler = uploads.PaymentProofUploadHandler(request)
+	request.upload_handlers = [handler]
+	return handler
+
+
+def _upload_error(handler):
+	if handler.error == uploads.TOO_LARGE:
+		return JsonResponse({"error": "Payment proof is too large"}, status=413)
+	if handler.error == uploads.NOT_AN_IMAGE:
+		return JsonResponse({"error": "Payment proof must be a JPEG, PNG, GIF or WebP image"}, status=400)
+	return None
+
+
+def _payment_proof(request):
+	# Only multipart requests carry a file.
+	return request.FILES.get('payment_proof') if getattr(request, 'FILES', None) else None
+
+
+def _registered(reg, created, seats_taken):
+	return JsonResponse({"id": reg.id, "created": created, "registrations_count": seats_taken})
 
 
 @method_decorator(csrf_exempt, name="dispatch")
+@method_decorator(idempotency.idempotent, name="post")
 class WorkshopRegisterView(View):
 	def post(self, request, workshop_id: int):
 		try:
 			ws = Workshop.objects.get(id=workshop_id)
 		except Workshop.DoesNotExist:
 			return JsonResponse({"error": "Not found"}, status=404)
+		handler = _payment_proof_handler(request)
 		try:
-			if request.content_type and request.content_type.startswith('application/json'):
-				data = json.loads(request.body.decode('utf-8'))
-			else:
-				data = request.POST
-			name = (data.get('name') or '').strip()
-			email = (data.get('email') or '').strip()
-			whatsapp = (data.get('whatsapp') or '').strip()
-			organization = (data.get('organization') or '').strip()
-			if not name or not email:
-				return JsonResponse({"error": "Missing required fields"}, status=400)
-			if ws.is_sold_out:
-				return JsonResponse({"error": "Sold out"}, status=400)
-			reg, created = WorkshopRegistration.objects.get_or_create(
-				workshop=ws, email=email,
-				defaults={'name': name, 'whatsapp': whatsapp, 'organization': organization}
-			)
-			# If multipart with file
-			if getattr(request, 'FILES', None):
-				file_obj = request.FILES.get('payment_proof')
-				if file_obj:
-					reg.payment_proof = file_obj
-					reg.save()
-			return JsonResponse({"id": reg.id, "created": created, "registrations_count": ws.registrations.count()})
+			email, defaults = _registration_fields(request)
 		except json.JSONDecodeError:
 			return JsonResponse({"error": "Invalid JSON"}, status=400)
+		error = _upload_error(handler)
+		if error:
+			return error
+		if email is None:
+			return JsonResponse({"error": "Missing required fields"}, status=400)
+		reg, created = _reserve_registration(ws, email, defaults, _payment_proof(request))
+		if reg is None:
+			return JsonResponse({"error": "Sold out"}, status=400)
+		seats_taken = Workshop.objects.filter(pk=ws.pk).values_list('seats_taken', flat=True).first()
+		return _registered(reg, created, seats_taken)
+
+
+class WorkshopSeatsView(View):
+	"""Seat availability for one workshop, or all active ones, as a single JSON snapshot.
+
+	The live stream is only served by api.async_views (ASYNC_VIEWS, under ASGI):
+	held open here, every client would tie up a sync worker for the whole stream.
+	"""
+
+	def get(self, request, workshop_id=None):
+		events = [live.event(row) for row in live.snapshot(workshop_id)]
+		if workshop_id is None:
+			response = JsonResponse({"items": events})
+		elif events:
+			response = JsonResponse(events[0])
+		else:
+			return JsonResponse({"error": "Not found"}, status=404)
+		response['Cache-Control'] = 'no-cache'
+		return response
@@ -0,0 +1,93 @@
+"""Compare the admin's default LIKE search with the indexed search backend.
+
+Seeds a throwaway SQLite database (triggers fill the FTS5 index as rows go
+in), then times a changelist-style search -- the first page of 100 plus the
+result count -- through each path:
+
+    python benchmarks/admin_search.py --rows 1000000
+"""
+import argparse
+import datetime
+import os
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TERMS = ('user123456', 'example.com', 'Workshop 7', 'nobody-matches')
+
+
+def setup_django(db_path):
+	sys.path.insert(0, BACKEND_DIR)
+	os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+	os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'server.settings')
+	import django
+	django.setup()
+	from django.core.management import call_command
+	call_command('migrate', verbosity=0)
+
+
+def seed(rows):
+	from django.db import transaction
+	from api.models import Workshop, WorkshopRegistration
+	workshops = [
+		Workshop.objects.create(
+			title=f'Workshop {n}', date=datetime.date(2025, 1, 1), venue='Bench',
+			start_time=datetime.time(10), end_time=datetime.time(12), capacity=rows,
+		)
+		for n in range(50)
+	]
+	batch = 10000
+	for start in range(0, rows, batch):
+		with transaction.atomic():
+			WorkshopRegistration.objects.bulk_create([
+				WorkshopRegistration(
+					workshop=workshops[i % len(workshops)], name=f'User {i}',
+					email=f'user{i}@{"example.com" if i % 10 == 0 else "mail.test"}',
+				)
+				for i in range(start, min(start + batch, rows))
+			])
+
+
+def run(get_search_results, term, repeat):
+	from api.models import WorkshopRegistration
+	best = None
+	for _ in range(repeat):
+		started = time.perf_counter()
+		queryset, _dups = get_search_results(None, WorkshopRegistration.objects.order_by('-pk'), term)
+		page = list(queryset[:100])
+		count = queryset.count()
+		elapsed = time.perf_counter() - started
+		best = elapsed if best is None else min(best, elapsed)
+	return best, count, len(page)
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument('--rows', type=int, default=1000000)
+	parser.add_argument('--repeat', type=int, default=3)
+	args = parser.parse_args()
+
+	with tempfile.TemporaryDirectory() as tmp:
+		setup_django(os.path.join(tmp, 'bench.sqlite3'))
+		print(f'Seeding {args.rows} registrations...', flush=True)
+		started = time.perf_counter()
+		seed(args.rows)
+		print(f'  seeded in {time.perf_counter() - started:.1f}s', flush=True)
+
+		from django.contrib import admin
+		from api.models import WorkshopRegistration
+		model_admin = admin.site._registry[WorkshopRegistration]
+		paths = {
+			'like': lambda request, qs, term: admin.ModelAdmin.get_search_results(model_admin, request, qs, term),
+			'indexed': model_admin.get_search_results,
+		}
+		print(f"{'term':>16} {'path':>8} {'best s':>8} {'matches':>8}")
+		for term in TERMS:
+			for name, get_search_results in paths.items():
+				elapsed, count, _page = run(get_search_results, term, args.repeat)
+				print(f'{term:>16} {name:>8} {elapsed:>8.3f} {count:>8}', flush=True)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,185 @@
+"""Compare gunicorn sync workers (WSGI) with uvicorn workers (ASGI) under slow clients.
+
+Starts each server on a throwaway SQLite database with the same number of
+worker processes, then runs, at the same time:
+
+* ``--slow`` clients that register for a workshop and upload a payment proof
+  over a slow connection, trickling the body in over ``--slow-seconds``;
+* ``--fast`` clients that fetch ``/api/workshops`` in a loop.
+
+and reports the fast clients' throughput and latency percentiles:
+
+    python benchmarks/asgi_vs_wsgi.py --workers 2 --slow 50 --fast 20
+"""
+import argparse
+import asyncio
+import io
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CHUNKS = 20
+
+
+def proof_image():
+	"""A ~30 KB JPEG (noise doesn't compress)."""
+	from PIL import Image
+	buf = io.BytesIO()
+	Image.frombytes('RGB', (96, 96), os.urandom(96 * 96 * 3)).save(buf, 'JPEG', quality=95)
+	return buf.getvalue()
+
+
+def free_port():
+	with socket.socket() as sock:
+		sock.bind(('127.0.0.1', 0))
+		return sock.getsockname()[1]
+
+
+def prepare(env):
+	subprocess.run([sys.executable, 'manage.py', 'migrate', '--verbosity', '0'], cwd=BACKEND_DIR, env=env, check=True)
+	seed = (
+		"import datetime; from api.models import Workshop; "
+		"[Workshop.objects.create(title=f'Workshop {n}', date=datetime.date(2025, 1, 1), venue='Bench', "
+		"start_time=datetime.time(10), end_time=datetime.time(12), capacity=100000) for n in range(30)]"
+	)
+	subprocess.run([sys.executable, 'manage.py', 'shell', '-c', seed], cwd=BACKEND_DIR, env=env, check=True, stdout=subprocess.DEVNULL)
+
+
+def start(kind, port, workers, env):
+	if kind == 'wsgi':
+		command = ['gunicorn', 'server.wsgi', '--workers', str(workers)]
+	else:
+		command = ['gunicorn', '-c', 'server/gunicorn_asgi.py', '--workers', str(workers)]
+	command += ['--bind', f'127.0.0.1:{port}', '--timeout', '120', '--log-level', 'warning']
+	process = subprocess.Popen(command, cwd=BACKEND_DIR, env=env)
+	deadline = time.monotonic() + 30
+	while time.monotonic() < deadline:
+		try:
+			socket.create_connection(('127.0.0.1', port), timeout=1).close()
+			return process
+		except OSError:
+			time.sleep(0.2)
+	process.kill()
+	raise RuntimeError(f'{kind} server did not start')
+
+
+async def request(port, head, body=b'', trickle=0.0):
+	"""Send one request (``Connection: close``) and return the status code."""
+	reader, writer = await asyncio.open_connection('127.0.0.1', port)
+	writer.write(head)
+	if trickle:
+		size = -(-len(body) // CHUNKS)
+		for i in range(0, len(body), size):
+			await asyncio.sleep(trickle / CHUNKS)
+			writer.write(body[i:i + size])
+			await writer.drain()
+	else:
+		writer.write(body)
+	await writer.drain()
+	status = int((await reader.readline()).split()[1])
+	await reader.read()
+	writer.close()
+	return status
+
+
+async def slow_client(port, n, seconds, proof, stop):
+	i = 0
+	while not stop.is_set():
+		boundary = 'benchboundary'
+		fields = {'name': f'Slow {n}', 'email': f'slow{n}-{i}@example.com'}
+		body = b''.join(
+			f'--{boundary}\r\nContent-Disposition: form-data; name="{key}"\r\n\r\n{value}\r\n'.encode()
+			for key, value in fields.items()
+		)
+		body += (
+			f'--{boundary}\r\nContent-Disposition: form-data; name="payment_proof"; filename="proof.jpg"\r\n'
+			'Content-Type: image/jpeg\r\n\r\n'
+		).encode() + proof + f'\r\n--{boundary}--\r\n'.encode()
+		head = (
+			f'POST /api/workshops/{1 + n % 30}/register HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n'
+			f'Content-Type: multipart/form-data; boundary={boundary}\r\nContent-Length: {len(body)}\r\n\r\n'
+		).encode()
+		try:
+			await request(port, head, body, trickle=seconds)
+		except (OSError, IndexError, ValueError):
+			pass
+		i += 1
+
+
+async def fast_client(port, latencies, errors, stop):
+	head = b'GET /api/workshops?limit=20 HTTP/1.1\r\nHost: 127.0.0.1\r\nConnection: close\r\n\r\n'
+	while not stop.is_set():
+		started = time.perf_counter()
+		try:
+			status = await request(port, head)
+		except (OSError, IndexError, ValueError):
+			status = None
+		if status == 200:
+			latencies.append(time.perf_counter() - started)
+		else:
+			errors.append(status)
+
+
+async def load(port, args):
+	stop = asyncio.Event()
+	latencies, errors = [], []
+	proof = proof_image()
+	tasks = [asyncio.create_task(slow_client(port, n, args.slow_seconds, proof, stop)) for n in range(args.slow)]
+	tasks += [asyncio.create_task(fast_client(port, latencies, errors, stop)) for _ in range(args.fast)]
+	await asyncio.sleep(args.duration)
+	stop.set()
+	# Requests still in flight when the clock stops don't count.
+	completed = list(latencies)
+	for task in tasks:
+		task.cancel()
+	await asyncio.gather(*tasks, return_exceptions=True)
+	return completed, errors
+
+
+def percentile(values, pct):
+	ordered = sorted(values)
+	return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))] if ordered else float('nan')
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument('--workers', type=int, default=2)
+	parser.add_argument('--slow', type=int, default=50, help='concurrent slow uploaders')
+	parser.add_argument('--slow-seconds', type=float, default=5.0, help='time each upload takes to send')
+	parser.add_argument('--fast', type=int, default=20, help='concurrent list clients')
+	parser.add_argument('--duration', type=float, default=20.0)
+	args = parser.parse_args()
+
+	print(f"{'server':>6} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'errors':>7}")
+	for kind in ('wsgi', 'asgi'):
+		with tempfile.TemporaryDirectory() as tmp:
+			# Keep uploaded proofs out of the real MEDIA_ROOT.
+			with open(os.path.join(tmp, 'bench_settings.py'), 'w') as fh:
+				fh.write(f'from server.settings import *\nMEDIA_ROOT = {os.path.join(tmp, "media")!r}\n')
+			env = dict(
+				os.environ, DATABASE_URL=f'sqlite:///{tmp}/bench.sqlite3', DJANGO_DEBUG='false',
+				SECURE_SSL_REDIRECT='false', METRICS_DIR=f'{tmp}/metrics',
+				DJANGO_SETTINGS_MODULE='bench_settings', PYTHONPATH=os.pathsep.join(filter(None, (tmp, BACKEND_DIR, os.environ.get('PYTHONPATH')))),
+			)
+			env.pop('ASYNC_VIEWS', None)
+			prepare(env)
+			port = free_port()
+			process = start(kind, port, args.workers, env)
+			try:
+				latencies, errors = asyncio.run(load(port, args))
+			finally:
+				process.terminate()
+				process.wait()
+			print(
+				f'{kind:>6} {len(latencies) / args.duration:>8.1f} {percentile(latencies, 50) * 1000:>8.0f} '
+				f'{percentile(latencies, 99) * 1000:>8.0f} {len(errors):>7}',
+				flush=True,
+			)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,119 @@
+"""Compare the legacy in-memory XLSX export with the write-only streamed one.
+
+Seeds a throwaway SQLite database, then runs each export path in a forked
+child so peak RSS is measured per run:
+
+    python benchmarks/xlsx_export.py --rows 10000 100000 500000
+"""
+import argparse
+import datetime
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def setup_django(db_path):
+	sys.path.insert(0, BACKEND_DIR)
+	os.environ['DATABASE_URL'] = f'sqlite:///{db_path}'
+	os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'server.settings')
+	import django
+	django.setup()
+	from django.core.management import call_command
+	call_command('migrate', verbosity=0)
+
+
+def seed(rows):
+	from api.models import Workshop, WorkshopRegistration
+	ws = Workshop.objects.create(
+		title='Benchmark', date=datetime.date(2025, 1, 1), venue='Bench',
+		start_time=datetime.time(10), end_time=datetime.time(12), capacity=rows,
+	)
+	batch = 10000
+	for start in range(0, rows, batch):
+		WorkshopRegistration.objects.bulk_create([
+			WorkshopRegistration(
+				workshop=ws, name=f'User {i}', email=f'user{i}@example.com',
+				whatsapp='+910000000000', organization='Org', admin_notes='note',
+			)
+			for i in range(start, min(start + batch, rows))
+		])
+
+
+def legacy_export(queryset, path):
+	"""The pre-streaming admin path: materialize dicts, then a normal Workbook."""
+	from openpyxl import Workbook
+	rows = []
+	for r in queryset.select_related('workshop'):
+		rows.append({
+			"Workshop": r.workshop.title,
+			"Name": r.name,
+			"Email": r.email,
+			"WhatsApp": r.whatsapp,
+			"Organization": r.organization,
+			"Status": r.status,
+			"Admin Notes": r.admin_notes or '',
+			"Created At": r.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+		})
+	header = list(rows[0].keys())
+	wb = Workbook()
+	ws = wb.active
+	ws.title = 'Registrations'
+	ws.append(header)
+	for row in rows:
+		ws.append([row[h] for h in header])
+	wb.save(path)
+
+
+def streamed_export(queryset, path):
+	from api.exports import write_xlsx
+	with open(path, 'wb') as fh:
+		write_xlsx(queryset, fh)
+
+
+def _measure(name, rows, conn):
+	from api.models import WorkshopRegistration
+	queryset = WorkshopRegistration.objects.filter(id__lte=rows)
+	baseline = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	started = time.perf_counter()
+	with tempfile.NamedTemporaryFile(suffix='.xlsx') as out:
+		PATHS[name](queryset, out.name)
+	elapsed = time.perf_counter() - started
+	peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	conn.send((elapsed, (peak - baseline) / 1024))
+	conn.close()
+
+
+PATHS = {'legacy': legacy_export, 'streamed': streamed_export}
+
+
+def main():
+	parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+	parser.add_argument('--rows', type=int, nargs='+', default=[10000, 100000, 500000])
+	args = parser.parse_args()
+
+	with tempfile.TemporaryDirectory() as tmp:
+		setup_django(os.path.join(tmp, 'bench.sqlite3'))
+		print(f'Seeding {max(args.rows)} registrations...', flush=True)
+		seed(max(args.rows))
+		from django.db import connections
+		connections.close_all()
+
+		ctx = multiprocessing.get_context('fork')
+		print(f"{'rows':>8} {'path':>9} {'wall s':>8} {'peak RSS MiB':>13}")
+		for rows in args.rows:
+			for name in PATHS:
+				parent, child = ctx.Pipe()
+				proc = ctx.Process(target=_measure, args=(name, rows, child))
+				proc.start()
+				elapsed, rss = parent.recv()
+				proc.join()
+				print(f'{rows:>8} {name:>9} {elapsed:>8.2f} {rss:>13.1f}', flush=True)
+
+
+if __name__ == '__main__':
+	main()
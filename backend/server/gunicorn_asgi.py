@@ -0,0 +1,18 @@
+"""gunicorn config for serving the ASGI app with uvicorn workers.
+
+    gunicorn -c server/gunicorn_asgi.py
+
+Each worker runs an event loop, so clients that are slow to send a request
+body (multipart ``payment_proof`` uploads over bad connections) wait on the
+loop instead of occupying one of a fixed number of sync workers.
+"""
+import os
+
+# Must be set before the workers import settings.
+os.environ.setdefault("ASYNC_VIEWS", "true")
+
+wsgi_app = "server.asgi:application"
+worker_class = "uvicorn.workers.UvicornWorker"
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", "2"))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", "30"))
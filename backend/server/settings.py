@@ -7,6 +7,9 @@ Docs: https://docs.djangoproject.com/en/5.2/
 
 from pathlib import Path
 import os
+import tempfile
+
+from corsheaders.defaults import default_headers
 
 # -------------------------------
 # Helpers
@@ -68,8 +71,10 @@ INSTALLED_APPS = [
 
 # MIDDLEWARE order matters for CORS/WhiteNoise.
 MIDDLEWARE = [
+    "api.metrics.MetricsMiddleware",                  # /api/metrics; no-op unless METRICS_ENABLED
+    "api.timing.RequestTimingMiddleware",             # no-op unless REQUEST_TIMING
     "django.middleware.security.SecurityMiddleware",
-    "whitenoise.middleware.WhiteNoiseMiddleware",     # serving static files in prod
+    "api.static_files.StaticFilesMiddleware",         # WhiteNoise, async-capable for ASGI
     "corsheaders.middleware.CorsMiddleware",          # CHANGED: early for CORS headers
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -79,6 +84,27 @@ MIDDLEWARE = [
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
 
+# Per-request query count / DB time / Server-Timing (see api.timing). Off by
+# default; the middleware removes itself when disabled. Under ASGI the db figure
+# includes queries the async views run through sync_to_async.
+REQUEST_TIMING = get_bool("REQUEST_TIMING", False)
+SLOW_REQUEST_MS = int(os.environ.get("SLOW_REQUEST_MS", "500"))
+N_PLUS_ONE_THRESHOLD = int(os.environ.get("N_PLUS_ONE_THRESHOLD", "5"))
+
+# Prometheus metrics served at /api/metrics (see api.metrics). Each process
+# writes METRICS_DIR/<pid>-<start>.json; the directory must be shared by all workers
+# on one host (exited processes are detected by pid and folded into archive.json).
+METRICS_ENABLED = get_bool("METRICS_ENABLED", False)
+METRICS_DIR = Path(os.environ.get("METRICS_DIR", Path(tempfile.gettempdir()) / "superbloom-metrics"))
+METRICS_FLUSH_INTERVAL = float(os.environ.get("METRICS_FLUSH_INTERVAL", "5"))
+# Scrapes must send "Authorization: Bearer <token>". Required unless DEBUG:
+# without it /api/metrics answers 404.
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
+# Serve the public API from api.async_views; set by server/gunicorn_asgi.py.
+# Only worth it under ASGI: on WSGI every async view pays for an event loop.
+ASYNC_VIEWS = get_bool("ASYNC_VIEWS", False)
+
 ROOT_URLCONF = "server.urls"
 
 TEMPLATES = [
@@ -111,10 +137,51 @@ DATABASES = {
     "default": dj_database_url.config(
         env="DATABASE_URL",
         default=f"sqlite:///{BASE_DIR / 'db.sqlite3'}",  # fallback for dev
-        conn_max_age=600,  # persistent connections for prod
+        # Persistent connections for prod under WSGI. Under ASGI each request's
+        # ORM calls may land on a different thread, so connections are closed
+        # per request instead (Django's recommendation for async deployments).
+        conn_max_age=int(os.environ.get("DB_CONN_MAX_AGE", "0" if ASYNC_VIEWS else "600")),
     )
 }
 
+if DATABASES["default"]["ENGINE"] == "django.db.backends.sqlite3":
+    # File-backed test DB: the shared-cache in-memory default fails fast with
+    # "table is locked" instead of waiting, which breaks threaded tests.
+    DATABASES["default"]["TEST"] = {"NAME": str(BASE_DIR / "test_db.sqlite3")}
+
+# -------------------------------
+# Cache
+# -------------------------------
+# Serialized /api/workshops responses (and the admin stats) live in their own
+# alias so the TTL and size bound can be tuned independently. Signals
+# invalidate it by bumping version keys, so every worker process must see the
+# same cache: a per-process backend (locmem) would leave the other workers
+# serving stale seat counts until WORKSHOP_CACHE_TIMEOUT.
+# - REDIS_URL set: Redis (requires the `redis` package); needed when the app
+#   runs on more than one host.
+# - otherwise: a file-based cache in WORKSHOP_CACHE_LOCATION, shared by all
+#   workers on the host.
+# WORKSHOP_CACHE_BACKEND overrides either.
+REDIS_URL = os.environ.get("REDIS_URL", "")
+if REDIS_URL:
+    _workshop_cache_backend, _workshop_cache_location = "django.core.cache.backends.redis.RedisCache", REDIS_URL
+else:
+    _workshop_cache_backend = "django.core.cache.backends.filebased.FileBasedCache"
+    _workshop_cache_location = str(Path(tempfile.gettempdir()) / "superbloom-workshops-cache")
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "workshops": {
+        "BACKEND": os.environ.get("WORKSHOP_CACHE_BACKEND", _workshop_cache_backend),
+        "LOCATION": os.environ.get("WORKSHOP_CACHE_LOCATION", _workshop_cache_location),
+        "OPTIONS": {"MAX_ENTRIES": int(os.environ.get("WORKSHOP_CACHE_MAX_ENTRIES", "500"))},
+    },
+}
+WORKSHOP_CACHE_ALIAS = "workshops"
+WORKSHOP_CACHE_TIMEOUT = int(os.environ.get("WORKSHOP_CACHE_TIMEOUT", "60"))
+
 # -------------------------------
 # Password validation
 # -------------------------------
@@ -147,6 +214,63 @@ STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
 MEDIA_URL = "/media/"
 MEDIA_ROOT = BASE_DIR / "media"
 
+# How api.media.serve_media hands out uploads: "django" (in-process, sendfile
+# via gunicorn), "x-accel-redirect" (nginx) or "x-sendfile" (Apache/lighttpd).
+MEDIA_SERVE_MODE = os.environ.get("MEDIA_SERVE_MODE", "django")
+MEDIA_ACCEL_REDIRECT_PREFIX = os.environ.get("MEDIA_ACCEL_REDIRECT_PREFIX", "/protected-media/")
+MEDIA_CACHE_MAX_AGE = int(os.environ.get("MEDIA_CACHE_MAX_AGE", "3600"))
+# `manage.py gc_media` only deletes unreferenced uploads untouched this long (seconds).
+MEDIA_GC_GRACE = int(os.environ.get("MEDIA_GC_GRACE", str(24 * 3600)))
+
+# Payment proof previews generated by api.thumbnails (max edge in px per size).
+THUMBNAIL_SIZES = {"small": 200, "medium": 800}
+THUMBNAIL_FORMAT = os.environ.get("THUMBNAIL_FORMAT", "WEBP")
+THUMBNAIL_QUALITY = int(os.environ.get("THUMBNAIL_QUALITY", "80"))
+THUMBNAIL_WORKERS = int(os.environ.get("THUMBNAIL_WORKERS", "2"))
+THUMBNAIL_ASYNC = get_bool("THUMBNAIL_ASYNC", True)
+# Widths (px) of the srcset renditions served by the workshop API.
+RESPONSIVE_WIDTHS = (320, 640, 1280)
+# image_url/payment_qr point at the widest rendition up to this width.
+IMAGE_URL_WIDTH = int(os.environ.get("IMAGE_URL_WIDTH", "640"))
+# Largest payment proof accepted by the registration endpoint (see api.uploads).
+PAYMENT_PROOF_MAX_BYTES = int(os.environ.get("PAYMENT_PROOF_MAX_BYTES", str(5 * 1024 * 1024)))
+
+# Contact form ingest: "sync" inserts per request; "buffered" spools to
+# CONTACT_SPOOL_DIR and bulk-inserts in batches (see api.ingest). The spool
+# must be on a persistent disk shared by every instance: what a killed process
+# left there is only written by a later one.
+CONTACT_INGEST_MODE = os.environ.get("CONTACT_INGEST_MODE", "sync")
+CONTACT_SPOOL_DIR = Path(os.environ.get("CONTACT_SPOOL_DIR", BASE_DIR / "spool" / "contact"))
+CONTACT_BATCH_SIZE = int(os.environ.get("CONTACT_BATCH_SIZE", "100"))
+CONTACT_FLUSH_INTERVAL = float(os.environ.get("CONTACT_FLUSH_INTERVAL", "2"))
+CONTACT_INGEST_ASYNC = get_bool("CONTACT_INGEST_ASYNC", True)
+
+# Idempotency-Key support on registration/contact POSTs (see api.idempotency),
+# in seconds: how long a stored response is replayed, how long a request that
+# is still running holds its key, and how often each process deletes expired keys.
+IDEMPOTENCY_KEY_TTL = int(os.environ.get("IDEMPOTENCY_KEY_TTL", str(24 * 3600)))
+IDEMPOTENCY_LOCK_SECONDS = int(os.environ.get("IDEMPOTENCY_LOCK_SECONDS", "300"))
+IDEMPOTENCY_PURGE_INTERVAL = int(os.environ.get("IDEMPOTENCY_PURGE_INTERVAL", "300"))
+
+# Seat availability streams (see api.live), served with ASYNC_VIEWS only: under
+# WSGI the seat URLs return a single snapshot. The browser reconnects after
+# LIVE_STREAM_SECONDS. LIVE_POLL_INTERVAL (seconds, 0 to disable) is how often
+# each process checks for changes made by other workers.
+LIVE_STREAM_SECONDS = int(os.environ.get("LIVE_STREAM_SECONDS", "600"))
+LIVE_KEEPALIVE = float(os.environ.get("LIVE_KEEPALIVE", "15"))
+LIVE_POLL_INTERVAL = float(os.environ.get("LIVE_POLL_INTERVAL", "2"))
+
+# Admin export files written by `manage.py run_export_jobs`; not publicly served.
+# "filesystem" keeps them in EXPORTS_ROOT, which the worker and web process
+# must share; "database" stores them in the api_exportfile table instead, for
+# a worker running as its own service.
+EXPORTS_STORAGE = os.environ.get("EXPORTS_STORAGE", "filesystem")
+EXPORTS_ROOT = Path(os.environ.get("EXPORTS_ROOT", BASE_DIR / "exports"))
+# A running export whose worker hasn't reported for this long (seconds) is
+# requeued, or failed once it has been claimed EXPORT_JOB_MAX_ATTEMPTS times.
+EXPORT_JOB_STALE_SECONDS = int(os.environ.get("EXPORT_JOB_STALE_SECONDS", "600"))
+EXPORT_JOB_MAX_ATTEMPTS = int(os.environ.get("EXPORT_JOB_MAX_ATTEMPTS", "3"))
+
 # -------------------------------
 # CORS / CSRF
 # -------------------------------
@@ -162,6 +286,8 @@ _cors_origins = _split_env(
 )
 CORS_ALLOWED_ORIGINS = _cors_origins
 CORS_ALLOW_CREDENTIALS = True  # ok even if you use token auth
+CORS_ALLOW_HEADERS = (*default_headers, "idempotency-key")
+CORS_EXPOSE_HEADERS = ["Idempotent-Replayed"]
 
 # CSRF trusted origins must include full scheme+host
 _csrf_trusted = _split_env(
@@ -14,46 +14,27 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+import re
+
 from django.contrib import admin
-from django.urls import path, include
-from django.template.response import TemplateResponse
+from django.urls import path, include, re_path
 from django.conf import settings
-from django.conf.urls.static import static
 from django.http import HttpResponse
-from django.db.models import Count
-from api.models import Workshop, WorkshopRegistration
+from api.media import serve_media
+from api.admin import dashboard_view
 
 
 def home(_request):
 	return HttpResponse("Backend OK")
 
-def admin_dashboard(request):
-	stats = {
-		"workshops_total": Workshop.objects.count(),
-		"registrations_total": WorkshopRegistration.objects.count(),
-		"registrations_verified": WorkshopRegistration.objects.filter(status='verified').count(),
-		"registrations_pending": WorkshopRegistration.objects.filter(status='pending').count(),
-	}
-	by_workshop = (
-		Workshop.objects
-		.annotate(reg_count=Count('registrations'))
-		.values('id','title','status','date','reg_count')
-		.order_by('-date')[:20]
-	)
-	context = admin.site.each_context(request)
-	context.update({
-		"title": "Workshops Dashboard",
-		"stats": stats,
-		"by_workshop": list(by_workshop),
-	})
-	return TemplateResponse(request, 'admin/dashboard.html', context)
-
 urlpatterns = [
 	path('', home, name='home'),
-	path('admin/dashboard/', admin.site.admin_view(admin_dashboard), name='admin-dashboard'),
+	path('admin/dashboard/', admin.site.admin_view(dashboard_view), name='admin-dashboard'),
     path('admin/', admin.site.urls),
     path('api/', include('api.urls')),
 ]
 
-# Serve media files even in production when MEDIA_ROOT is present.
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+# Uploaded media, served by api.media in every environment (see MEDIA_SERVE_MODE).
+urlpatterns += [
+	re_path(r'^%s(?P<path>.+)$' % re.escape(settings.MEDIA_URL.lstrip('/')), serve_media, name='media'),
+]
@@ -8,19 +8,37 @@ export async function fetchHealth() {
 
 export { API_BASE }
 
+// The API is keyset-paginated; follow next_cursor until every page is in.
 export async function listWorkshops() {
-  const res = await fetch(`${API_BASE}/api/workshops`)
-  if (!res.ok) throw new Error('Failed to load workshops')
-  return res.json()
+  const items = []
+  let cursor = null
+  do {
+    const params = new URLSearchParams({ limit: '100' })
+    if (cursor) params.set('cursor', cursor)
+    const res = await fetch(`${API_BASE}/api/workshops?${params}`)
+    if (!res.ok) throw new Error('Failed to load workshops')
+    const data = await res.json()
+    items.push(...(data.items || []))
+    cursor = data.next_cursor
+  } while (cursor)
+  return { items }
+}
+
+// One key per submission, reused when that submission is retried, so the
+// backend can answer a retry with the original response.
+export function newIdempotencyKey() {
+  if (typeof crypto !== 'undefined' && crypto.randomUUID) return crypto.randomUUID()
+  return `${Date.now().toString(36)}-${Math.random().toString(36).slice(2)}`
 }
 
-export async function registerWorkshop(workshopId, payload) {
+export async function registerWorkshop(workshopId, payload, idempotencyKey) {
   const isFormData = typeof FormData !== 'undefined' && payload instanceof FormData
-  const options = { method: 'POST' }
+  const options = { method: 'POST', headers: {} }
+  if (idempotencyKey) options.headers['Idempotency-Key'] = idempotencyKey
   if (isFormData) {
     options.body = payload
   } else {
-    options.headers = { 'Content-Type': 'application/json' }
+    options.headers['Content-Type'] = 'application/json'
     options.body = JSON.stringify(payload)
   }
   const res = await fetch(`${API_BASE}/api/workshops/${workshopId}/register`, options)
@@ -1,11 +1,12 @@
 import { useRef, useState } from 'react'
-import { API_BASE } from '../lib/api'
+import { API_BASE, newIdempotencyKey } from '../lib/api'
 import { useToast } from '../components/Toast'
 
 const ContactPage = () => {
   const [submitting, setSubmitting] = useState(false)
   const toast = useToast()
   const inFlightRef = useRef(false)
+  const submitKeyRef = useRef(null)
 
   async function onSubmit(e) {
     e.preventDefault()
@@ -24,9 +25,10 @@ const ContactPage = () => {
         toast.error('Please fill required fields')
         return
       }
+      submitKeyRef.current ||= newIdempotencyKey()
       const res = await fetch(`${API_BASE}/api/contact`, {
         method: 'POST',
-        headers: { 'Content-Type': 'application/json' },
+        headers: { 'Content-Type': 'application/json', 'Idempotency-Key': submitKeyRef.current },
         body: JSON.stringify(payload)
       })
       if (!res.ok) {
@@ -35,6 +37,7 @@ const ContactPage = () => {
       }
       // optionally read response
       // const data = await res.json()
+      submitKeyRef.current = null
       toast.success("Thanks! We'll get back to you shortly.")
       e.currentTarget.reset()
     } catch (err) {
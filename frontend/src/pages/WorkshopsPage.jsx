@@ -1,5 +1,5 @@
 import { useEffect, useRef, useState } from 'react'
-import { listWorkshops, registerWorkshop } from '../lib/api'
+import { listWorkshops, newIdempotencyKey, registerWorkshop } from '../lib/api'
 import { useToast } from '../components/Toast'
 
 const WorkshopsPage = () => {
@@ -8,6 +8,7 @@ const WorkshopsPage = () => {
   const [workshops, setWorkshops] = useState([])
   const [activeWs, setActiveWs] = useState(null)
   const fileInputRef = useRef(null)
+  const registerKeyRef = useRef(null)
   const [fileLabel, setFileLabel] = useState('Click here to upload your screenshot')
 
   async function load() {
@@ -50,11 +51,18 @@ const WorkshopsPage = () => {
           <h2 className="text-3xl font-bold tracking-tighter mb-2">Upcoming Workshops</h2>
           {activeList.map((ws) => (
             <div key={ws.id} className="bg-[#111] border border-gray-800 rounded-2xl overflow-hidden md:flex">
-              <img
-                src={ws.image_url || "https://placehold.co/600x400/A855F7/0A0A0A?text=Workshop"}
-                alt={ws.title}
-                className="w-full md:w-1/3 object-cover"
-              />
+              <picture className="w-full md:w-1/3">
+                {ws.image_srcset?.webp && (
+                  <source type="image/webp" srcSet={ws.image_srcset.webp} sizes="(min-width: 768px) 33vw, 100vw" />
+                )}
+                <img
+                  src={ws.image_url || "https://placehold.co/600x400/A855F7/0A0A0A?text=Workshop"}
+                  srcSet={ws.image_srcset?.jpeg}
+                  sizes="(min-width: 768px) 33vw, 100vw"
+                  alt={ws.title}
+                  className="w-full h-full object-cover"
+                />
+              </picture>
               <div className="p-8 flex flex-col justify-between">
                 <div>
                   <h3 className="text-3xl font-bold">{ws.title}</h3>
@@ -92,7 +100,7 @@ const WorkshopsPage = () => {
                   className={`register-btn mt-8 w-full md:w-auto font-semibold py-3 px-8 rounded-full transition-opacity duration-300 ${
                     ws.is_sold_out ? 'bg-gray-600 cursor-not-allowed opacity-50' : 'gradient-bg text-white hover:opacity-90'
                   }`}
-                  onClick={() => { if (!ws.is_sold_out) { setActiveWs(ws); setModalOpen(true) } }}
+                  onClick={() => { if (!ws.is_sold_out) { setActiveWs(ws); registerKeyRef.current = null; setModalOpen(true) } }}
                   disabled={ws.is_sold_out}
                 >
                   {ws.is_sold_out ? 'Sold Out' : 'Register Now'}
@@ -140,8 +148,10 @@ const WorkshopsPage = () => {
                 onSubmit={async (e) => {
                   e.preventDefault()
                   const fd = new FormData(e.currentTarget)
+                  registerKeyRef.current ||= newIdempotencyKey()
                   try {
-                    await registerWorkshop(activeWs.id, fd)
+                    await registerWorkshop(activeWs.id, fd, registerKeyRef.current)
+                    registerKeyRef.current = null
                     toast.success('Registered!')
                     setModalOpen(false)
                     load()